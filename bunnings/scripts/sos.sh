@@ -25,3 +25,4 @@ cp /tmp/current_ranking.csv sos/current_ranking.csv
 
 psql rugby -f sos/predictions.sql > sos/predictions.txt
 cp /tmp/predictions.csv sos/predictions.csv
+python ../nrl/sos/skellam.py sos/predictions.csv
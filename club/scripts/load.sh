@@ -14,7 +14,12 @@ psql rugby -f schema/create_schema.sql
 mkdir /tmp/data
 cp csv/*.csv /tmp/data
 
-cat /tmp/data/*.csv >> /tmp/games.csv
+# Tag every game with its competition, the file name without the season
+# (premiership-2026.csv -> premiership)
+for f in /tmp/data/*.csv; do
+    competition=`basename $f .csv | sed -e 's/-[0-9]*$//'`
+    sed -e 's/\r$//' -e "s/$/,${competition}/" $f >> /tmp/games.csv
+done
 rpl "Stade Rochelais" "La Rochelle" /tmp/games.csv
 rpl "Newcastle Falcons" "Newcastle Red Bulls" /tmp/games.csv
 
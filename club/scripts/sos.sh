@@ -6,13 +6,14 @@ psql rugby -f sos/standardized_results.sql
 
 psql rugby -c "vacuum full verbose analyze club.results;"
 
-psql rugby -c "drop table if exists club._basic_factors;"
-psql rugby -c "drop table if exists club._parameter_levels;"
+# _basic_factors/_parameter_levels are kept: joint.py warm-starts from them
 
-R -f sos/lmer.R
-
-psql rugby -c "vacuum full verbose analyze club._parameter_levels;"
-psql rugby -c "vacuum full verbose analyze club._basic_factors;"
+#R -f sos/lmer.R
+# One fit over every competition (shared team effects, competition fixed
+# effects); also writes the per-competition club._competition_rankings
+python ../nrl/sos/joint.py --league club
+# joint.py COPYs _parameter_levels/_basic_factors into staging tables and
+# swaps them in already analyzed, so they need no vacuum here.
 
 psql rugby -f sos/normalize_factors.sql
 psql rugby -c "vacuum full verbose analyze club._factors;"
@@ -25,3 +26,10 @@ cp /tmp/current_ranking.csv sos/current_ranking.csv
 
 psql rugby -f sos/predictions.sql > sos/predictions.txt
 cp /tmp/predictions.csv sos/predictions.csv
+python ../nrl/sos/skellam.py sos/predictions.csv
+
+# Ladder and playoff chances of the league competitions (bonus points,
+# tries approximated from the sampled scores)
+for competition in premiership urc top14; do
+    python ../nrl/sos/season.py --league club --competition $competition
+done
@@ -5,10 +5,10 @@ select
 g.date::date as date,
 sf1.team_id as home,
 sf2.team_id as away,
-(exp(i.estimate)*sf1.offensive*o.exp_factor*sf2.defensive)::numeric(4,1) as e_home,
-(exp(i.estimate)*sf2.offensive*d.exp_factor*sf1.defensive)::numeric(4,1) as e_away,
-((exp(i.estimate)*sf1.offensive*o.exp_factor*sf2.defensive)-
-(exp(i.estimate)*sf2.offensive*d.exp_factor*sf1.defensive))::numeric(4,2) as e_d
+(exp(i.estimate+coalesce(c.estimate,0))*sf1.offensive*o.exp_factor*sf2.defensive)::numeric(4,1) as e_home,
+(exp(i.estimate+coalesce(c.estimate,0))*sf2.offensive*d.exp_factor*sf1.defensive)::numeric(4,1) as e_away,
+((exp(i.estimate+coalesce(c.estimate,0))*sf1.offensive*o.exp_factor*sf2.defensive)-
+(exp(i.estimate+coalesce(c.estimate,0))*sf2.offensive*d.exp_factor*sf1.defensive))::numeric(4,2) as e_d
 
 from club.games g
 join club._schedule_factors sf1
@@ -24,6 +24,11 @@ join club._factors d
 join club._basic_factors i
   on (i.factor)=('(Intercept)')
 
+-- The joint fit (joint.py) has a fixed effect per competition other than
+-- the reference one
+left join club._basic_factors c
+  on (c.factor)=('competition'||g.competition)
+
 where
     g.date::date >= CURRENT_DATE
 order by date asc, home asc;
@@ -35,10 +40,10 @@ select
 g.date::date as date,
 sf1.team_id as home,
 sf2.team_id as away,
-(exp(i.estimate)*sf1.offensive*o.exp_factor*sf2.defensive)::numeric(4,1) as e_home,
-(exp(i.estimate)*sf2.offensive*d.exp_factor*sf1.defensive)::numeric(4,1) as e_away,
-((exp(i.estimate)*sf1.offensive*o.exp_factor*sf2.defensive)-
-(exp(i.estimate)*sf2.offensive*d.exp_factor*sf1.defensive))::numeric(4,2) as e_d
+(exp(i.estimate+coalesce(c.estimate,0))*sf1.offensive*o.exp_factor*sf2.defensive)::numeric(4,1) as e_home,
+(exp(i.estimate+coalesce(c.estimate,0))*sf2.offensive*d.exp_factor*sf1.defensive)::numeric(4,1) as e_away,
+((exp(i.estimate+coalesce(c.estimate,0))*sf1.offensive*o.exp_factor*sf2.defensive)-
+(exp(i.estimate+coalesce(c.estimate,0))*sf2.offensive*d.exp_factor*sf1.defensive))::numeric(4,2) as e_d
 
 from club.games g
 join club._schedule_factors sf1
@@ -54,6 +59,11 @@ join club._factors d
 join club._basic_factors i
   on (i.factor)=('(Intercept)')
 
+-- The joint fit (joint.py) has a fixed effect per competition other than
+-- the reference one
+left join club._basic_factors c
+  on (c.factor)=('competition'||g.competition)
+
 where
     g.date::date >= CURRENT_DATE
 order by date asc, home asc
@@ -10,7 +10,8 @@ create table club.results (
 	opponent_name	      text,
 	field		      text,
 	team_score	      integer,
-	opponent_score	      integer
+	opponent_score	      integer,
+	competition	      text
 
 );
 
@@ -22,7 +23,8 @@ insert into club.results
  opponent_name,
  field,
  team_score,
- opponent_score)
+ opponent_score,
+ competition)
 (
 select
 game_id,
@@ -32,7 +34,8 @@ home_team,
 away_team,
 'offense_home',
 home_score,
-away_score
+away_score,
+competition
 
 from club.games
 
@@ -53,7 +56,8 @@ insert into club.results
  opponent_name,
  field,
  team_score,
- opponent_score)
+ opponent_score,
+ competition)
 (
 select
 game_id,
@@ -63,7 +67,8 @@ away_team,
 home_team,
 'defense_home',
 away_score,
-home_score
+home_score,
+competition
 
 from club.games
 
@@ -14,7 +14,8 @@ create table club.games (
 	home_1h			integer,
 	away_1h			integer,
 	home_2h			integer,
-	away_2h			integer
+	away_2h			integer,
+	competition		text
 );
 
 copy club.games from '/tmp/games.csv' with delimiter as ',' csv;
@@ -14,7 +14,11 @@ psql rugby -f schema/create_schema.sql
 mkdir /tmp/data
 cp csv/*.csv /tmp/data
 
-cat /tmp/data/*.csv >> /tmp/games.csv
+# club.games is shared with club/scripts/load.sh; tag the games as its
+# loader does, so club and Currie Cup fixtures are told apart
+for f in /tmp/data/*.csv; do
+    sed -e 's/\r$//' -e 's/$/,currie/' $f >> /tmp/games.csv
+done
 psql rugby -f loaders/load_games.sql
 
 rm /tmp/data/*.csv
@@ -25,3 +25,8 @@ cp /tmp/current_ranking.csv sos/current_ranking.csv
 
 psql rugby -f sos/predictions.sql > sos/predictions.txt
 cp /tmp/predictions.csv sos/predictions.csv
+python ../nrl/sos/skellam.py sos/predictions.csv
+
+# Ladder and playoff chances (bonus points, tries approximated from the
+# sampled scores), with the ratings of _basic_factors
+python ../nrl/sos/season.py --league currie_cup --from-db
@@ -6,14 +6,11 @@ psql rugby -f sos/standardized_results.sql
 
 psql rugby -c "vacuum full verbose analyze major_league.results;"
 
-psql rugby -c "drop table if exists major_league._zinb_basic_factors;"
-psql rugby -c "drop table if exists major_league._zinb_parameter_levels;"
+# _zinb_basic_factors/_zinb_parameter_levels are kept: zinb.py warm-starts
+# from them and replaces them when it writes the new fit
 
 #R -f sos/zinb.R
-R -f sos/zinb.R
-
-psql rugby -c "vacuum full verbose analyze major_league._zinb_parameter_levels;"
-psql rugby -c "vacuum full verbose analyze major_league._zinb_basic_factors;"
+python ../nrl/sos/zinb.py --league major_league
 
 psql rugby -f sos/zinb_normalize_factors.sql
 psql rugby -c "vacuum full verbose analyze major_league._zinb_factors;"
@@ -24,8 +21,11 @@ psql rugby -c "vacuum full verbose analyze major_league._zinb_schedule_factors;"
 psql rugby -f sos/zinb_current_ranking.sql > sos/zinb_current_ranking.txt
 cp /tmp/zinb_current_ranking.csv sos/zinb_current_ranking.csv
 
+# ZINB outcome probabilities with the fit's alpha and pz (saved by zinb.py)
 psql rugby -f sos/zinb_predict_monthly.sql > sos/zinb_predict_monthly.txt
 cp /tmp/zinb_predict_monthly.csv sos/zinb_predict_monthly.csv
+python ../nrl/sos/skellam.py --artifact models/major_league_zinb sos/zinb_predict_monthly.csv
 
 psql rugby -f sos/zinb_predict.sql > sos/zinb_predict.txt
 cp /tmp/zinb_predict.csv sos/zinb_predict.csv
+python ../nrl/sos/skellam.py --artifact models/major_league_zinb sos/zinb_predict.csv
@@ -1,28 +1,46 @@
 #!/bin/bash
 
-psql rugby -c "drop table if exists nrl.results;"
+# Each step's wall/CPU time is appended to diagnostics/profile.jsonl
+# (sos/profiling.py); lmer.py records its own stages in the same file
+stage() { python sos/profiling.py "$1" --league nrl -- "${@:2}"; }
 
-psql rugby -f sos/standardized_results.sql
+stage drop_results psql rugby -c "drop table if exists nrl.results;"
 
-psql rugby -c "vacuum full verbose analyze nrl.results;"
+stage standardized_results psql rugby -f sos/standardized_results.sql
 
-psql rugby -c "drop table if exists nrl._basic_factors;"
-psql rugby -c "drop table if exists nrl._parameter_levels;"
+stage vacuum_results psql rugby -c "vacuum full verbose analyze nrl.results;"
+
+# _basic_factors/_parameter_levels are kept: lmer.py warm-starts from them,
+# reuses them when the data hash is unchanged and replaces them otherwise
 
 #R -f sos/lmer.R
-python sos/lmer.py
+# lmer.py COPYs _parameter_levels/_basic_factors into staging tables and swaps
+# them in already analyzed, so they need no vacuum here.
+# RUGBY_COMPARE_GAME_EFFECTS=1 also fits the random and collapsed game-effect
+# modes cold and writes diagnostics/game_effects.csv (a manual diagnostic,
+# two extra fits)
+python sos/lmer.py --engine native ${RUGBY_COMPARE_GAME_EFFECTS:+--compare-game-effects}
+
+# Family comparison (Poisson, NB, ZINB, collapsed game effect) is not part
+# of the nightly run: nothing downstream reads its choice. Run it by hand:
+#   python sos/select_family.py --league nrl --families poisson nbinom zinb negmultinom
 
-psql rugby -c "vacuum full verbose analyze nrl._parameter_levels;"
-psql rugby -c "vacuum full verbose analyze nrl._basic_factors;"
+# Bootstrap quantiles of str/ofs/dfs/fitted_sos for lmer.py's Poisson fit
+# into nrl._factor_intervals (skipped when the data is unchanged)
+stage bootstrap python sos/bootstrap.py --league nrl --replicates 500
 
-psql rugby -f sos/normalize_factors.sql
-psql rugby -c "vacuum full verbose analyze nrl._factors;"
+stage normalize_factors psql rugby -f sos/normalize_factors.sql
+stage vacuum_factors psql rugby -c "vacuum full verbose analyze nrl._factors;"
 
-psql rugby -f sos/schedule_factors.sql
-psql rugby -c "vacuum full verbose analyze nrl._schedule_factors;"
+stage schedule_factors psql rugby -f sos/schedule_factors.sql
+stage vacuum_schedule_factors psql rugby -c "vacuum full verbose analyze nrl._schedule_factors;"
 
-psql rugby -f sos/current_ranking.sql > sos/current_ranking.txt
+stage current_ranking psql rugby -f sos/current_ranking.sql > sos/current_ranking.txt
 cp /tmp/current_ranking.csv sos/current_ranking.csv
 
-psql rugby -f sos/predictions.sql > sos/predictions.txt
+stage predictions psql rugby -f sos/predictions.sql > sos/predictions.txt
 cp /tmp/predictions.csv sos/predictions.csv
+stage skellam python sos/skellam.py sos/predictions.csv
+
+# Ladder and finals probabilities from 100k simulated rest-of-seasons
+stage season python sos/season.py --league nrl --seasons 100000
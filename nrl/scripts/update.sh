@@ -0,0 +1,14 @@
+#!/bin/bash
+
+# Between full refits (sos.sh): rebuild nrl.results from the freshly loaded
+# games, apply the new results to the ratings and refresh the predictions.
+# sos/online.py updates only the teams that played in nrl._schedule_factors.
+stage() { python sos/profiling.py "$1" --league nrl -- "${@:2}"; }
+
+stage standardized_results psql rugby -f sos/standardized_results.sql
+
+python sos/online.py --league nrl
+
+stage predictions psql rugby -f sos/predictions.sql > sos/predictions.txt
+cp /tmp/predictions.csv sos/predictions.csv
+stage skellam python sos/skellam.py sos/predictions.csv
@@ -0,0 +1,160 @@
+# -----------------------------------------------------------------------------
+# Compact Binary Model Artifact
+# -----------------------------------------------------------------------------
+# Every fit also saves what predictions.sql needs from _basic_factors,
+# _factors and _schedule_factors as a directory of raw NumPy .npy files
+# (one per array) under the league's directory:
+#
+#   <league directory>/models/<league>/        lmer.py (Poisson or collapsed)
+#   <league directory>/models/<league>_zinb/   zinb.py
+#
+#   version               ARTIFACT_VERSION; load_artifact() refuses others
+#   league, schema, family, formula, fitted_at, data_hash
+#   intercept             fixed intercept (log scale)
+#   field_levels, field   field levels and their effects (reference = 0)
+#   competition_levels, competition   the same for the competition effects
+#                         of a joint fit (joint.py; empty otherwise)
+#   team_code, team_name  the team dictionary (codes of <schema>._codes)
+#   offense, defense      per-team effects (log scale), aligned with team_code
+#   sd_offense, sd_defense, sd_game
+#   alpha, pz             NB size (inf for Poisson) and zero inflation (0)
+#
+# Strings are stored as fixed-width unicode arrays, so loading needs no
+# pickle, and load_artifact() memory-maps every file (np.load cannot map
+# the members of an .npz): a league's model loads in milliseconds without
+# the database. Teams are looked up by name (index) or by code
+# (index_codes):
+#
+#   model = load_artifact("nrl/models/nrl")
+#   model.expected(["Broncos"], ["Storm"], "offense_home")
+# -----------------------------------------------------------------------------
+
+import logging
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+ARTIFACT_VERSION = 2
+ARTIFACT_DIR = "models"
+
+
+def artifact_path(repo_root, league, league_name, suffix=""):
+    """<league directory>/models/<league><suffix> (a directory of .npy files)"""
+    return os.path.join(repo_root, league['directory'], ARTIFACT_DIR, f"{league_name}{suffix}")
+
+
+def build_artifact(combined, league_name, league, family, formula, field_levels=(), data_hash=None,
+                   competition_levels=()):
+    """Artifact arrays from a _basic_factors frame (as written by lmer.extract_results)."""
+    factor = combined['factor'].astype(str).to_numpy()
+    kind = combined['type'].astype(str).to_numpy()
+    level = combined['level'].astype(str).to_numpy()
+    estimate = combined['estimate'].to_numpy(np.float64)
+
+    fixed = dict(zip(factor[kind == 'fixed'], estimate[kind == 'fixed']))
+    levels, effects = {}, {}
+    for term, given in (('field', field_levels), ('competition', competition_levels)):
+        levels[term] = np.array(sorted(set(given) | {name[len(term):] for name in fixed if name.startswith(term)}),
+                                dtype=str)
+        effects[term] = np.array([fixed.get(f"{term}{name}", 0.0) for name in levels[term]], dtype=np.float64)
+
+    # Team dictionary: codes where the frame has them, else the names themselves
+    random = (kind == 'random') & np.isin(factor, ['offense', 'defense'])
+    if 'code' in combined.columns:
+        keys = combined['code'].to_numpy(dtype=np.float64, na_value=np.nan)
+        keys = np.where(np.isnan(keys), -1, keys).astype(np.int64)
+    else:
+        keys = np.full(len(combined), -1, dtype=np.int64)
+    teams = {}
+    for f, key, name, value in zip(factor[random], keys[random], level[random], estimate[random]):
+        entry = teams.setdefault(name, {'code': key, 'offense': 0.0, 'defense': 0.0})
+        entry[f] = value
+    names = np.array(sorted(teams, key=lambda n: (teams[n]['code'], n)), dtype=str)
+
+    structural = {(f, l): e for f, l, e in zip(factor[kind == 'structural'], level[kind == 'structural'],
+                                               estimate[kind == 'structural'])}
+    return {
+        'version': np.array(ARTIFACT_VERSION),
+        'league': np.array(league_name),
+        'schema': np.array(league['schema']),
+        'family': np.array(family),
+        'formula': np.array(formula),
+        'fitted_at': np.array(datetime.now().isoformat(timespec='seconds')),
+        'data_hash': np.array(data_hash or ""),
+        'intercept': np.array(fixed.get('(Intercept)', 0.0)),
+        'field_levels': levels['field'],
+        'field': effects['field'],
+        'competition_levels': levels['competition'],
+        'competition': effects['competition'],
+        'team_code': np.array([teams[n]['code'] for n in names], dtype=np.int64),
+        'team_name': names,
+        'offense': np.array([teams[n]['offense'] for n in names]),
+        'defense': np.array([teams[n]['defense'] for n in names]),
+        'sd_offense': np.array(structural.get(('offense', 'sd'), np.nan)),
+        'sd_defense': np.array(structural.get(('defense', 'sd'), np.nan)),
+        'sd_game': np.array(structural.get(('game_id', 'sd'), np.nan)),
+        'alpha': np.array(structural.get(('alpha', 'alpha'), np.inf)),
+        'pz': np.array(structural.get(('pz', 'pz'), 0.0)),
+    }
+
+
+def save_artifact(path, arrays):
+    """Write the arrays to the directory path (one .npy each), swapping out any previous artifact."""
+    path = path.rstrip(os.sep)
+    staging, previous = path + ".tmp", path + ".old"
+    for stale in (staging, previous):
+        shutil.rmtree(stale, ignore_errors=True)
+    os.makedirs(staging)
+    for name, value in arrays.items():
+        np.save(os.path.join(staging, f"{name}.npy"), value, allow_pickle=False)
+    if os.path.isdir(path):
+        os.rename(path, previous)
+    os.rename(staging, path)
+    shutil.rmtree(previous, ignore_errors=True)
+    logging.info(f"Saved model artifact {path} ({len(arrays['team_name'])} teams, family {arrays['family']}).")
+
+
+class ModelArtifact:
+    """A loaded artifact: the arrays as attributes plus team/field lookups and expected scores."""
+
+    def __init__(self, arrays):
+        for name, value in arrays.items():
+            setattr(self, name, value[()] if value.ndim == 0 else value)
+        self._by_name = {name: i for i, name in enumerate(self.team_name)}
+        self._by_code = {int(code): i for i, code in enumerate(self.team_code) if code >= 0}
+        self._field = dict(zip(self.field_levels, self.field))
+        self._competition = dict(zip(getattr(self, 'competition_levels', ()), getattr(self, 'competition', ())))
+
+    def index(self, teams):
+        """Row indices of teams given by name (KeyError for unknown teams)."""
+        return np.array([self._by_name[t] for t in teams], dtype=np.int64)
+
+    def index_codes(self, codes):
+        """Row indices of teams given by their <schema>._codes code (KeyError for unknown codes)."""
+        return np.array([self._by_code[int(c)] for c in codes], dtype=np.int64)
+
+    def competition_effect(self, competition):
+        """Log scoring level of a competition relative to the reference (0 if unknown or not fitted)."""
+        return self._competition.get(competition, 0.0)
+
+    def log_mean(self, teams, opponents, field, competition=None):
+        """Log of the NB/Poisson mean score of teams against opponents, by name (game effect 0)."""
+        effect = self._field.get(field, 0.0) if isinstance(field, str) else np.array([self._field.get(f, 0.0) for f in field])
+        return (self.intercept + effect + self.competition_effect(competition)
+                + self.offense[self.index(teams)] + self.defense[self.index(opponents)])
+
+    def expected(self, teams, opponents, field, competition=None):
+        """Expected scores as predictions.sql / zinb_predict.sql: (1 - pz) exp(log mean)."""
+        return (1.0 - self.pz) * np.exp(self.log_mean(teams, opponents, field, competition))
+
+
+def load_artifact(path, mmap=True):
+    """Load an artifact written by save_artifact() (memory-mapped unless mmap=False)."""
+    arrays = {os.path.splitext(name)[0]: np.load(os.path.join(path, name), mmap_mode='r' if mmap else None,
+                                                 allow_pickle=False)
+              for name in sorted(os.listdir(path)) if name.endswith(".npy")}
+    if int(arrays['version']) != ARTIFACT_VERSION:
+        raise ValueError(f"{path}: artifact version {int(arrays['version'])}, expected {ARTIFACT_VERSION}.")
+    return ModelArtifact(arrays)
@@ -0,0 +1,282 @@
+# -----------------------------------------------------------------------------
+# Rolling-Origin Backtest of the Score Predictions
+# -----------------------------------------------------------------------------
+# Replays a league's history the way the weekly pipeline would have seen it:
+# for every round, fit on the games before the round's first date and
+# predict the round's games as predictions.sql (Poisson) or zinb_predict.sql
+# (ZINB, e = (1 - pz) mu) do, i.e. with the game effect at zero.
+#
+#   * the sparse design (X, Z) is built once for the whole history; a cutoff
+#     only changes the weights, with rows outside its window at weight 0
+#   * each cutoff's window slides with it: the league's min_year..max_year
+#     (and reference_year) shifted to the round's season, weighted by the
+#     league's kernel as of the last training game (weights.py)
+#   * cutoffs are split into contiguous chunks run in a process pool; within
+#     a chunk each fit is warm-started from the previous round's fit
+#
+# A round is a run of game dates with gaps of at most ROUND_GAP_DAYS. Every
+# predicted game is scored on
+#
+#   log_loss   -log P(actual home win/draw/away win), with the outcome
+#              probabilities from the model's score distributions
+#   brier      sum over the three outcomes of (p - observed)^2
+#   mae        mean |e_home - home score| and |e_away - away score|
+#
+# The games and a per-season summary go to <league>/diagnostics/
+# backtest_<family>_games.csv and backtest_<family>_seasons.csv. The
+# database is only read.
+#
+#   python sos/backtest.py --league nrl --from-year 2010 --workers 8
+# -----------------------------------------------------------------------------
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import lmer
+from glmm import SparseGlmer
+from leagues import LEAGUES, REPO_ROOT, zinb_league
+from pool import make_pool, worker_state
+from weights import compute_weights
+
+OUTPUT_LOG_FILE = os.path.join(lmer.DIAGNOSTICS_DIR, "backtest.log")
+# A new round starts after a gap of more than this many days between game dates
+ROUND_GAP_DAYS = 2
+# Scores 0..SCORE_GRID are enumerated for the outcome probabilities
+SCORE_GRID = 250
+OUTCOMES = ['home', 'draw', 'away']
+
+
+def assign_rounds(game_dates, gap_days=ROUND_GAP_DAYS):
+    """Round number (from 0) of each row: consecutive dates closer than gap_days + 1 share a round."""
+    days = np.asarray(game_dates, dtype='datetime64[D]')
+    unique = np.unique(days)
+    starts = np.concatenate([[True], np.diff(unique).astype(np.int64) > gap_days])
+    return np.cumsum(starts)[np.searchsorted(unique, days)] - 1
+
+
+def window_league(league, season):
+    """The league's settings with the min/max/reference years slid to season."""
+    shift = season - league['max_year']
+    return dict(league, min_year=league['min_year'] + shift, max_year=season,
+                reference_year=league['reference_year'] + shift)
+
+
+def training_weights(frame, league, cutoff, season):
+    """Weights of the rows a fit at cutoff would have used (0 for all other rows)."""
+    window = window_league(league, season)
+    train = ((frame['game_date'].to_numpy('datetime64[D]') < cutoff)
+             & (frame['year'].to_numpy() >= window['min_year'])).nonzero()[0]
+    w = np.zeros(len(frame))
+    if len(train):
+        w[train] = compute_weights(frame.iloc[train], window)
+    # preprocess() drops non-positive weights
+    return np.maximum(w, 0.0)
+
+
+def outcome_probabilities(model, eta_home, eta_away):
+    """(n, 3) P(home win), P(draw), P(away win) from the fitted score distributions."""
+    family, extra = model._family, model._extra_working
+    grid = np.arange(SCORE_GRID + 1, dtype=np.float64)[None, :]
+    home = np.exp(family.loglik(grid, eta_home[:, None], extra))
+    away = np.exp(family.loglik(grid, eta_away[:, None], extra))
+    # P(away < k) for each home score k
+    below = np.cumsum(away, axis=1) - away
+    p = np.column_stack([
+        (home * below).sum(axis=1),
+        (home * away).sum(axis=1),
+        (away * (np.cumsum(home, axis=1) - home)).sum(axis=1),
+    ])
+    return p / p.sum(axis=1, keepdims=True)
+
+
+def predict_rows(model, rows):
+    """Linear predictor of rows with the game effect at zero (as predictions.sql)."""
+    b = np.repeat(model.theta, model.block_sizes) * model.u
+    bounds = np.concatenate([[0], np.cumsum(model.block_sizes)])
+    for i, name in enumerate(model.ranef_names):
+        if name == 'game_id':
+            b[bounds[i]:bounds[i + 1]] = 0.0
+    return model.X[rows] @ model.beta + model.Z[rows] @ b
+
+
+def score_round(model, frame, rows):
+    """Predictions and scores for the games in rows (two rows per game)."""
+    test = frame.iloc[rows]
+    # Home side first: the row that is not 'defense_home' (neutral games keep row order)
+    order = np.lexsort((rows, (test['field'].astype(str) == 'defense_home').to_numpy(), test['game_id'].cat.codes.to_numpy()))
+    rows, test = rows[order], test.iloc[order]
+    counts = test['game_id'].value_counts(sort=False).reindex(test['game_id'].unique())
+    complete = test['game_id'].isin(counts.index[counts == 2]).to_numpy()
+    rows, test = rows[complete], test.iloc[complete]
+    if not len(rows):
+        return None
+    home, away = slice(0, None, 2), slice(1, None, 2)
+
+    eta = predict_rows(model, rows)
+    mu = np.exp(eta)
+    if 'pz' in model.extra:
+        mu = (1.0 - model.extra['pz']) * mu
+    p = outcome_probabilities(model, eta[home], eta[away])
+
+    gs = test['gs'].to_numpy(np.float64)
+    outcome = np.select([gs[home] > gs[away], gs[home] == gs[away]], [0, 1], 2)
+    observed = np.eye(3)[outcome]
+    games = pd.DataFrame({
+        'season': test['year'].to_numpy()[home],
+        'game_date': test['game_date'].to_numpy()[home],
+        'game_id': test['game_id'].astype(str).to_numpy()[home],
+        'home': test['team'].astype(str).to_numpy()[home],
+        'away': test['team'].astype(str).to_numpy()[away],
+        'home_score': gs[home],
+        'away_score': gs[away],
+        'e_home': mu[home],
+        'e_away': mu[away],
+        'p_home': p[:, 0],
+        'p_draw': p[:, 1],
+        'p_away': p[:, 2],
+        'outcome': np.array(OUTCOMES)[outcome],
+        'log_loss': -np.log(np.maximum(p[np.arange(len(p)), outcome], 1e-15)),
+        'brier': ((p - observed) ** 2).sum(axis=1),
+    })
+    games['abs_error'] = 0.5 * (np.abs(games['e_home'] - games['home_score']) + np.abs(games['e_away'] - games['away_score']))
+    return games
+
+
+def _run_chunk(cutoffs):
+    """Fit and score a contiguous run of cutoffs, each warm-started from the one before."""
+    state = worker_state()
+    model, frame, league = state['model'], state['frame'], state['league']
+    rounds = frame['round'].to_numpy()
+    results, fits, start = [], [], None
+    for round_id, cutoff, season in cutoffs:
+        w = training_weights(frame, league, cutoff, season)
+        fit = {'round': round_id, 'season': season, 'cutoff': cutoff, 'rows': int(np.count_nonzero(w))}
+        # Every fixed-effect column needs training rows (e.g. no neutral games yet)
+        if not fit['rows'] or not np.all((model.X[w > 0] != 0).any(axis=0)):
+            fit['status'] = 'skipped'
+            fits.append(fit)
+            continue
+        started = time.perf_counter()
+        try:
+            model.fit(weights=w, start=start)
+        except Exception as e:
+            logging.warning(f"Cutoff {cutoff}: fit failed ({e}); next fit starts cold.")
+            fit['status'], start = 'failed', None
+            fits.append(fit)
+            continue
+        start = model.start_values()
+        fit.update(status='ok', evals=model.n_evals, fit_s=time.perf_counter() - started)
+        fits.append(fit)
+        games = score_round(model, frame, (rounds == round_id).nonzero()[0])
+        if games is not None:
+            games.insert(1, 'round', round_id)
+            results.append(games)
+    return results, fits
+
+
+def _summary(games):
+    return pd.Series({
+        'games': len(games),
+        'rounds': games['round'].nunique(),
+        'log_loss': games['log_loss'].mean(),
+        'brier': games['brier'].mean(),
+        'mae': games['abs_error'].mean(),
+        'mae_home': (games['e_home'] - games['home_score']).abs().mean(),
+        'mae_away': (games['e_away'] - games['away_score']).abs().mean(),
+        'home_wins': (games['outcome'] == 'home').mean(),
+        'p_home': games['p_home'].mean(),
+    })
+
+
+def season_report(games):
+    """Per-season means of the game scores, plus an 'all' row."""
+    seasons = [_summary(g).rename(str(season)) for season, g in games.groupby('season')]
+    report = pd.DataFrame(seasons + [_summary(games).rename('all')])
+    report = report.astype({'games': np.int64, 'rounds': np.int64})
+    return report.rename_axis('season').reset_index()
+
+
+def run_backtest(frame, league, family="poisson", from_year=None, workers=None):
+    """Fit every cutoff from from_year on; returns (games, fits) frames."""
+    frame = frame.reset_index(drop=True)
+    frame['round'] = assign_rounds(frame['game_date'])
+    reference = {'field': league['field_reference']} if league['field_reference'] else None
+    # The design for the whole history, shared by every cutoff
+    model = SparseGlmer(lmer.MODEL_FORMULA, data=frame, family=family, reference=reference)
+
+    first = frame.groupby('round').agg(cutoff=('game_date', 'min'), season=('year', 'min'))
+    first = first[first['season'] >= (from_year or league['min_year'])]
+    cutoffs = [(int(r), np.datetime64(c, 'D'), int(s)) for r, c, s in zip(first.index, first['cutoff'], first['season'])]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(cutoffs)))
+    chunks = [list(chunk) for chunk in np.array_split(np.arange(len(cutoffs)), workers) if len(chunk)]
+    logging.info(f"Backtesting {len(cutoffs)} round(s) of {len(frame)} rows in {len(chunks)} chunk(s) "
+                 f"on {workers} worker(s)...")
+
+    with make_pool(workers, model=model, frame=frame, league=league) as pool:
+        parts = list(pool.map(_run_chunk, [[cutoffs[i] for i in chunk] for chunk in chunks]))
+
+    games = [g for results, _ in parts for g in results]
+    games = pd.concat(games, ignore_index=True) if games else pd.DataFrame()
+    fits = pd.DataFrame([fit for _, chunk_fits in parts for fit in chunk_fits])
+    return games, fits
+
+
+def run(league_name, family="poisson", from_year=None, workers=None, weighting=None):
+    """Fetch, backtest and write the reports for one league; returns the season report."""
+    league = zinb_league(league_name) if family == "zinb" else dict(LEAGUES[league_name])
+    if weighting:
+        league['weighting'] = weighting
+    from_year = from_year or league['min_year']
+    # Enough history for the first scored season's window
+    fetch_league = dict(league, min_year=window_league(league, from_year)['min_year'])
+    diagnostics = os.path.join(REPO_ROOT, league['directory'], lmer.DIAGNOSTICS_DIR)
+    started = time.perf_counter()
+    logging.info(f"--- Starting {family} backtest for '{league_name}' from {from_year} ({datetime.now()}) ---")
+
+    engine = lmer.connect()
+    try:
+        sg = lmer.fetch_data(engine, fetch_league)
+    finally:
+        engine.dispose()
+    if sg.empty:
+        raise SystemExit("No data fetched from database.")
+
+    games, fits = run_backtest(sg, league, family, from_year, workers)
+    if games.empty:
+        raise SystemExit("No rounds could be scored.")
+    report = season_report(games)
+    ok = fits[fits['status'] == 'ok']
+    logging.info(f"{len(ok)} of {len(fits)} cutoff fits ok; {ok['evals'].mean():.0f} evaluations "
+                 f"and {ok['fit_s'].mean():.2f}s per fit on average")
+    logging.info("Backtest by season:\n" + report.round(4).to_string(index=False))
+
+    os.makedirs(diagnostics, exist_ok=True)
+    games.to_csv(os.path.join(diagnostics, f"backtest_{family}_games.csv"), index=False)
+    report.to_csv(os.path.join(diagnostics, f"backtest_{family}_seasons.csv"), index=False)
+    logging.info(f"--- Backtest finished in {time.perf_counter() - started:.1f}s ({datetime.now()}) ---")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rolling-origin backtest of the score predictions.")
+    parser.add_argument("--league", default=lmer.DB_SCHEMA, choices=sorted(LEAGUES))
+    parser.add_argument("--family", choices=["poisson", "zinb"], default="poisson")
+    parser.add_argument("--from-year", type=int, default=None,
+                        help="first season to score (default: the league's min_year)")
+    parser.add_argument("--workers", type=int, default=None, help="pool size (default: #cores)")
+    parser.add_argument("--weighting", default=None,
+                        help="recency weighting spec (default: the league's setting, see weights.py)")
+    args = parser.parse_args(argv)
+
+    lmer.setup_logging(OUTPUT_LOG_FILE)
+    run(args.league, args.family, args.from_year, args.workers, args.weighting)
+
+
+if __name__ == "__main__":
+    main()
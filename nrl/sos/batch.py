@@ -0,0 +1,123 @@
+# -----------------------------------------------------------------------------
+# Multi-League Batch Fitting
+# -----------------------------------------------------------------------------
+# Runs the lmer.py fetch -> fit -> write steps for several leagues in a
+# bounded process pool (pool.make_pool), so a refresh pays one Python
+# start-up per worker instead of one per league and keeps every core busy.
+# Leagues with a competition column (club) are fitted with joint.py instead,
+# as their sos.sh does; --engine and --no-cache don't apply to them.
+#
+#   python nrl/sos/batch.py nrl club super_rugby world_rugby --engine native
+#
+# The batch is standalone: the league scripts (<league>/scripts/sos.sh) still
+# fit with their own lmer.R/joint.py and don't call it. After a batch, run
+# the SQL steps of each sos.sh (normalize/schedule/ranking) per league.
+#
+# Leagues sharing a schema (club and currie_cup) would overwrite each
+# other's _basic_factors, _parameter_levels, _codes and _fit_cache, so a
+# batch may hold only one league per schema; the default batch leaves
+# currie_cup out (fit it on its own with lmer.py --league currie_cup).
+#
+# Each league logs to <league directory>/diagnostics/glmer_<league>.log
+# (club: joint.log); the per-league timings are logged at the end and
+# written to nrl/diagnostics/batch_timings.csv (the CPU/memory detail of
+# each stage is in the league's diagnostics/profile.jsonl).
+# -----------------------------------------------------------------------------
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import as_completed
+from datetime import datetime
+
+import pandas as pd
+
+import joint
+import lmer
+from leagues import LEAGUES, LEAGUE_GROUPS, REPO_ROOT, expand_leagues
+from pool import make_pool
+
+TIMINGS_FILE = os.path.join(REPO_ROOT, "nrl", "diagnostics", "batch_timings.csv")
+# Every league but currie_cup, whose schema is club's
+DEFAULT_LEAGUES = [name for name in LEAGUES if name != 'currie_cup']
+TIMING_COLUMNS = ['league', 'schema', 'status', 'rows', 'connect', 'preflight', 'fetch', 'hash', 'encode', 'preprocess', 'levels', 'fit', 'extract', 'write', 'total']
+
+
+def fit_league(league_name, engine_name, cold_start, use_cache, weighting=None):
+    """Worker: fit one league with its own DB connection and log file."""
+    league = LEAGUES[league_name]
+    if league.get('competition'):
+        lmer.setup_logging(os.path.join(REPO_ROOT, league['directory'], joint.OUTPUT_LOG_FILE))
+        return joint.run(league_name, cold_start, weighting)
+    log_file = os.path.join(REPO_ROOT, league['directory'], "diagnostics", f"glmer_{league_name}.log")
+    lmer.setup_logging(log_file)
+    return lmer.run(league_name, engine_name, cold_start, use_cache, weighting)
+
+
+def check_schemas(league_names):
+    """Raise ValueError if two of the leagues write the same schema."""
+    seen = {}
+    for name in league_names:
+        schema = LEAGUES[name]['schema']
+        if schema in seen:
+            raise ValueError(f"Leagues '{seen[schema]}' and '{name}' both write schema '{schema}'; "
+                             f"fit them in separate runs.")
+        seen[schema] = name
+
+
+def run_batch(league_names, engine_name="native", cold_start=False, workers=None, use_cache=True, weighting=None):
+    """Fit the leagues in a process pool; returns one report dict per league."""
+    check_schemas(league_names)
+    workers = workers or min(len(league_names), os.cpu_count() or 1)
+    logging.info(f"Fitting {len(league_names)} league(s) with {workers} worker(s): {league_names}")
+    reports = []
+    with make_pool(workers) as pool:
+        futures = {pool.submit(fit_league, name, engine_name, cold_start, use_cache, weighting): name
+                   for name in league_names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                report = {'league': name, 'schema': LEAGUES[name]['schema'], 'status': 'failed', 'error': str(e)}
+            logging.info(f"{name}: {report['status']} in {report.get('total', float('nan')):.1f}s")
+            reports.append(report)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit several leagues' GLMMs in a process pool.")
+    parser.add_argument("leagues", nargs="*", default=DEFAULT_LEAGUES,
+                        help=f"leagues or groups, one per schema (default: all but currie_cup). "
+                             f"Groups: {sorted(LEAGUE_GROUPS)}")
+    parser.add_argument("--engine", choices=["pymer4", "native"], default="native")
+    parser.add_argument("--cold-start", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--weighting", default=None,
+                        help="recency weighting spec for every league (see weights.py)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="pool size (default: min(#leagues, #cores))")
+    args = parser.parse_args(argv)
+    league_names = expand_leagues(args.leagues)
+    try:
+        check_schemas(league_names)
+    except ValueError as e:
+        parser.error(str(e))
+
+    lmer.setup_logging(os.path.join(os.path.dirname(TIMINGS_FILE), "batch.log"))
+    logging.info(f"--- Starting batch fit ({datetime.now()}) ---")
+    started = time.perf_counter()
+    reports = run_batch(league_names, args.engine, args.cold_start, args.workers, not args.no_cache, args.weighting)
+
+    timings = pd.DataFrame(reports).reindex(columns=TIMING_COLUMNS + ['error'])
+    timings = timings.sort_values('league').reset_index(drop=True)
+    logging.info("Per-league timings (seconds):\n" + timings[TIMING_COLUMNS].round(2).to_string(index=False))
+    timings.to_csv(TIMINGS_FILE, index=False)
+    logging.info(f"--- Batch finished in {time.perf_counter() - started:.1f}s ({datetime.now()}) ---")
+    if (timings['status'] == 'failed').any():
+        raise SystemExit(f"Failed leagues: {timings.loc[timings['status'] == 'failed', 'league'].tolist()}")
+
+
+if __name__ == "__main__":
+    main()
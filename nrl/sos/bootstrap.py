@@ -0,0 +1,245 @@
+# -----------------------------------------------------------------------------
+# Parametric Bootstrap Intervals for Team Ratings
+# -----------------------------------------------------------------------------
+# Fits a league's model with the native engine, then repeatedly
+#
+#   1. simulates every score from the fitted model, keeping the team
+#      offense/defense effects at their estimates and drawing new game
+#      effects from N(0, sd_game^2)
+#   2. refits the model to the simulated scores, warm-started from the
+#      main fit
+#   3. records each team's str, ofs and dfs on the log scale of
+#      current_ranking.sql (str = ofs - dfs) and fitted_sos, the
+#      unweighted mean str of the team's opponents over the fitted games.
+#      fitted_sos is not current_ranking.sql's sos: schedule_factors.sql
+#      averages over every game of its own window of results, not over the
+#      (usually shorter) fitting window
+#
+# The model is the Poisson GLMM lmer.py wrote to <schema>._basic_factors,
+# refitted warm from it. --family nbinom/zinb/negmultinom bootstraps another
+# family instead (ZINB as in zinb.py, warm from _zinb_basic_factors; the
+# others cold with select_family.py's formulas) and writes its own table.
+# Replicates run in a process pool, each with its own RNG stream spawned
+# from --seed, so results do not depend on the worker count. The quantiles
+# go to <schema>._factor_intervals (other families:
+# <schema>._<family>_factor_intervals):
+#
+#   team_code, team_id, parameter, estimate, std_error,
+#   q025, q050, q500, q950, q975, replicates, family, data_hash
+#
+# data_hash is fitcache.frame_hash of the modeling rows with the family,
+# formula and replicate count; a run whose hash matches the stored one ends
+# before the fit (--no-cache bootstraps again).
+#
+#   python sos/bootstrap.py --league nrl --replicates 500
+#   python sos/bootstrap.py --league club --family zinb
+# -----------------------------------------------------------------------------
+
+import argparse
+import copy
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import lmer
+import select_family
+import zinb
+from codes import CodeBook, recode
+from fitcache import frame_hash
+from glmm import FAMILIES, SparseGlmer
+from leagues import LEAGUES, REPO_ROOT, zinb_league
+from pool import make_pool, worker_state
+from profiling import PROFILE_FILE, StageProfiler
+from writer import copy_replace
+
+OUTPUT_LOG_FILE = os.path.join(lmer.DIAGNOSTICS_DIR, "bootstrap.log")
+RATINGS = ['str', 'ofs', 'dfs', 'fitted_sos']
+QUANTILES = [0.025, 0.05, 0.5, 0.95, 0.975]
+# Game effects are redrawn; team effects are held at their estimates
+RESAMPLE = ('game_id',)
+
+
+def rating_layout(model):
+    """Team codes and the row -> team/opponent indices used by ratings()."""
+    names = list(model.ranef_names)
+    teams = np.union1d(model.ranef_levels[names.index('team')], model.ranef_levels[names.index('opponent')])
+    data = model.data
+    return {
+        'teams': teams,
+        'team_rows': np.searchsorted(teams, data['team'].to_numpy()),
+        'opponent_rows': np.searchsorted(teams, data['opponent'].to_numpy()),
+    }
+
+
+def ratings(model, layout):
+    """(4, n_teams) array of str, ofs, dfs, fitted_sos for a fitted model."""
+    names = list(model.ranef_names)
+    teams = layout['teams']
+    ofs = model.ranef[names.index('team')]['(Intercept)'].reindex(teams).fillna(0.0).to_numpy()
+    dfs = model.ranef[names.index('opponent')]['(Intercept)'].reindex(teams).fillna(0.0).to_numpy()
+    strength = ofs - dfs
+    # Unweighted mean opponent strength over each team's fitted games
+    games = np.bincount(layout['team_rows'], minlength=len(teams))
+    sos = np.bincount(layout['team_rows'], weights=strength[layout['opponent_rows']], minlength=len(teams))
+    sos = np.divide(sos, games, out=np.full(len(teams), np.nan), where=games > 0)
+    return np.vstack([strength, ofs, dfs, sos])
+
+
+def _replicate(seed):
+    """Simulate, refit (warm) and return the ratings of one replicate."""
+    state = worker_state()
+    model = state['model']
+    rng = np.random.default_rng(seed)
+    replica = copy.copy(model)
+    replica.y = model.simulate(rng, RESAMPLE)
+    replica.fit(weights=model.w, start=state['start'])
+    return ratings(replica, state['layout'])
+
+
+def run_replicates(model, replicates, workers=None, seed=None):
+    """(replicates, 4, n_teams) array of bootstrap ratings."""
+    layout = rating_layout(model)
+    start = model.start_values()
+    # Redrawn effects have nothing to do with the old modes; start them at 0
+    start['ranef'] = {name: levels for name, levels in start['ranef'].items() if name not in RESAMPLE}
+    seeds = np.random.SeedSequence(seed).spawn(replicates)
+    workers = workers or os.cpu_count() or 1
+    logging.info(f"Running {replicates} bootstrap replicates on {workers} worker(s)...")
+    with make_pool(workers, model=model, start=start, layout=layout) as pool:
+        draws = list(pool.map(_replicate, seeds, chunksize=max(1, replicates // (4 * workers))))
+    return np.stack(draws), layout
+
+
+def summarize(model, draws, layout, codebook):
+    """Long _factor_intervals frame: one row per team and rating."""
+    estimate = ratings(model, layout)
+    quantiles = np.nanquantile(draws, QUANTILES, axis=0)
+    teams = layout['teams']
+    frames = []
+    for i, name in enumerate(RATINGS):
+        frame = pd.DataFrame({
+            'team_code': teams.astype(np.int64),
+            'team_id': codebook.names('team', teams),
+            'parameter': name,
+            'estimate': estimate[i],
+            'std_error': np.nanstd(draws[:, i, :], axis=0, ddof=1),
+        })
+        for q, values in zip(QUANTILES, quantiles[:, i, :]):
+            frame[f"q{int(round(q * 1000)):03d}"] = values
+        frame['replicates'] = int(np.isfinite(draws[:, i, :]).sum(axis=0).min())
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def stored_hash(engine, schema, table):
+    """data_hash of the stored intervals, or None."""
+    try:
+        stored = pd.read_sql_query(f"SELECT data_hash FROM {schema}.{table} LIMIT 1", engine)
+    except Exception as e:
+        logging.info(f"No stored intervals ({e.__class__.__name__}).")
+        return None
+    return stored['data_hash'].iloc[0] if len(stored) else None
+
+
+def intervals_table(family):
+    """_factor_intervals for lmer.py's Poisson fit, _<family>_factor_intervals otherwise."""
+    return '_factor_intervals' if family == "poisson" else f"_{family}_factor_intervals"
+
+
+def fit_family(g_filtered, family, engine, league, cold_start=False):
+    """Fit family on the lmer.py rows: lmer.fit_model for Poisson, a cold SparseGlmer fit otherwise."""
+    if family == "poisson":
+        # Warm from lmer.py's _basic_factors
+        return lmer.fit_model(g_filtered, "native", engine, league, cold_start)[0]
+    if family == "zinb":
+        return zinb.fit_zinb(g_filtered, engine, league, cold_start)
+    # The stored factors are lmer.py's Poisson fit, no start for the others
+    reference = {'field': league['field_reference']} if league['field_reference'] else None
+    model = SparseGlmer(select_family.family_formula(family), data=g_filtered, family=family, reference=reference)
+    model.fit(weights='w', verbose=True)
+    return model
+
+
+def run(league_name, family="poisson", replicates=500, workers=None, seed=None, cold_start=False, use_cache=True):
+    """Fit, bootstrap and write the intervals for one league; returns a report dict."""
+    league = zinb_league(league_name) if family == "zinb" else dict(LEAGUES[league_name])
+    schema = league['schema']
+    table = intervals_table(family)
+    report = {'league': league_name, 'schema': schema, 'status': 'failed', 'replicates': replicates,
+              'family': family}
+    engine = lmer.connect()
+    profiler = StageProfiler(os.path.join(REPO_ROOT, league['directory'], lmer.DIAGNOSTICS_DIR, PROFILE_FILE),
+                             league=league_name, schema=schema, engine=f"bootstrap_{family}")
+    started = time.perf_counter()
+    logging.info(f"--- Starting {family} bootstrap for '{league_name}' ({datetime.now()}) ---")
+    try:
+        with profiler.stage('fetch'):
+            sg = lmer.fetch_data(engine, league)
+        if sg.empty:
+            report['status'] = 'no data'
+            return report
+        with profiler.stage('encode'):
+            codebook = CodeBook.load(engine, schema)
+            recode(sg, codebook)
+            codebook.save(engine, schema)
+        with profiler.stage('preprocess'):
+            g_filtered = lmer.preprocess(sg)
+        data_hash = frame_hash(g_filtered, f"{family} {select_family.family_formula(family)}",
+                               {'table': table, 'replicates': replicates})
+        if use_cache and stored_hash(engine, schema, table) == data_hash:
+            logging.info(f"Intervals for this data already in {schema}.{table}; skipping the bootstrap.")
+            report['status'] = 'ok'
+            return report
+
+        with profiler.stage('fit'):
+            model = fit_family(g_filtered, family, engine, league, cold_start)
+
+        with profiler.stage('bootstrap'):
+            draws, layout = run_replicates(model, replicates, workers, seed)
+
+        with profiler.stage('write'):
+            intervals = summarize(model, draws, layout, codebook).assign(family=family, data_hash=data_hash)
+            copy_replace(engine, intervals, schema, table)
+        logging.info("Rating intervals (str):\n" + intervals[intervals['parameter'] == 'str']
+                     .sort_values('estimate', ascending=False).round(3).to_string(index=False))
+        report['status'] = 'ok'
+    except Exception as e:
+        logging.error(f"Bootstrap failed: {e}")
+        import traceback
+        logging.error(traceback.format_exc())
+        report['error'] = str(e)
+    finally:
+        engine.dispose()
+        report.update(profiler.timings)
+        profiler.close()
+        report['total'] = time.perf_counter() - started
+        logging.info(f"--- Bootstrap finished in {report['total']:.1f}s ({datetime.now()}) ---")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parametric bootstrap intervals for team ratings (_factor_intervals).")
+    parser.add_argument("--league", default=lmer.DB_SCHEMA, choices=sorted(LEAGUES))
+    parser.add_argument("--family", choices=sorted(FAMILIES), default="poisson",
+                        help="poisson: lmer.py's fit (_factor_intervals); others write _<family>_factor_intervals")
+    parser.add_argument("--replicates", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=None, help="pool size (default: #cores)")
+    parser.add_argument("--seed", type=int, default=None, help="RNG seed (default: fresh entropy)")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="fit the main model from scratch instead of from the stored factors")
+    parser.add_argument("--no-cache", action="store_true", help="bootstrap even if the data hash is unchanged")
+    args = parser.parse_args(argv)
+
+    lmer.setup_logging(OUTPUT_LOG_FILE)
+    report = run(args.league, args.family, args.replicates, args.workers, args.seed, args.cold_start,
+                 not args.no_cache)
+    if report['status'] != 'ok':
+        raise SystemExit(f"Bootstrap {report['status']}: {report.get('error', '')}")
+
+
+if __name__ == "__main__":
+    main()
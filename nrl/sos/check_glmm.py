@@ -0,0 +1,155 @@
+# -----------------------------------------------------------------------------
+# Deterministic Check of the Native Fitter on Simulated Data
+# -----------------------------------------------------------------------------
+# Simulates scores from the lmer.py model with known parameters,
+#
+#     gs ~ field + (1|team) + (1|opponent) + (1|game_id)
+#
+# TEAMS teams playing each other home and away ROUNDS times (fixed seed),
+# fits them with glmm.SparseGlmer and checks that it recovers the truth:
+#
+#   fixed effects      |estimate - true| <= FIXED_SE * SE
+#   sds                |estimate - true| <= SD_TOLERANCE * true
+#   team effects       correlation with the true effects >= MIN_CORRELATION
+#   logLik             the Laplace log-likelihood at the estimates is at
+#                      least the one at the true parameters (the optimizer
+#                      found a maximum at least as high as the truth)
+#
+# --check replication fits the same data the way lmer.R used to (each row
+# replicated w times, weights=w) and the way it does now (one row, weight
+# w^2), with w of 1 or 2 per game, and checks that the fixed effects, sds,
+# random effects and logLik agree to REPLICATION_TOLERANCE: every copy of a
+# row shares its game effect, so the two likelihoods are the same function
+# and only the optimizer's stopping point (L-BFGS-B's default tolerance,
+# which leaves the sds within about 1e-4) can tell the fits apart.
+# compare_weights.R does the same with glmer.
+#
+# The tolerances allow for sampling error, not for fitter error: with a
+# fixed seed the data and the fit are the same on every run, so a failure
+# means the fitter changed. Needs only NumPy/SciPy/pandas (no database,
+# no R); compare_glmer.py checks the fitter against glmer on real data.
+#
+#   python sos/check_glmm.py
+#   python sos/check_glmm.py --check replication
+# -----------------------------------------------------------------------------
+
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+from glmm import SparseGlmer
+
+FORMULA = "gs ~ field + (1|team) + (1|opponent) + (1|game_id)"
+TEAMS = 20
+ROUNDS = 8
+SEED = 20240601
+TRUTH = {
+    'beta': {'(Intercept)': np.log(20.0), 'fieldoffense_home': 0.08},
+    'sd': {'team': 0.25, 'opponent': 0.20, 'game_id': 0.15},
+}
+FIXED_SE = 3.0
+SD_TOLERANCE = 0.35
+MIN_CORRELATION = 0.9
+REPLICATION_TOLERANCE = 1e-3
+CHECKS = ['recovery', 'replication']
+
+
+def simulate(seed=SEED, teams=TEAMS, rounds=ROUNDS, truth=TRUTH):
+    """(two rows per game frame, true team effects) drawn from the model with the true parameters."""
+    rng = np.random.default_rng(seed)
+    offense = rng.normal(0.0, truth['sd']['team'], teams)
+    defense = rng.normal(0.0, truth['sd']['opponent'], teams)
+    home, away = np.nonzero(~np.eye(teams, dtype=bool))
+    home, away = np.tile(home, rounds), np.tile(away, rounds)
+    n_games = len(home)
+    game = rng.normal(0.0, truth['sd']['game_id'], n_games)
+    beta = truth['beta']
+    rows = []
+    for team, opponent, field, effect in [(home, away, 'offense_home', beta['fieldoffense_home']),
+                                          (away, home, 'defense_home', 0.0)]:
+        eta = beta['(Intercept)'] + effect + offense[team] + defense[opponent] + game
+        rows.append(pd.DataFrame({'game_id': np.arange(n_games), 'team': team, 'opponent': opponent,
+                                  'field': field, 'gs': rng.poisson(np.exp(eta)).astype(np.float64)}))
+    frame = pd.concat(rows, ignore_index=True)
+    for column in ['game_id', 'team', 'opponent', 'field']:
+        frame[column] = frame[column].astype('category')
+    frame['w'] = 1.0
+    return frame, {'team': offense, 'opponent': defense}
+
+
+def check_recovery(seed=SEED):
+    """Fit the simulated data; returns (checks frame, model)."""
+    frame, effects = simulate(seed)
+    model = SparseGlmer(FORMULA, data=frame, reference={'field': 'defense_home'})
+    model.fit(weights='w')
+
+    checks = []
+    for name, true in TRUTH['beta'].items():
+        estimate, se = model.coefs.loc[name, 'Estimate'], model.coefs.loc[name, 'SE']
+        checks.append({'check': f"fixed {name}", 'true': true, 'estimate': estimate,
+                       'tolerance': FIXED_SE * se, 'passed': abs(estimate - true) <= FIXED_SE * se})
+    sds = dict(zip(model.ranef_names, model.theta))
+    for name, true in TRUTH['sd'].items():
+        checks.append({'check': f"sd {name}", 'true': true, 'estimate': sds[name],
+                       'tolerance': SD_TOLERANCE * true, 'passed': abs(sds[name] - true) <= SD_TOLERANCE * true})
+    for name, true in effects.items():
+        fitted = model.ranef[model.ranef_names.index(name)]['(Intercept)'].reindex(np.arange(TEAMS)).to_numpy()
+        correlation = np.corrcoef(fitted, true)[0, 1]
+        checks.append({'check': f"correlation {name}", 'true': 1.0, 'estimate': correlation,
+                       'tolerance': 1.0 - MIN_CORRELATION, 'passed': correlation >= MIN_CORRELATION})
+    # Laplace log-likelihood at the true parameters (modes found by PIRLS)
+    theta = np.array([TRUTH['sd'][name] for name in model.ranef_names])
+    beta = np.array([TRUTH['beta'][name] for name in model.x_names])
+    at_truth = -0.5 * model._pirls(theta, beta, np.zeros(model.Z.shape[1]), False)[0]
+    checks.append({'check': "logLik - logLik(truth)", 'true': 0.0, 'estimate': model.logLike - at_truth,
+                   'tolerance': 0.0, 'passed': model.logLike >= at_truth - 1e-6})
+    return pd.DataFrame(checks), model
+
+
+def check_replication(seed=SEED):
+    """Fit replicated rows (weights w) and single rows (weights w^2); returns (checks frame, model)."""
+    frame, _ = simulate(seed)
+    rng = np.random.default_rng(seed + 1)
+    w = rng.integers(1, 3, frame['game_id'].cat.categories.size)[frame['game_id'].cat.codes.to_numpy()]
+    replicated = frame.iloc[np.repeat(np.arange(len(frame)), w)].assign(w=np.repeat(w, w).astype(np.float64))
+    weighted = frame.assign(w=(w ** 2).astype(np.float64))
+    models = {}
+    for name, data in [('replicated', replicated), ('weighted', weighted)]:
+        models[name] = SparseGlmer(FORMULA, data=data, reference={'field': 'defense_home'})
+        models[name].fit(weights='w')
+    old, new = models['replicated'], models['weighted']
+
+    differences = {
+        'fixed effects': np.abs(old.beta - new.beta).max(),
+        'sds': np.abs(old.theta - new.theta).max(),
+        'random effects': max(np.abs(a['(Intercept)'] - b['(Intercept)'].reindex(a.index)).max()
+                              for a, b in zip(old.ranef, new.ranef)),
+        'logLik (relative)': abs(old.logLike - new.logLike) / abs(old.logLike),
+    }
+    checks = pd.DataFrame([{'check': f"max |replicated - weighted| {name}", 'true': 0.0, 'estimate': value,
+                            'tolerance': REPLICATION_TOLERANCE, 'passed': value <= REPLICATION_TOLERANCE}
+                           for name, value in differences.items()])
+    logging.info(f"replicated: {len(old.y)} rows, logLik {old.logLike:.3f}; "
+                 f"weighted: {len(new.y)} rows, logLik {new.logLike:.3f}")
+    return checks, new
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check SparseGlmer against simulated data with known parameters.")
+    parser.add_argument("--check", choices=CHECKS, default="recovery",
+                        help="recovery: known parameters; replication: replicated rows vs w^2 weights")
+    parser.add_argument("--seed", type=int, default=SEED)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    checks, model = (check_recovery if args.check == 'recovery' else check_replication)(args.seed)
+    logging.info(f"{len(model.y)} rows, logLik {model.logLike:.3f}, {model.n_evals} evaluations")
+    logging.info(f"Check '{args.check}':\n" + checks.to_string(index=False))
+    if not checks['passed'].all():
+        raise SystemExit(f"Failed: {checks.loc[~checks['passed'], 'check'].tolist()}")
+
+
+if __name__ == "__main__":
+    main()
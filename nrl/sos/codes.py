@@ -0,0 +1,103 @@
+# -----------------------------------------------------------------------------
+# Stable Integer Codes for Teams and Games
+# -----------------------------------------------------------------------------
+# The fit and the factor tables key random effects on integer codes instead
+# of text levels:
+#
+#   team, opponent  codes from the per-schema dictionary <schema>._codes
+#                   (domain, code, name); offense and defense share the
+#                   'team' domain, so a team has one code on both sides
+#   game_id         already an integer key in <schema>.results; used as is
+#
+# Codes are never reassigned: names seen for the first time get the next
+# free codes (in sorted order) and the dictionary is rewritten. Only the
+# unique levels are looked up, never the per-row values.
+# -----------------------------------------------------------------------------
+
+import logging
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+from writer import copy_replace
+
+CODES_TABLE = '_codes'
+
+# Grouping column -> code domain
+CODE_DOMAINS = {'team': 'team', 'opponent': 'team'}
+# Grouping columns whose values are already integer keys
+INTEGER_KEYS = ['game_id']
+
+
+class CodeBook:
+    """name <-> code dictionaries per domain, persisted in <schema>._codes."""
+
+    def __init__(self, entries=None):
+        self.codes = {}
+        self.dirty = False
+        if entries is not None:
+            for domain, rows in entries.groupby('domain'):
+                self.codes[domain] = dict(zip(rows['name'].astype(str), rows['code'].astype(np.int64)))
+
+    @classmethod
+    def load(cls, engine, schema):
+        """Read the dictionary (empty if the table does not exist yet)."""
+        with engine.connect() as connection:
+            exists = connection.execute(sqlalchemy.text("SELECT to_regclass(:t) IS NOT NULL"),
+                                        {'t': f"{schema}.{CODES_TABLE}"}).scalar()
+        if not exists:
+            logging.info(f"No {schema}.{CODES_TABLE} yet; codes start at 1.")
+            return cls()
+        return cls(pd.read_sql_query(f"SELECT domain, code, name FROM {schema}.{CODES_TABLE}", engine))
+
+    def encode(self, domain, names):
+        """Codes for unique names, assigning new codes to names not seen before."""
+        mapping = self.codes.setdefault(domain, {})
+        names = [str(name) for name in names]
+        new = sorted(set(names).difference(mapping))
+        if new:
+            start = max(mapping.values(), default=0) + 1
+            mapping.update(zip(new, range(start, start + len(new))))
+            self.dirty = True
+            logging.info(f"Assigned {len(new)} new '{domain}' code(s) starting at {start}.")
+        return np.array([mapping[name] for name in names], dtype=np.int64)
+
+    def names(self, domain, codes):
+        """Names for codes (object array)."""
+        inverse = {code: name for name, code in self.codes.get(domain, {}).items()}
+        return np.array([inverse.get(int(code)) for code in codes], dtype=object)
+
+    def level_names(self, column, codes):
+        """Display names for a grouping column's codes (game ids are their own names)."""
+        if column in CODE_DOMAINS:
+            return self.names(CODE_DOMAINS[column], codes)
+        return np.asarray(codes).astype(str).astype(object)
+
+    def save(self, engine, schema):
+        """Rewrite <schema>._codes if codes were added."""
+        if not self.dirty:
+            return
+        frame = pd.DataFrame(
+            [(domain, code, name) for domain, mapping in self.codes.items() for name, code in mapping.items()],
+            columns=['domain', 'code', 'name']).sort_values(['domain', 'code'], ignore_index=True)
+        copy_replace(engine, frame, schema, CODES_TABLE)
+        self.dirty = False
+
+
+def recode(frame, codebook):
+    """
+    Replace the team/opponent/game_id categories of frame (in place) by their
+    integer codes. Only the categories change; the per-row codes are reused.
+    """
+    for column in list(CODE_DOMAINS) + INTEGER_KEYS:
+        if column not in frame.columns:
+            continue
+        cat = frame[column].cat
+        if column in CODE_DOMAINS:
+            keys = codebook.encode(CODE_DOMAINS[column], cat.categories)
+        else:
+            keys = pd.to_numeric(np.asarray(cat.categories)).astype(np.int64)
+        coded = pd.Categorical.from_codes(cat.codes, categories=pd.Index(keys))
+        frame[column] = coded.reorder_categories(np.sort(keys))
+    return frame
@@ -0,0 +1,137 @@
+# -----------------------------------------------------------------------------
+# Native Fitter vs glmer
+# -----------------------------------------------------------------------------
+# Fits one league's modeling rows with glmm.SparseGlmer (cold, as
+# lmer.py --engine native --cold-start) and compares the estimates with
+# lme4's glmer on the same rows:
+#
+#   --reference pymer4   glmer through pymer4 in this process (R + lme4)
+#   --reference stored   the <schema>._basic_factors written by the league's
+#                        sos/lmer.R (run `R -f sos/lmer.R` first; lmer.R has
+#                        no sd rows, so only the effects are compared). The
+#                        weights must match lmer.R's w^2: 'season_squared',
+#                        see --weighting
+#
+# Every fixed effect, every random-effect sd and every random effect is
+# compared; a difference above the tolerance fails the run:
+#
+#   fixed and random effects   |native - glmer| <= EFFECT_TOLERANCE (log scale)
+#   sd                         |native - glmer| <= SD_TOLERANCE * glmer sd
+#
+# glmer stops its bobyqa/Nelder-Mead at a relative deviance change of about
+# 1e-7, which moves the estimates in the third or fourth decimal, hence
+# 2e-3 (0.2% on the scoring rate) rather than machine precision.
+#
+# diagnostics/glmer_comparison.csv gets the fixed effects, the sds and
+# SAMPLE_LEVELS random effects per factor; the log has the largest
+# difference and the correlation of each factor's effects. Nothing is
+# written to the database.
+#
+#   python sos/compare_glmer.py --league nrl
+#   python sos/compare_glmer.py --league club --reference stored
+# -----------------------------------------------------------------------------
+
+import argparse
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import lmer
+from codes import CodeBook, recode
+from leagues import LEAGUES, REPO_ROOT
+
+OUTPUT_LOG_FILE = os.path.join(lmer.DIAGNOSTICS_DIR, "compare_glmer.log")
+COMPARISON_FILE = "glmer_comparison.csv"
+EFFECT_TOLERANCE = 2e-3
+SD_TOLERANCE = 0.02
+SAMPLE_LEVELS = 10
+REFERENCES = ['pymer4', 'stored']
+
+
+def estimates(combined):
+    """(factor, type, level) -> estimate for the fixed, random and sd rows of a _basic_factors frame."""
+    rows = combined[combined['type'].isin(['fixed', 'random'])
+                    | ((combined['type'] == 'structural') & (combined['level'] == 'sd'))]
+    keys = [rows[column].astype(str) for column in ['factor', 'type', 'level']]
+    return pd.Series(rows['estimate'].to_numpy(np.float64), index=pd.MultiIndex.from_arrays(keys, names=['factor', 'type', 'level']))
+
+
+def compare(native, reference):
+    """Side-by-side estimates with the tolerance each difference is held to."""
+    frame = pd.concat([native.rename('native'), reference.rename('glmer')], axis=1, join='inner').reset_index()
+    frame['difference'] = frame['native'] - frame['glmer']
+    sd = frame['level'] == 'sd'
+    frame['tolerance'] = np.where(sd, SD_TOLERANCE * frame['glmer'].abs(), EFFECT_TOLERANCE)
+    frame['within'] = frame['difference'].abs() <= frame['tolerance']
+    missing = native.index.symmetric_difference(reference.index)
+    if len(missing):
+        logging.warning(f"{len(missing)} estimate(s) only in one fit, e.g. {list(missing[:5])}")
+    return frame
+
+
+def summarize(frame, rng):
+    """Log per-factor agreement; returns the rows for the CSV (random effects sampled)."""
+    for (factor, kind), rows in frame.groupby(['factor', 'type']):
+        logging.info(f"{factor} ({kind}): {len(rows)} estimate(s), max |difference| {rows['difference'].abs().max():.2e}, "
+                     f"correlation {rows['native'].corr(rows['glmer']) if len(rows) > 1 else np.nan:.6f}, "
+                     f"{(~rows['within']).sum()} outside tolerance")
+    random = frame[frame['type'] == 'random']
+    sample = random.groupby('factor', group_keys=False).apply(
+        lambda rows: rows.iloc[np.sort(rng.choice(len(rows), min(len(rows), SAMPLE_LEVELS), replace=False))])
+    return pd.concat([frame[frame['type'] != 'random'], sample, frame[~frame['within']]]).drop_duplicates(
+        subset=['factor', 'type', 'level'])
+
+
+def run(league_name, reference='pymer4', weighting=None, seed=0):
+    """Fit natively and against glmer; returns the full comparison frame."""
+    league = dict(LEAGUES[league_name])
+    if weighting:
+        league['weighting'] = weighting
+    schema = league['schema']
+    engine = lmer.connect()
+    try:
+        sg = lmer.fetch_data(engine, league)
+        if sg.empty:
+            raise ValueError("Query returned no data.")
+        codebook = CodeBook.load(engine, schema)
+        recode(sg, codebook)
+        g_filtered = lmer.preprocess(sg)
+
+        if reference == 'stored':
+            glmer = pd.read_sql_query(f"SELECT factor, type, level, estimate FROM {schema}._basic_factors", engine)
+        else:
+            model, _ = lmer.fit_model(g_filtered, 'pymer4', engine, league)
+            glmer = lmer.extract_results(model, codebook=codebook)
+        native, cold_evals = lmer.fit_model(g_filtered, 'native', engine, league, cold_start=True)
+        frame = compare(estimates(lmer.extract_results(native, cold_evals, codebook)), estimates(glmer))
+    finally:
+        engine.dispose()
+
+    path = os.path.join(REPO_ROOT, league['directory'], lmer.DIAGNOSTICS_DIR, COMPARISON_FILE)
+    summarize(frame, np.random.default_rng(seed)).to_csv(path, index=False)
+    logging.info(f"Wrote {path}")
+    return frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the native GLMM fit with lme4's glmer.")
+    parser.add_argument("--league", default=lmer.DB_SCHEMA, choices=sorted(LEAGUES))
+    parser.add_argument("--reference", choices=REFERENCES, default="pymer4",
+                        help="pymer4 (glmer via rpy2) or stored (the lmer.R _basic_factors)")
+    parser.add_argument("--weighting", default=None,
+                        help="recency weighting spec (default: the league's setting, see weights.py)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random-effect sample in the CSV")
+    args = parser.parse_args(argv)
+
+    lmer.setup_logging(OUTPUT_LOG_FILE)
+    frame = run(args.league, args.reference, args.weighting, args.seed)
+    outside = int((~frame['within']).sum())
+    if outside:
+        raise SystemExit(f"{outside} of {len(frame)} estimate(s) differ from glmer by more than the tolerance.")
+    logging.info(f"All {len(frame)} estimates within tolerance of glmer.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# -----------------------------------------------------------------------------
+# Streaming Fetch into Integer-Coded Columns
+# -----------------------------------------------------------------------------
+# read_sql_query materializes the whole result as Python objects, builds an
+# object DataFrame and leaves the caller to cast IDs to str and then to
+# category, with a full copy at each step. stream_frame() instead reads the
+# result through a server-side cursor in CHUNK_ROWS batches and appends each
+# batch straight onto per-column arrays:
+#
+#   * categorical columns (game_id, team, opponent, field) become int32 codes
+#     against a dictionary that grows as new values arrive; at the end the
+#     levels are sorted (R's as.factor order) and the codes remapped once
+#   * numeric columns become float64/int64 arrays, date columns datetime64[D]
+#
+# Every chunk of a column is cast to the column's declared dtype (the
+# dtypes argument) before the chunks are concatenated, so a chunk whose
+# values are all NULL (e.g. no game_date) still arrives as NaT/NaN of the
+# right dtype. Undeclared columns are inferred per chunk, and a date column
+# with all-NULL chunks is still concatenated as datetime64[D].
+#
+# Only one batch of row tuples is alive at a time, so peak memory stays near
+# the size of the final coded frame.
+# -----------------------------------------------------------------------------
+
+import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+# Rows per server-side cursor batch
+CHUNK_ROWS = 50_000
+
+
+class _Encoder:
+    """Grows a value -> code dictionary across batches."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, column):
+        local_codes, uniques = pd.factorize(np.asarray(column, dtype=object), use_na_sentinel=False)
+        lookup = np.empty(len(uniques), dtype=np.int32)
+        for i, value in enumerate(uniques):
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            lookup[i] = code
+        return lookup[local_codes]
+
+    def categorical(self, codes):
+        """Categorical with the levels as sorted strings (matching the old str -> category path)."""
+        levels = np.array([str(v) for v in self.values], dtype=object)
+        order = np.argsort(levels, kind="stable")
+        remap = np.empty(len(order), dtype=np.int32)
+        remap[order] = np.arange(len(order), dtype=np.int32)
+        return pd.Categorical.from_codes(remap[codes], categories=pd.Index(levels[order], dtype=object))
+
+
+def _column(values, dtype=None):
+    """One chunk of a non-categorical column as a NumPy array (of dtype when declared)."""
+    if dtype is not None:
+        dtype = np.dtype(dtype)
+        if dtype.kind == 'M':
+            # None becomes NaT
+            return np.array(values, dtype=dtype)
+        return pd.to_numeric(np.asarray(values, dtype=object), errors="coerce").astype(dtype)
+    array = np.asarray(values)
+    if array.dtype == object and isinstance(next((v for v in values if v is not None), None), datetime.date):
+        return np.array(values, dtype='datetime64[D]')
+    if array.dtype == object:
+        # NULLs or Decimals: numeric with NaN for missing
+        return pd.to_numeric(array, errors="coerce").astype(np.float64)
+    return array
+
+
+def _concatenate(parts):
+    """Chunks of an undeclared column; all-NULL chunks of a date column become NaT."""
+    dates = next((part.dtype for part in parts if part.dtype.kind == 'M'), None)
+    if dates is not None:
+        parts = [part if part.dtype.kind == 'M' else np.full(len(part), np.datetime64('NaT'), dtype=dates)
+                 for part in parts]
+    return np.concatenate(parts)
+
+
+def stream_frame(engine, query, categorical=(), dtypes=None, chunk_rows=CHUNK_ROWS):
+    """
+    Run query with a server-side cursor and build a DataFrame chunk by chunk.
+
+    Columns named in categorical are integer-coded as they stream in; the
+    rest are converted to NumPy arrays, of the dtype given in dtypes
+    (column -> dtype) or else of their natural dtype.
+    """
+    dtypes = dtypes or {}
+    encoders = {name: _Encoder() for name in categorical}
+    blocks, n_rows, n_chunks = None, 0, 0
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, max_row_buffer=chunk_rows).execute(
+            sqlalchemy.text(query))
+        columns = list(result.keys())
+        blocks = {name: [] for name in columns}
+        for rows in result.partitions(chunk_rows):
+            for name, values in zip(columns, zip(*rows)):
+                if name in encoders:
+                    blocks[name].append(encoders[name].encode(values))
+                else:
+                    blocks[name].append(_column(values, dtypes.get(name)))
+            n_rows += len(rows)
+            n_chunks += 1
+
+    data = {}
+    for name in columns:
+        parts = blocks.pop(name)
+        if name in encoders:
+            codes = np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+            data[name] = encoders[name].categorical(codes)
+        elif not parts:
+            data[name] = np.empty(0, dtype=dtypes.get(name, np.float64))
+        else:
+            data[name] = np.concatenate(parts) if name in dtypes else _concatenate(parts)
+    frame = pd.DataFrame(data, copy=False)
+    logging.info(f"Streamed {n_rows} rows in {n_chunks} chunk(s) of up to {chunk_rows}; "
+                 f"{frame.memory_usage(deep=False).sum() / 2 ** 20:.1f} MiB coded.")
+    return frame
@@ -0,0 +1,89 @@
+# -----------------------------------------------------------------------------
+# Fit-Result Cache Keyed by a Content Hash of the Modeling Data
+# -----------------------------------------------------------------------------
+# lmer.py hashes the fetched modeling frame (game_id, year, field, team,
+# opponent, gs, w) together with the formula and fit options. The hash of the
+# fit that produced the current _basic_factors/_parameter_levels is kept in
+# <schema>._fit_cache; when a new run hashes to the same value those tables
+# are already the answer and the fit and write are skipped.
+#
+# The entry also keeps a source key: the md5 lmer.py's preflight query
+# computes over the modeling rows inside PostgreSQL, combined with the same
+# formula and options. When it matches, the run ends before the fetch.
+# -----------------------------------------------------------------------------
+
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+import pandas as pd
+import sqlalchemy
+
+from writer import copy_replace
+
+HASH_COLUMNS = ['game_id', 'year', 'field', 'team', 'opponent', 'gs', 'w']
+CACHE_TABLE = '_fit_cache'
+
+
+def frame_hash(frame, formula, options):
+    """
+    SHA-256 of the modeling rows (independent of row order and dtype
+    representation) plus the formula and a dict of fit options.
+    """
+    data = frame[HASH_COLUMNS].astype({'game_id': str, 'team': str, 'opponent': str, 'field': str,
+                                       'year': 'int64', 'gs': 'float64', 'w': 'float64'})
+    data = data.sort_values(['game_id', 'field', 'team']).reset_index(drop=True)
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    digest.update(formula.encode())
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def source_key(fingerprint, formula, options):
+    """Key of a server-side row fingerprint plus the formula and fit options."""
+    digest = hashlib.sha256(str(fingerprint).encode())
+    digest.update(formula.encode())
+    digest.update(json.dumps(options, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def cached_entry(engine, schema):
+    """The _fit_cache row (dict) behind the stored factor tables, or None if absent/incomplete."""
+    with engine.connect() as connection:
+        present = connection.execute(sqlalchemy.text(
+            "SELECT to_regclass(:c) IS NOT NULL AND to_regclass(:b) IS NOT NULL AND to_regclass(:p) IS NOT NULL"),
+            {'c': f"{schema}.{CACHE_TABLE}", 'b': f"{schema}._basic_factors", 'p': f"{schema}._parameter_levels"}
+        ).scalar()
+        if not present:
+            return None
+        row = connection.execute(sqlalchemy.text(
+            f"SELECT * FROM {schema}.{CACHE_TABLE} LIMIT 1")).mappings().first()
+        return dict(row) if row else None
+
+
+def cached_hash(engine, schema):
+    """Hash of the fit behind the stored factor tables, or None if absent/incomplete."""
+    entry = cached_entry(engine, schema)
+    return entry['data_hash'] if entry else None
+
+
+def clear_hash(engine, schema):
+    """Forget the cached hash before the factor tables are rewritten."""
+    with engine.begin() as connection:
+        connection.execute(sqlalchemy.text(f"DROP TABLE IF EXISTS {schema}.{CACHE_TABLE}"))
+
+
+def store_hash(engine, schema, data_hash, engine_name, formula, rows, source_key=None):
+    """Record the hash (and preflight source key) of the fit just written to the factor tables."""
+    entry = pd.DataFrame({
+        'data_hash': [data_hash],
+        'source_key': [source_key],
+        'engine': [engine_name],
+        'formula': [formula],
+        'rows': [rows],
+        'fitted_at': [datetime.now().isoformat(timespec='seconds')],
+    })
+    copy_replace(engine, entry, schema, CACHE_TABLE)
+    logging.info(f"Stored fit hash {data_hash[:12]} in {schema}.{CACHE_TABLE}.")
@@ -0,0 +1,644 @@
+# -----------------------------------------------------------------------------
+# Native Sparse Poisson / ZINB GLMM (Laplace Approximation) in NumPy/SciPy
+# -----------------------------------------------------------------------------
+# Fits the model family used by every sos/lmer.R and nrl/sos/lmer.py:
+#
+#     gs ~ field + (1|team) + (1|opponent) + (1|game_id)
+#
+# i.e. a Poisson GLMM with log link, treatment-coded fixed effects and any
+# number of scalar random intercepts, without starting R. family='nbinom'
+# and family='zinb' fit the negative binomial (NB2, size alpha) and its
+# zero-inflated version (constant zero probability pz) used by the
+# glmmADMB sos/zinb.R scripts; alpha and pz are optimized alongside theta.
+# family='negmultinom' integrates a gamma game effect shared by the two
+# scores of a game out analytically, for the formula without (1|game_id).
+#
+# The estimation follows lme4's glmer:
+#   * random effects are parameterized as b = Lambda(theta) u, u ~ N(0, I)
+#   * penalized iteratively reweighted least squares (PIRLS) finds the
+#     conditional modes for a given theta (stage 0: beta inside PIRLS, the
+#     same as nAGQ=0)
+#   * stage 1 (nAGQ=1, the glmer default) then optimizes theta and beta
+#     jointly on the Laplace deviance, with only u inside PIRLS
+#
+# For the NB/ZINB families PIRLS uses the observed information of the
+# conditional log-likelihood as the working weights (a block-diagonal
+# matrix for negmultinom, whose rows are coupled within a game).
+#
+# The random-effect block of the Hessian (Lambda Z' W Z Lambda + I) is a
+# sparse symmetric positive definite matrix. It is factorized with CHOLMOD when
+# scikit-sparse is installed and with SuperLU otherwise (or densely when it is
+# small and mostly filled, as without game effects); the same factor gives
+# the Newton step and the log-determinant of the Laplace approximation.
+#
+# theta is bounded by THETA_MAX and the linear predictor clipped to
+# +-ETA_MAX before it is exponentiated; an optimizer step where the
+# deviance is not finite or the factorization fails is scored np.inf (a
+# failed step the line search backs off from) instead of ending the fit.
+# The bounds only stop trial steps from overflowing and are far from any
+# fitted value: theta is a random-effect sd on the log-rate scale, where
+# the fitted sds are well under 1 (the team sds about 0.1-0.5), and 10
+# would be a factor of e^10 ~ 22,000 in the scoring rate per sd; an eta of
+# 30 is e^30 ~ 1e13 points, against log scores below 6, and keeps exp(eta)
+# and its square finite in float64. A fit that ends on either bound is
+# logged as a warning.
+#
+# compare_glmer.py checks the estimates against lme4's glmer (pymer4 or
+# the lmer.R tables) within a stated tolerance; check_glmm.py checks that a
+# fit recovers known parameters from simulated data.
+# -----------------------------------------------------------------------------
+
+import logging
+import re
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.linalg import cho_factor, cho_solve
+from scipy.optimize import minimize
+from scipy.sparse.linalg import splu
+from scipy.special import expit, gammaln, logit
+
+# --- Optional CHOLMOD backend ---
+try:
+    from sksparse.cholmod import cholesky as cholmod_cholesky
+except ImportError:
+    cholmod_cholesky = None
+
+# Factorize densely below this size when more than this fraction is nonzero
+DENSE_LIMIT = 2000
+DENSE_FILL = 0.1
+# Random-effect standard deviations (log scale) and |eta| beyond these are not scores
+THETA_MAX = 10.0
+ETA_MAX = 30.0
+
+_RANEF_TERM = re.compile(r"^\(\s*1\s*\|\s*(\w+)\s*\)$")
+
+
+def parse_formula(formula):
+    """Split 'y ~ a + b + (1|g)' into (response, fixed terms, grouping factors)."""
+    if "~" not in formula:
+        raise ValueError(f"Formula '{formula}' has no '~'.")
+    lhs, rhs = formula.split("~", 1)
+
+    # Split on '+' outside parentheses
+    terms, depth, current = [], 0, ""
+    for ch in rhs:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "+" and depth == 0:
+            terms.append(current.strip())
+            current = ""
+        else:
+            current += ch
+    terms.append(current.strip())
+
+    fixed, groups = [], []
+    for term in terms:
+        if term in ("", "1"):
+            continue
+        match = _RANEF_TERM.match(term)
+        if match:
+            groups.append(match.group(1))
+        elif term.startswith("("):
+            raise ValueError(f"Unsupported random-effect term '{term}'; only (1|group) intercepts are supported.")
+        else:
+            fixed.append(term)
+    return lhs.strip(), fixed, groups
+
+
+def factor_codes(values, reference=None):
+    """Integer codes and levels for a column, like R's as.factor (+ relevel)."""
+    values = pd.Series(values)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        cat = values.cat.remove_unused_categories()
+    else:
+        cat = values.astype("category")
+    if reference is not None and reference in cat.cat.categories:
+        levels = [reference] + [l for l in cat.cat.categories if l != reference]
+        cat = cat.cat.reorder_categories(levels)
+    return cat.cat.codes.to_numpy(np.int64), cat.cat.categories
+
+
+class _Poisson:
+    """Poisson log-likelihood with log link; no extra parameters."""
+
+    name = "poisson"
+    extra_names = ()
+    extra_start = ()
+    extra_bounds = ()
+
+    def bind(self, data):
+        """The family for a given data set (row-wise families need nothing from it)."""
+        return self
+
+    def natural(self, extra):
+        return {}
+
+    def working(self, natural):
+        return []
+
+    def loglik(self, y, eta, extra):
+        return y * eta - np.exp(eta) - gammaln(y + 1.0)
+
+    def derivs(self, y, eta, extra):
+        """First derivative and working weight (minus second derivative) in eta."""
+        mu = np.exp(eta)
+        return y - mu, mu
+
+    def sample(self, rng, eta, extra):
+        return rng.poisson(np.exp(eta)).astype(np.float64)
+
+
+class _NegBinomial(_Poisson):
+    """NB2 (variance mu + mu^2/alpha), alpha optimized on the log scale."""
+
+    name = "nbinom"
+    extra_names = ("alpha",)
+    extra_start = (np.log(10.0),)
+    extra_bounds = ((-8.0, 12.0),)
+
+    def natural(self, extra):
+        return {"alpha": float(np.exp(extra[0]))}
+
+    def working(self, natural):
+        return [np.log(natural["alpha"])]
+
+    def _nb(self, y, eta, log_alpha):
+        """log NB probability of y and log P(0)."""
+        alpha = np.exp(log_alpha)
+        log_total = np.logaddexp(log_alpha, eta)  # log(alpha + mu)
+        log_p0 = alpha * (log_alpha - log_total)
+        ll = (gammaln(y + alpha) - gammaln(alpha) - gammaln(y + 1.0)
+              + log_p0 + y * (eta - log_total))
+        return ll, log_p0
+
+    def loglik(self, y, eta, extra):
+        return self._nb(y, eta, extra[0])[0]
+
+    def derivs(self, y, eta, extra):
+        alpha, mu = np.exp(extra[0]), np.exp(eta)
+        total = alpha + mu
+        return alpha * (y - mu) / total, alpha * mu * (alpha + y) / total ** 2
+
+    def sample(self, rng, eta, extra):
+        alpha = np.exp(extra[0])
+        return rng.negative_binomial(alpha, alpha / (alpha + np.exp(eta))).astype(np.float64)
+
+
+class _ZeroInflatedNegBinomial(_NegBinomial):
+    """NB2 mixed with a point mass at zero of probability pz (logit scale)."""
+
+    name = "zinb"
+    extra_names = ("alpha", "pz")
+    extra_start = (np.log(10.0), logit(0.05))
+    extra_bounds = ((-8.0, 12.0), (-15.0, 15.0))
+
+    def natural(self, extra):
+        return {"alpha": float(np.exp(extra[0])), "pz": float(expit(extra[1]))}
+
+    def working(self, natural):
+        return [np.log(natural["alpha"]), logit(natural["pz"])]
+
+    def loglik(self, y, eta, extra):
+        nb, log_p0 = self._nb(y, eta, extra[0])
+        log_pz, log_1mpz = -np.logaddexp(0.0, -extra[1]), -np.logaddexp(0.0, extra[1])
+        return np.where(y > 0, log_1mpz + nb, np.logaddexp(log_pz, log_1mpz + log_p0))
+
+    def derivs(self, y, eta, extra):
+        d1, weight = _NegBinomial.derivs(self, y, eta, extra)
+        zero = y == 0
+        if np.any(zero):
+            alpha, mu = np.exp(extra[0]), np.exp(eta[zero])
+            total = alpha + mu
+            # Posterior probability that a zero came from the NB component
+            log_nb0 = -np.logaddexp(0.0, extra[1]) + alpha * (extra[0] - np.log(total))
+            r = np.exp(log_nb0 - np.logaddexp(-np.logaddexp(0.0, -extra[1]), log_nb0))
+            a = -alpha * mu / total
+            b = -alpha ** 2 * mu / total ** 2
+            d1[zero] = r * a
+            weight[zero] = np.maximum(-(r * b + r * (1.0 - r) * a ** 2), 1e-10)
+        return d1, weight
+
+    def sample(self, rng, eta, extra):
+        y = _NegBinomial.sample(self, rng, eta, extra)
+        y[rng.random(len(y)) < expit(extra[1])] = 0.0
+        return y
+
+
+class _NegativeMultinomial(_NegBinomial):
+    """
+    Poisson scores sharing a Gamma(alpha, alpha) game effect, integrated out.
+
+    The rows of a game (grouping column `group`) are jointly negative
+    multinomial and each row alone is NB2 with size alpha, so the family
+    replaces (1|game_id) by the one parameter alpha. The Hessian couples the
+    rows of a game, so the working weights are a block-diagonal matrix. A
+    game's log-likelihood is split evenly over its rows, which must
+    therefore carry equal weights.
+    """
+
+    name = "negmultinom"
+    group = "game_id"
+
+    def __init__(self, games=None):
+        self.games = games
+        if games is not None:
+            # (row, column) index of every pair of rows in the same game, diagonal included
+            members = sp.csr_matrix((np.ones(len(games)), (np.arange(len(games)), games)))
+            pairs = (members @ members.T).tocoo()
+            self._rows, self._cols = pairs.row, pairs.col
+
+    def bind(self, data):
+        return _NegativeMultinomial(factor_codes(data[self.group])[0])
+
+    def _per_game(self, values):
+        return np.bincount(self.games, weights=values)
+
+    def loglik(self, y, eta, extra):
+        alpha, log_alpha = np.exp(extra[0]), extra[0]
+        total, rate = self._per_game(y), self._per_game(np.exp(eta))
+        game = (gammaln(alpha + total) - gammaln(alpha) + alpha * log_alpha
+                - (alpha + total) * np.log(alpha + rate))
+        return y * eta - gammaln(y + 1.0) + (game / np.bincount(self.games))[self.games]
+
+    def derivs(self, y, eta, extra):
+        alpha, mu = np.exp(extra[0]), np.exp(eta)
+        denominator = alpha + self._per_game(mu)
+        scale = (alpha + self._per_game(y)) / denominator
+        d1 = y - scale[self.games] * mu
+        # scale * (diag(mu) - mu mu' / (alpha + sum mu)) within each game
+        rows, cols = self._rows, self._cols
+        game = self.games[rows]
+        values = scale[game] * mu[rows] * ((rows == cols) - mu[cols] / denominator[game])
+        return d1, sp.csr_matrix((values, (rows, cols)), shape=(len(mu), len(mu)))
+
+    def sample(self, rng, eta, extra):
+        alpha = np.exp(extra[0])
+        frailty = rng.gamma(alpha, 1.0 / alpha, self.games.max() + 1)
+        return rng.poisson(np.exp(eta) * frailty[self.games]).astype(np.float64)
+
+
+FAMILIES = {family.name: family for family in (_Poisson(), _NegBinomial(), _ZeroInflatedNegBinomial(),
+                                               _NegativeMultinomial())}
+
+
+class _SparseFactor:
+    """Factorization of a sparse SPD matrix exposing solve() and logdet."""
+
+    def __init__(self, M):
+        n = M.shape[0]
+        if n <= DENSE_LIMIT and M.nnz > DENSE_FILL * n * n:
+            # Small and mostly filled (e.g. only team effects): dense Cholesky is faster
+            factor = cho_factor(M.toarray(), lower=True)
+            self.solve = lambda b: cho_solve(factor, b)
+            self.logdet = 2.0 * float(np.sum(np.log(np.diag(factor[0]))))
+        elif cholmod_cholesky is not None:
+            factor = cholmod_cholesky(M)
+            self.solve = factor
+            self.logdet = factor.logdet()
+        else:
+            lu = splu(M, permc_spec="MMD_AT_PLUS_A", diag_pivot_thresh=0.0,
+                      options={"SymmetricMode": True})
+            self.solve = lu.solve
+            self.logdet = float(np.sum(np.log(np.abs(lu.U.diagonal()))))
+
+
+class SparseGlmer:
+    """
+    Poisson/NB/ZINB GLMM with scalar random intercepts, fitted by Laplace approximation.
+
+    The interface mirrors the parts of pymer4's Lmer that lmer.py uses:
+    construct with a formula and DataFrame, call fit(weights=...), then read
+    coefs (DataFrame with 'Estimate'), ranef (list of DataFrames with an
+    '(Intercept)' column, ordered as ranef_names), ranef_var and logLike.
+    NB/ZINB fits also set alpha (and pz).
+    """
+
+    def __init__(self, formula, data, family="poisson", reference=None):
+        if family not in FAMILIES:
+            raise ValueError(f"SparseGlmer supports family in {sorted(FAMILIES)} (got '{family}').")
+        self.formula = formula
+        self.data = data
+        self.family = family
+        self._family = FAMILIES[family].bind(data)
+        self.response, self.fixed_terms, self.ranef_names = parse_formula(formula)
+        if not self.ranef_names:
+            raise ValueError("Formula has no (1|group) random-effect terms.")
+        reference = reference or {}
+
+        self.y = pd.to_numeric(data[self.response]).to_numpy(np.float64)
+        n = len(self.y)
+
+        # --- Fixed-effects design (intercept + treatment contrasts) ---
+        columns, names = [np.ones(n)], ["(Intercept)"]
+        for term in self.fixed_terms:
+            col = data[term]
+            if pd.api.types.is_numeric_dtype(col) and not isinstance(col.dtype, pd.CategoricalDtype):
+                columns.append(col.to_numpy(np.float64))
+                names.append(term)
+                continue
+            codes, levels = factor_codes(col, reference.get(term))
+            for j, level in enumerate(levels[1:], start=1):
+                columns.append((codes == j).astype(np.float64))
+                names.append(f"{term}{level}")
+        self.X = np.column_stack(columns)
+        self.x_names = names
+
+        # --- Random-effects design (one indicator block per grouping factor) ---
+        blocks, self.ranef_levels = [], []
+        for group in self.ranef_names:
+            codes, levels = factor_codes(data[group])
+            blocks.append(sp.csc_matrix((np.ones(n), (np.arange(n), codes)), shape=(n, len(levels))))
+            self.ranef_levels.append(levels)
+        self.Z = sp.hstack(blocks, format="csc")
+        self.block_sizes = np.array([len(levels) for levels in self.ranef_levels])
+        self.fitted = False
+
+    # --- Core numerics ---
+
+    def _lambda(self, theta):
+        return self.Z @ sp.diags(np.repeat(theta, self.block_sizes))
+
+    def _cond_deviance(self, eta, extra):
+        """Weighted deviance (-2 log-likelihood) at linear predictor eta."""
+        return -2.0 * np.sum(self.w * self._family.loglik(self.y, np.clip(eta, -ETA_MAX, ETA_MAX), extra))
+
+    def _working(self, eta, extra):
+        """Weighted score and working weight matrix (sparse, diagonal unless the family couples rows)."""
+        d1, weight = self._family.derivs(self.y, np.clip(eta, -ETA_MAX, ETA_MAX), extra)
+        if sp.issparse(weight):
+            return self.w * d1, sp.diags(self.w) @ weight
+        return self.w * d1, sp.diags(self.w * weight)
+
+    def _pirls(self, theta, beta, u, update_beta, extra=(), tol=1e-10, maxiter=100):
+        """
+        Conditional modes for fixed theta (and family parameters) by penalized IRLS.
+
+        Returns (laplace_deviance, beta, u, factor) where factor is the sparse
+        factorization of Lambda Z' W Z Lambda + I at the mode.
+        """
+        ZL = self._lambda(theta)
+        eye = sp.identity(ZL.shape[1], format="csc")
+        Xb = self.X @ beta
+        eta = Xb + ZL @ u
+        pdev = self._cond_deviance(eta, extra) + u @ u
+        for _ in range(maxiter):
+            resid, W = self._working(eta, extra)
+            M = (ZL.T @ W @ ZL + eye).tocsc()
+            factor = _SparseFactor(M)
+            grad_u = ZL.T @ resid - u
+            if update_beta:
+                WX = W @ self.X
+                C = np.asarray(ZL.T @ WX)
+                MinvC = factor.solve(C)
+                schur = self.X.T @ WX - C.T @ MinvC
+                Minv_gu = factor.solve(grad_u)
+                d_beta = np.linalg.solve(schur, self.X.T @ resid - C.T @ Minv_gu)
+                d_u = Minv_gu - MinvC @ d_beta
+            else:
+                d_beta = np.zeros_like(beta)
+                d_u = factor.solve(grad_u)
+
+            # Step halving on the penalized deviance
+            step = 1.0
+            while True:
+                new_beta, new_u = beta + step * d_beta, u + step * d_u
+                new_eta = self.X @ new_beta + ZL @ new_u
+                new_pdev = self._cond_deviance(new_eta, extra) + new_u @ new_u
+                if new_pdev <= pdev or step < 1e-10:
+                    break
+                step /= 2.0
+            change = pdev - new_pdev
+            beta, u, eta, pdev = new_beta, new_u, new_eta, new_pdev
+            # The deviance change alone stops too early when the working
+            # weights are not the exact curvature (NB/ZINB zeros); also
+            # require a negligible step so the optimizer sees a smooth profile
+            if abs(change) < tol * (abs(pdev) + tol) and step * np.max(np.abs(d_u), initial=0.0) < 1e-6:
+                break
+
+        # Refactorize at the final mode for the Laplace log-determinant
+        M = (ZL.T @ self._working(eta, extra)[1] @ ZL + eye).tocsc()
+        factor = _SparseFactor(M)
+        return pdev + factor.logdet, beta, u, factor
+
+    def _objective(self, state, theta, beta, update_beta, extra):
+        """Laplace deviance for the optimizer: np.inf (state unchanged) where PIRLS fails or diverges."""
+        state["evals"] += 1
+        try:
+            dev, new_beta, new_u, _ = self._pirls(theta, beta, state["u"], update_beta, extra)
+        except (np.linalg.LinAlgError, RuntimeError, ValueError):
+            return np.inf
+        if not (np.isfinite(dev) and np.all(np.isfinite(new_u)) and np.all(np.isfinite(new_beta))):
+            return np.inf
+        if update_beta:
+            state["beta"] = new_beta
+        state["u"] = new_u
+        return dev
+
+    # --- Fitting ---
+
+    def fit(self, weights=None, verbose=False, summarize=False, nagq=1, maxiter=1000, start=None):
+        """
+        Fit by Laplace approximation; weights is a column name or an array.
+
+        Weights multiply each row's log-likelihood (and its contribution to
+        Z' W Z), so a row of weight w fits exactly like w replicated rows, and
+        non-integer weights need no replication at all. A row of weight 0
+        drops out of the fit while staying in the design (levels seen only in
+        such rows get zero modes), which lets one design serve many subsets.
+
+        start is an optional warm start as returned by start_from_factors():
+        fixed effects, conditional modes and random-effect standard deviations
+        from a previous fit. Levels the previous fit did not have start at
+        zero. A warm start with variance components skips stage 0.
+
+        For NB/ZINB the family parameters (log alpha, logit pz) are optimized
+        with theta in stage 0 and with theta and beta in stage 1.
+        """
+        if weights is None:
+            self.w = np.ones_like(self.y)
+        elif isinstance(weights, str):
+            self.w = pd.to_numeric(self.data[weights]).to_numpy(np.float64)
+        else:
+            self.w = np.asarray(weights, dtype=np.float64)
+        if np.any(self.w < 0) or not np.all(np.isfinite(self.w)) or not np.any(self.w > 0):
+            raise ValueError("Weights must be finite and non-negative, and not all zero.")
+
+        k, p = len(self.ranef_names), self.X.shape[1]
+        family = self._family
+        beta = np.zeros(p)
+        beta[0] = np.log(np.sum(self.w * self.y) / np.sum(self.w))
+        theta, u = np.ones(k), np.zeros(self.Z.shape[1])
+        extra = np.array(family.extra_start, dtype=np.float64)
+        warm = start is not None and bool(start.get("theta"))
+        if start is not None:
+            theta, beta, u, extra = self._apply_start(start, theta, beta, extra)
+        e = len(extra)
+        state = {"beta": beta, "u": u, "evals": 0}
+        self.warm_started = warm
+
+        # Stage 0: theta (and family parameters), beta estimated inside PIRLS
+        def stage0(params):
+            return self._objective(state, params[:k], state["beta"], True, params[k:])
+
+        if not (warm and nagq >= 1):
+            opt = minimize(stage0, np.concatenate([theta, extra]), method="L-BFGS-B",
+                           bounds=[(0.0, THETA_MAX)] * k + list(family.extra_bounds), options={"maxiter": maxiter})
+            theta, extra, beta = opt.x[:k], opt.x[k:], state["beta"]
+            if verbose:
+                logging.info(f"Stage 0 (nAGQ=0): deviance {opt.fun:.4f}, theta {np.round(theta, 5).tolist()}, {state['evals']} evaluations")
+
+        # Stage 1: theta, beta (and family parameters) jointly on the Laplace deviance
+        if nagq >= 1:
+            def stage1(params):
+                return self._objective(state, params[:k], params[k:k + p], False, params[k + p:])
+
+            opt = minimize(stage1, np.concatenate([theta, beta, extra]), method="L-BFGS-B",
+                           bounds=[(0.0, THETA_MAX)] * k + [(None, None)] * p + list(family.extra_bounds),
+                           options={"maxiter": maxiter})
+            theta, beta, extra = opt.x[:k], opt.x[k:k + p], opt.x[k + p:]
+            if verbose:
+                logging.info(f"Stage 1 (nAGQ=1): deviance {opt.fun:.4f}, theta {np.round(theta, 5).tolist()}, {state['evals']} evaluations")
+
+        deviance, beta, u, factor = self._pirls(theta, beta, state["u"], nagq < 1, extra)
+        self._store_results(theta, beta, u, extra, deviance, factor)
+        self.converged = bool(opt.success)
+        self.n_evals = state["evals"]
+        if not self.converged:
+            logging.warning(f"Optimizer did not report convergence: {opt.message}")
+        at_bound = [name for name, sd in zip(self.ranef_names, theta) if sd >= THETA_MAX]
+        if at_bound or np.abs(self.X @ beta + self._lambda(theta) @ u).max() >= ETA_MAX:
+            logging.warning(f"Fit ends on THETA_MAX ({at_bound}) or ETA_MAX; the estimates are not reliable.")
+        self.fitted = True
+        if summarize:
+            return self.summary()
+
+    def _apply_start(self, start, theta, beta, extra):
+        """Map a warm start onto this design; unknown levels and terms keep their defaults."""
+        theta, beta = theta.copy(), beta.copy()
+        natural = self._family.natural(extra)
+        natural.update({name: float(value) for name, value in start.get("extra", {}).items() if name in natural})
+        extra = np.asarray(self._family.working(natural), dtype=np.float64)
+        for i, name in enumerate(self.ranef_names):
+            if name in start.get("theta", {}):
+                theta[i] = min(max(float(start["theta"][name]), 0.0), THETA_MAX)
+        for j, name in enumerate(self.x_names):
+            if name in start.get("beta", {}):
+                beta[j] = float(start["beta"][name])
+        modes = []
+        for i, name in enumerate(self.ranef_names):
+            b = pd.Series(start.get("ranef", {}).get(name, {}), dtype=np.float64)
+            b = b.reindex(self.ranef_levels[i].astype(str)).fillna(0.0).to_numpy()
+            modes.append(b / theta[i] if theta[i] > 0 else np.zeros_like(b))
+        return theta, beta, np.concatenate(modes), extra
+
+    def _store_results(self, theta, beta, u, extra, deviance, factor):
+        # Fixed-effect standard errors from the Schur complement at the mode
+        ZL = self._lambda(theta)
+        WX = self._working(self.X @ beta + ZL @ u, extra)[1] @ self.X
+        C = np.asarray(ZL.T @ WX)
+        schur = self.X.T @ WX - C.T @ factor.solve(C)
+        se = np.sqrt(np.diag(np.linalg.inv(schur)))
+
+        self.theta = theta
+        self.beta = beta
+        self.u = u
+        self.coefs = pd.DataFrame({"Estimate": beta, "SE": se, "Z-stat": beta / se}, index=self.x_names)
+
+        b = np.repeat(theta, self.block_sizes) * u
+        bounds = np.concatenate([[0], np.cumsum(self.block_sizes)])
+        self.ranef = [
+            pd.DataFrame({"(Intercept)": b[bounds[i]:bounds[i + 1]]}, index=self.ranef_levels[i])
+            for i in range(len(self.ranef_names))
+        ]
+        self.ranef_var = pd.DataFrame(
+            {"Name": "(Intercept)", "Var": theta ** 2, "Std": theta}, index=self.ranef_names)
+
+        # Family parameters (alpha, pz) on their natural scale
+        self._extra_working = np.asarray(extra, dtype=np.float64)
+        self.extra = self._family.natural(extra)
+        for name, value in self.extra.items():
+            setattr(self, name, value)
+
+        n_params = len(beta) + len(theta) + len(extra)
+        self.deviance = deviance
+        self.logLike = -0.5 * deviance
+        self.AIC = deviance + 2.0 * n_params
+        self.BIC = deviance + np.log(len(self.y)) * n_params
+
+    def start_values(self):
+        """This fit as a warm start for fit(start=...) (same form as start_from_factors)."""
+        if not self.fitted:
+            raise RuntimeError("Model has not been fitted yet.")
+        return {
+            "beta": dict(zip(self.x_names, self.beta)),
+            "theta": dict(zip(self.ranef_names, self.theta)),
+            "ranef": {name: dict(zip(df.index.astype(str), df["(Intercept)"]))
+                      for name, df in zip(self.ranef_names, self.ranef)},
+            "extra": dict(self.extra),
+        }
+
+    def simulate(self, rng, resample=()):
+        """
+        Draw a response vector from the fitted model.
+
+        Grouping factors in resample get new N(0, sd^2) effects; the others
+        keep their conditional modes (lme4's simulate with use.u for them).
+        """
+        if not self.fitted:
+            raise RuntimeError("Model has not been fitted yet.")
+        b = np.repeat(self.theta, self.block_sizes) * self.u
+        bounds = np.concatenate([[0], np.cumsum(self.block_sizes)])
+        for i, name in enumerate(self.ranef_names):
+            if name in resample:
+                b[bounds[i]:bounds[i + 1]] = self.theta[i] * rng.standard_normal(self.block_sizes[i])
+        eta = self.X @ self.beta + self.Z @ b
+        return self._family.sample(rng, eta, self._extra_working)
+
+    def summary(self):
+        """Log and return the fixed-effects table, like pymer4's summary()."""
+        if not self.fitted:
+            raise RuntimeError("Model has not been fitted yet.")
+        logging.info(f"Formula: {self.formula}")
+        logging.info(f"Family: {self.family}\tInference: Laplace (sparse)")
+        logging.info(f"Number of observations: {len(self.y)}\tGroups: "
+                     + str({name: int(size) for name, size in zip(self.ranef_names, self.block_sizes)}))
+        logging.info(f"Log-likelihood: {self.logLike:.3f}\tAIC: {self.AIC:.3f}\tBIC: {self.BIC:.3f}")
+        logging.info("Random effects:\n" + self.ranef_var.to_string())
+        if self.extra:
+            logging.info("Family parameters: " + ", ".join(f"{k} {v:.6g}" for k, v in self.extra.items()))
+        return self.coefs
+
+
+def start_from_factors(factors, name_map=None):
+    """
+    Build a warm start from a stored _basic_factors frame.
+
+    factors has the factor/type/level/estimate columns written by lmer.py.
+    name_map maps output factor names back to grouping columns (e.g.
+    {'offense': 'team', 'defense': 'opponent'}). Random-effect standard
+    deviations are read from the 'structural' rows with level 'sd'; family
+    parameters from the 'structural' alpha and pz rows written by zinb.py.
+    Random effects are keyed by their integer 'code' where the frame has one.
+    """
+    name_map = name_map or {}
+    factors = factors.assign(group=factors["factor"].map(lambda f: name_map.get(f, f)))
+    if "code" in factors.columns:
+        code = pd.to_numeric(factors["code"]).astype("Int64")
+        factors = factors.assign(key=code.astype(str).where(code.notna(), factors["level"].astype(str)))
+    else:
+        factors = factors.assign(key=factors["level"].astype(str))
+    fixed = factors[factors["type"] == "fixed"]
+    random = factors[factors["type"] == "random"]
+    sd = factors[(factors["type"] == "structural") & (factors["level"] == "sd")]
+    extra = factors[(factors["type"] == "structural") & factors["level"].isin(["alpha", "pz"])]
+    return {
+        "beta": dict(zip(fixed["level"], fixed["estimate"])),
+        "theta": dict(zip(sd["group"], sd["estimate"])),
+        "ranef": {group: dict(zip(rows["key"], rows["estimate"]))
+                  for group, rows in random.groupby("group")},
+        "extra": dict(zip(extra["level"], extra["estimate"])),
+    }
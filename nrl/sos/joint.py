@@ -0,0 +1,181 @@
+# -----------------------------------------------------------------------------
+# Joint Cross-Competition Fit
+# -----------------------------------------------------------------------------
+# club.results mixes the Premiership, Top 14, URC/Pro14, ProD2, Champions
+# Cup and Challenge Cup. Instead of one flat pool (club/sos/lmer.R) plus
+# separate refits of the overlapping games, fits them once as
+#
+#     gs ~ field + competition + (1|team) + (1|opponent) + (1|game_id)
+#
+# with the sparse Laplace fitter of glmm.py: team effects are shared by
+# every competition a team plays in, and each competition's scoring level
+# is a fixed effect against the largest competition. The league's
+# `competition` column (leagues.py) names each game's competition.
+#
+# Writes
+#
+#   <schema>._parameter_levels / _basic_factors   as lmer.py (the competition
+#       rows are fixed factors like field), read by normalize_factors.sql
+#   <schema>._competition_rankings   per competition: rk, team_code, team,
+#       str, ofs, dfs (log scale, as current_ranking.sql), sos (mean str of
+#       the team's opponents in that competition) and games
+#   <league>/models/<league>/      the model artifact (artifact.py), with
+#       the competition effects
+#
+# so each competition's ranking comes from the one fit.
+#
+#   python ../nrl/sos/joint.py --league club
+# -----------------------------------------------------------------------------
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import lmer
+from artifact import artifact_path, build_artifact, save_artifact
+from codes import CodeBook, recode
+from fitcache import clear_hash
+from glmm import SparseGlmer, start_from_factors
+from leagues import LEAGUES, REPO_ROOT
+from profiling import PROFILE_FILE, StageProfiler
+from writer import copy_replace
+
+OUTPUT_LOG_FILE = os.path.join(lmer.DIAGNOSTICS_DIR, "joint.log")
+JOINT_FORMULA = "gs ~ field + competition + (1|team) + (1|opponent) + (1|game_id)"
+PARAMETER_TYPES = {'field': 'fixed', 'competition': 'fixed', 'team': 'random', 'opponent': 'random',
+                   'game_id': 'random'}
+
+
+def fit_joint(g_filtered, engine, league, cold_start=False):
+    """Fit JOINT_FORMULA, warm-started from <schema>._basic_factors when present."""
+    schema = league['schema']
+    reference = {'competition': g_filtered['competition'].value_counts().idxmax()}
+    if league['field_reference']:
+        reference['field'] = league['field_reference']
+    model = SparseGlmer(JOINT_FORMULA, data=g_filtered, family='poisson', reference=reference)
+
+    start = None
+    if not cold_start:
+        try:
+            previous = pd.read_sql_query(f"SELECT * FROM {schema}._basic_factors", engine)
+            start = start_from_factors(previous, {'offense': 'team', 'defense': 'opponent'})
+            logging.info(f"Warm start from {schema}._basic_factors.")
+        except Exception as e:
+            logging.info(f"No previous fit available for a warm start ({e.__class__.__name__}); fitting from scratch.")
+
+    logging.info(f"Fitting {JOINT_FORMULA} on {g_filtered['competition'].nunique()} competitions "
+                 f"(reference {reference['competition']})")
+    model.fit(weights='w', verbose=True, summarize=False, start=start)
+    logging.info(f"Joint fit used {model.n_evals} deviance evaluations.")
+    return model
+
+
+def competition_rankings(model, g_filtered, codebook):
+    """_competition_rankings frame: every team's ratings and schedule within each competition."""
+    names = list(model.ranef_names)
+    ofs = model.ranef[names.index('team')]['(Intercept)']
+    dfs = model.ranef[names.index('opponent')]['(Intercept)']
+    rows = pd.DataFrame({
+        'competition': g_filtered['competition'].astype(str).to_numpy(),
+        'team_code': g_filtered['team'].to_numpy(),
+        'opponent_code': g_filtered['opponent'].to_numpy(),
+    })
+    strength = ofs.sub(dfs, fill_value=0.0)
+    rows['opponent_str'] = strength.reindex(rows['opponent_code']).fillna(0.0).to_numpy()
+    # Two rows per game, one per side: a team's rows are its games
+    ranking = rows.groupby(['competition', 'team_code'], observed=True).agg(
+        sos=('opponent_str', 'mean'), games=('opponent_str', 'size')).reset_index()
+    ranking['ofs'] = ofs.reindex(ranking['team_code']).fillna(0.0).to_numpy()
+    ranking['dfs'] = dfs.reindex(ranking['team_code']).fillna(0.0).to_numpy()
+    ranking['str'] = ranking['ofs'] - ranking['dfs']
+    ranking['team'] = codebook.level_names('team', ranking['team_code'].to_numpy())
+    ranking = ranking.sort_values(['competition', 'str'], ascending=[True, False])
+    ranking['rk'] = ranking.groupby('competition').cumcount() + 1
+    return ranking[['competition', 'rk', 'team_code', 'team', 'str', 'ofs', 'dfs', 'sos', 'games']] \
+        .astype({'team_code': np.int64}).reset_index(drop=True)
+
+
+def run(league_name, cold_start=False, weighting=None):
+    """Fetch, fit and write the joint model and per-competition rankings; returns a report dict."""
+    league = dict(LEAGUES[league_name])
+    if weighting:
+        league['weighting'] = weighting
+    schema = league['schema']
+    if not league.get('competition'):
+        raise ValueError(f"League '{league_name}' has no competition column (see leagues.py).")
+    report = {'league': league_name, 'schema': schema, 'status': 'failed', 'rows': 0}
+    profiler = StageProfiler(os.path.join(REPO_ROOT, league['directory'], lmer.DIAGNOSTICS_DIR, PROFILE_FILE),
+                             league=league_name, schema=schema, engine='joint')
+    started = time.perf_counter()
+    logging.info(f"--- Starting joint fit for '{league_name}' ({datetime.now()}) ---")
+    engine = lmer.connect()
+    try:
+        with profiler.stage('fetch'):
+            sg = lmer.fetch_data(engine, league)
+        if sg.empty:
+            report['status'] = 'no data'
+            return report
+        with profiler.stage('encode'):
+            codebook = CodeBook.load(engine, schema)
+            recode(sg, codebook)
+            codebook.save(engine, schema)
+        with profiler.stage('preprocess'):
+            g_filtered = lmer.preprocess(sg)
+            g_filtered['competition'] = g_filtered['competition'].cat.remove_unused_categories()
+        report['rows'] = len(g_filtered)
+
+        with profiler.stage('fit'):
+            model = fit_joint(g_filtered, engine, league, cold_start)
+            lmer.log_summary(model)
+
+        with profiler.stage('write'):
+            # The factor tables no longer hold lmer.py's fit
+            clear_hash(engine, schema)
+            lmer.write_parameter_levels(engine, schema, g_filtered, parameter_types=PARAMETER_TYPES, codebook=codebook)
+            combined = lmer.extract_results(model, codebook=codebook)
+            lmer.write_results(engine, schema, combined)
+            save_artifact(artifact_path(REPO_ROOT, league, league_name),
+                          build_artifact(combined, league_name, league, 'poisson', JOINT_FORMULA,
+                                         g_filtered['field'].cat.categories,
+                                         competition_levels=g_filtered['competition'].cat.categories))
+            rankings = competition_rankings(model, g_filtered, codebook)
+            copy_replace(engine, rankings, schema, '_competition_rankings')
+        for competition, ranking in rankings.groupby('competition'):
+            logging.info(f"{competition}:\n" + ranking.drop(columns=['competition', 'team_code'])
+                         .round(3).to_string(index=False))
+        report['status'] = 'ok'
+    except Exception as e:
+        logging.error(f"Joint fit failed: {e}")
+        import traceback
+        logging.error(traceback.format_exc())
+        report['error'] = str(e)
+    finally:
+        engine.dispose()
+        report.update(profiler.timings)
+        profiler.close()
+        report['total'] = time.perf_counter() - started
+        logging.info(f"--- Joint fit finished in {report['total']:.1f}s ({datetime.now()}) ---")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit all of a league's competitions jointly (_competition_rankings).")
+    parser.add_argument("--league", default="club",
+                        choices=sorted(name for name, league in LEAGUES.items() if league.get('competition')))
+    parser.add_argument("--cold-start", action="store_true",
+                        help="ignore the stored _basic_factors and fit from scratch")
+    args = parser.parse_args(argv)
+
+    lmer.setup_logging(OUTPUT_LOG_FILE)
+    report = run(args.league, args.cold_start)
+    if report['status'] != 'ok':
+        raise SystemExit(f"Joint fit {report['status']}: {report.get('error', '')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# -----------------------------------------------------------------------------
+# Per-League Model Settings
+# -----------------------------------------------------------------------------
+# The data window, recency weight and output schema of every league's
+# sos/lmer.R, in one place so lmer.py and batch.py can fit any of them.
+#
+#   directory       league directory (relative to the repository root); the
+#                   run log goes to <directory>/diagnostics
+#   schema          schema receiving _basic_factors / _parameter_levels
+#   results         table holding the standardized results
+#   team/opponent   columns identifying the two sides in `results`
+#   min_year/max_year   seasons included in the fit
+#   reference_year  w = year - reference_year
+#   field_reference reference level of the field factor (None keeps R's
+#                   alphabetical default)
+#   weighting       recency weighting spec for weights.py. The default is
+#                   'season_squared', the weight the league's lmer.R fit
+#                   carries (its rows were replicated w times and also
+#                   weighted by w, i.e. w^2), so a native fit of an lmer.R
+#                   league matches its R fit. nrl is fitted by lmer.py,
+#                   which has always passed weights='w' without
+#                   replication, so it keeps 'season'; so do the ZINB
+#                   windows (zinb.R replicated its rows w times, unweighted)
+#   competition     column of `results` naming each game's competition, for
+#                   the joint cross-competition fit (joint.py); None if the
+#                   league is a single competition
+#
+# ZINB_LEAGUES holds the leagues with a sos/zinb.R and how their windows
+# differ from the lmer.R ones; zinb_league() merges the two.
+# -----------------------------------------------------------------------------
+
+import os
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _league(directory, schema, results, min_year, max_year, reference_year,
+            team="team_name", opponent="opponent_name", field_reference=None, weighting="season_squared", competition=None):
+    return {
+        "directory": directory,
+        "schema": schema,
+        "results": results,
+        "team": team,
+        "opponent": opponent,
+        "min_year": min_year,
+        "max_year": max_year,
+        "reference_year": reference_year,
+        "field_reference": field_reference,
+        "weighting": weighting,
+        "competition": competition,
+    }
+
+
+def _world_rugby(name, min_year, max_year, reference_year):
+    return _league("world_rugby", name, f"{name}._results", min_year, max_year, reference_year,
+                   team="team_id", opponent="opponent_id", field_reference="neutral")
+
+
+LEAGUES = {
+    # lmer.py's own weighting (w), not nrl/sos/lmer.R's w^2
+    "nrl": _league("nrl", "nrl", "nrl.results", 2025, 2026, 2024, weighting="season"),
+    "club": _league("club", "club", "club.results", 2026, 2026, 2025, competition="competition"),
+    "super_rugby": _league("super_rugby", "sr", "sr.results", 2026, 2026, 2025),
+    "premiership": _league("premiership", "premiership", "premiership.results", 2020, 2021, 2019),
+    "pro14": _league("pro14", "pro14", "pro14.results", 2020, 2021, 2019),
+    # currie_cup/sos/lmer.R reads and writes the club schema
+    "currie_cup": _league("currie_cup", "club", "club.results", 2021, 2022, 2019),
+    "varsity": _league("varsity", "varsity", "varsity.results", 2022, 2022, 2020),
+    "m10": _league("m10", "m10", "m10.results", 2021, 2021, 2020),
+    "bunnings": _league("bunnings", "bunnings", "bunnings.results", 2022, 2022, 2020),
+    "rapid_rugby": _league("rapid_rugby", "rr", "rr.results", 2019, 2020, 2018),
+    "super_league": _league("super_league", "sl", "sl.results", 2026, 2026, 2025),
+    "major_league": _league("major_league", "major_league", "major_league.results", 2025, 2025, 2024),
+    "men": _world_rugby("men", 2022, 2026, 2021),
+    "women": _world_rugby("women", 2023, 2026, 2022),
+    "men_7s": _world_rugby("men_7s", 2021, 2024, 2020),
+    "women_7s": _world_rugby("women_7s", 2021, 2024, 2020),
+    "u20": _world_rugby("u20", 2022, 2025, 2021),
+}
+
+# Overrides of the zinb.R scripts (glmmADMB, fitted by zinb.py)
+ZINB_LEAGUES = {
+    "club": {"min_year": 2021, "max_year": 2023, "reference_year": 2020},
+    "currie_cup": {"min_year": 2018, "max_year": 2021, "reference_year": 2017},
+    "premiership": {"min_year": 2018, "max_year": 2021, "reference_year": 2017},
+    "varsity": {"min_year": 2018, "max_year": 2021, "reference_year": 2017},
+    "major_league": {"min_year": 2018, "max_year": 2023, "reference_year": 2017},
+    "men": {"min_year": 2021, "max_year": 2026, "reference_year": 2020},
+    "women": {"results": "women.women_results", "min_year": 2016, "max_year": 2023, "reference_year": 2015},
+    "men_7s": {"results": "men_7s.men_results", "min_year": 2016, "max_year": 2021, "reference_year": 2015},
+    "women_7s": {"results": "women_7s.women_results", "min_year": 2016, "max_year": 2021, "reference_year": 2015},
+    "u20": {"results": "u20.u20_results", "min_year": 2016, "max_year": 2021, "reference_year": 2015},
+}
+
+# world_rugby is fitted as its five schemas
+LEAGUE_GROUPS = {
+    "world_rugby": ["men", "women", "men_7s", "women_7s", "u20"],
+}
+
+
+def expand_leagues(names):
+    """Resolve league and group names (e.g. 'world_rugby') to LEAGUES keys."""
+    expanded = []
+    for name in names:
+        members = LEAGUE_GROUPS.get(name, [name])
+        for member in members:
+            if member not in LEAGUES:
+                raise KeyError(f"Unknown league '{member}'. Known: {sorted(LEAGUES) + sorted(LEAGUE_GROUPS)}")
+            if member not in expanded:
+                expanded.append(member)
+    return expanded
+
+
+def zinb_league(name):
+    """League settings for the ZINB fit (LEAGUES entry with the zinb.R window)."""
+    if name not in ZINB_LEAGUES:
+        raise KeyError(f"League '{name}' has no ZINB model. Known: {sorted(ZINB_LEAGUES)}")
+    return {**LEAGUES[name], 'weighting': 'season', **ZINB_LEAGUES[name]}
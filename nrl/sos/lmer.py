@@ -1,12 +1,41 @@
 # -----------------------------------------------------------------------------
-# Python Script to Replicate R GLMM Analysis using Pymer4
+# Python Ratings GLMM (native sparse fitter or pymer4/lme4)
 # -----------------------------------------------------------------------------
 # This script fetches rugby data from PostgreSQL, preprocesses it,
-# fits a Generalized Linear Mixed-Effects Model (Poisson) using pymer4
-# (which wraps R's lme4 package), extracts fixed and random effects,
-# and writes the results back to the database.
+# fits a Generalized Linear Mixed-Effects Model (Poisson), extracts fixed
+# and random effects, and writes the results back to the database.
 #
-# !! Requires: R installation, lme4 R package, Python packages below !!
+# --engine native (what sos.sh runs) fits the model in-process with the
+# sparse Laplace fitter in glmm.py (NumPy/SciPy only, no R required);
+# --engine pymer4 (the default here) fits it with lme4's glmer through
+# pymer4/rpy2. compare_glmer.py checks one against the other. Each engine
+# logs to its own diagnostics/glmer_<engine>.log.
+#
+# Any league in leagues.py can be fitted with --league (default nrl); the
+# steps are functions so batch.py can run several leagues in a process pool.
+#
+# A fit whose data, formula and options hash to the value stored in
+# <schema>._fit_cache is skipped: the factor tables are already current
+# (see fitcache.py; --no-cache forces a refit). A preflight query first
+# counts and fingerprints the modeling rows inside PostgreSQL, so runs with
+# no data or an unchanged fit return before the fetch, and pymer4/R (or the
+# native fitter's SciPy stack) is only imported once a fit is actually due.
+#
+# team/opponent/game_id are fitted on stable integer codes (codes.py); the
+# factor tables carry the code next to the display name. Each fit is also
+# saved as <league>/models/<league>/ for prediction without the database
+# (artifact.py).
+#
+# --game-effect collapsed (native engine) drops (1|game_id) and integrates a
+# gamma game effect out analytically instead, so the fit only carries the
+# team effects and one dispersion; --compare-game-effects fits both modes and
+# reports them side by side in diagnostics/game_effects.csv.
+#
+# Wall/CPU time and peak RSS of every stage are appended to
+# <league>/diagnostics/profile.jsonl (see profiling.py; RUGBY_TRACEMALLOC=1
+# adds traced allocations, RUGBY_CPROFILE=fit dumps a cProfile of the fit).
+#
+# !! Requires (pymer4 engine): R installation, lme4 R package, Python packages below !!
 # !! May require setting R_LIBS_USER or R_LIBS_SITE environment variable !!
 # -----------------------------------------------------------------------------
 
@@ -15,41 +44,18 @@ import numpy as np # For checking finite values
 import sqlalchemy
 import logging
 import os
+import argparse
+import time
 from datetime import datetime
 
-# --- Import Pymer4 ---
-# Ensure R and lme4 are installed for this to work
-try:
-    from pymer4.models import Lmer # Lmer handles both lmer and glmer models
-except ImportError:
-    logging.error("pymer4 not found. Please install it (pip install pymer4)")
-    logging.error("Also ensure R is installed and the 'lme4' R package is installed.")
-    raise
-except Exception as e:
-    # Catch potential R interface errors during import
-    logging.error(f"Error importing pymer4, potentially R/rpy2 issue: {e}")
-    logging.error("Ensure R is installed, in PATH, and 'lme4' R package is installed.")
-    logging.error("You might need to set R_LIBS_USER / R_LIBS_SITE environment variables.")
-    raise
-
-# --- Import rpy2 for console redirection (Optional but helpful) ---
-try:
-    import rpy2.robjects as robjects
-    import rpy2.rinterface_lib.callbacks
-    # Redirect R console output to Python logging
-    @rpy2.rinterface_lib.callbacks.consolewrite_print
-    def r_print(s):
-        logging.info(f"R Console: {s.strip()}")
-    @rpy2.rinterface_lib.callbacks.consolewrite_warnerror
-    def r_warn(s):
-        logging.warning(f"R Message: {s.strip()}") # Capture warnings/errors
-    R_OUTPUT_REDIRECTED = True
-except ImportError:
-    logging.warning("rpy2 not found or console redirection failed. R messages might not be fully captured in log.")
-    R_OUTPUT_REDIRECTED = False
-except Exception as e:
-    logging.warning(f"Error setting up rpy2 console redirection: {e}")
-    R_OUTPUT_REDIRECTED = False
+from leagues import LEAGUES, REPO_ROOT
+from profiling import PROFILE_FILE, StageProfiler
+from writer import copy_replace
+from fetch import stream_frame
+from codes import CodeBook, recode
+from weights import compute_weights
+from fitcache import frame_hash, source_key, cached_entry, clear_hash, store_hash
+from artifact import artifact_path, build_artifact, save_artifact
 
 # --- Configuration ---
 DB_NAME = "rugby"
@@ -58,97 +64,201 @@ DB_PASSWORD = ""  # *** REPLACE with your database password ***
 DB_HOST = ""  # Replace with your database host if not local
 DB_PORT = "5432"  # Replace with your database port if not default
 DB_SCHEMA = "nrl"
+CONNECT_TIMEOUT = 10  # seconds; fail fast when the database is unreachable
 DIAGNOSTICS_DIR = "diagnostics"
-# Log file name reflects the package used
-OUTPUT_LOG_FILE = os.path.join(DIAGNOSTICS_DIR, "glmer_pymer4_final.log")
-MIN_YEAR = 2025
-MAX_YEAR = 2026
-REFERENCE_YEAR = 2024 # Used for calculating 'w'
-
-# --- Setup Logging ---
-os.makedirs(DIAGNOSTICS_DIR, exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(OUTPUT_LOG_FILE, mode='w'), # 'w' to overwrite log each run
-        logging.StreamHandler() # Also print logs to console
-    ]
-)
-logging.info(f"--- Starting Python Script using Pymer4 ({datetime.now()}) ---")
-if R_OUTPUT_REDIRECTED:
-    logging.info("R console output will be redirected to this log.")
-
-# --- Database Connection ---
-engine = None # Initialize engine to None for finally block
-try:
+# Log file name reflects the engine used
+LOG_FILES = {engine: os.path.join(DIAGNOSTICS_DIR, f"glmer_{engine}.log") for engine in ["pymer4", "native"]}
+
+# Formula using R-style syntax with DataFrame column names
+MODEL_FORMULA = "gs ~ field + (1|team) + (1|opponent) + (1|game_id)"
+# Collapsed mode (native engine): the game effect is integrated out as a gamma
+# frailty shared by both scores of a game, leaving only the team effects and
+# a dispersion alpha (glmm.py family 'negmultinom')
+COLLAPSED_FORMULA = "gs ~ field + (1|team) + (1|opponent)"
+GAME_EFFECTS = {'random': (MODEL_FORMULA, 'poisson'), 'collapsed': (COLLAPSED_FORMULA, 'negmultinom')}
+
+# Mapping from internal column names to the parameter names used by normalize_factors.sql
+FACTOR_NAME_MAP = {
+    'game_id': 'game_id',   # Keep game_id as is
+    'opponent': 'defense',  # Map opponent to defense
+    'team': 'offense',   # Map team to offense
+    'field': 'field'      # Add mapping for field to itself
+    # Add mappings for any other parameters if necessary
+}
+
+# Columns fetched as integer-coded categoricals (like R factors)
+FACTOR_COLUMNS = ['field', 'team', 'opponent', 'game_id']
+
+# Declared dtypes of the other fetched columns (every chunk is cast to them)
+COLUMN_DTYPES = {'year': np.int64, 'gs': np.float64, 'w': np.float64, 'game_date': 'datetime64[D]'}
+
+# Which internal columns are fixed/random for the _parameter_levels table
+PARAMETER_TYPES = {'field': 'fixed', 'team': 'random', 'opponent': 'random', 'game_id': 'random'}
+
+
+def import_pymer4():
+    """Import pymer4's Lmer and redirect R console output to logging."""
+    # --- Import Pymer4 ---
+    # Ensure R and lme4 are installed for this to work
+    try:
+        from pymer4.models import Lmer # Lmer handles both lmer and glmer models
+    except ImportError:
+        logging.error("pymer4 not found. Please install it (pip install pymer4)")
+        logging.error("Also ensure R is installed and the 'lme4' R package is installed.")
+        raise
+    except Exception as e:
+        # Catch potential R interface errors during import
+        logging.error(f"Error importing pymer4, potentially R/rpy2 issue: {e}")
+        logging.error("Ensure R is installed, in PATH, and 'lme4' R package is installed.")
+        logging.error("You might need to set R_LIBS_USER / R_LIBS_SITE environment variables.")
+        raise
+
+    # --- Import rpy2 for console redirection (Optional but helpful) ---
+    try:
+        import rpy2.robjects as robjects
+        import rpy2.rinterface_lib.callbacks
+        # Redirect R console output to Python logging
+        @rpy2.rinterface_lib.callbacks.consolewrite_print
+        def r_print(s):
+            logging.info(f"R Console: {s.strip()}")
+        @rpy2.rinterface_lib.callbacks.consolewrite_warnerror
+        def r_warn(s):
+            logging.warning(f"R Message: {s.strip()}") # Capture warnings/errors
+        logging.info("R console output will be redirected to this log.")
+    except ImportError:
+        logging.warning("rpy2 not found or console redirection failed. R messages might not be fully captured in log.")
+    except Exception as e:
+        logging.warning(f"Error setting up rpy2 console redirection: {e}")
+    return Lmer
+
+
+def setup_logging(log_file):
+    """Log to log_file (overwritten each run) and the console."""
+    os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file, mode='w'), # 'w' to overwrite log each run
+            logging.StreamHandler() # Also print logs to console
+        ]
+    )
+
+
+def connect():
+    """Create and test the SQLAlchemy engine."""
     # Using psycopg2 driver (ensure it's installed: pip install psycopg2 or psycopg2-binary)
     db_url = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-    engine = sqlalchemy.create_engine(db_url)
+    engine = sqlalchemy.create_engine(db_url, connect_args={'connect_timeout': CONNECT_TIMEOUT})
     # Test connection (optional but recommended)
     with engine.connect() as connection:
         logging.info(f"Successfully connected to database '{DB_NAME}' on {DB_HOST}:{DB_PORT}")
+    return engine
 
-except Exception as e:
-    logging.error(f"Database connection failed: {e}")
-    # No point continuing if DB connection fails
-    raise SystemExit(f"FATAL: Database connection failed - {e}")
 
-
-# --- Main Processing Block ---
-try:
-    # --- Fetch Data ---
-    query = f"""
+def modeling_query(league):
+    """SELECT of the modeling rows for a league (see leagues.py for the settings)."""
+    # Each game's competition, for leagues fitted jointly across competitions (joint.py)
+    competition = f"r.{league['competition']} AS competition," if league.get('competition') else ""
+    return f"""
     SELECT
         DISTINCT -- Ensure unique rows if source data might have duplicates per game
         r.game_id,
         r.year,
         r.field AS field,
-        r.team_name AS team,         -- Aliased for Python DataFrame
-        r.opponent_name AS opponent, -- Aliased for Python DataFrame
+        r.{league['team']} AS team,         -- Aliased for Python DataFrame
+        r.{league['opponent']} AS opponent, -- Aliased for Python DataFrame
         r.team_score::float AS gs,   -- Target variable
-        (r.year - {REFERENCE_YEAR}) AS w -- Weight column 'w'
-    FROM {DB_SCHEMA}.results r
+        r.game_date,                 -- For recency weights (weights.py)
+        {competition}
+        (r.year - {league['reference_year']}) AS w -- Weight column 'w' (season step)
+    FROM {league['results']} r
     WHERE
-        r.year BETWEEN {MIN_YEAR} AND {MAX_YEAR}
+        r.year BETWEEN {league['min_year']} AND {league['max_year']}
+    """
+
+
+def preflight(engine, league, options):
+    """
+    Row count and fingerprint of the modeling rows, computed in the database.
+
+    Returns (rows, key) where key is source_key() of an md5 over the sorted
+    row texts, so an unchanged data set can be recognized without fetching it.
+    """
+    query = f"""
+    SELECT
+        count(*) AS n,
+        md5(string_agg(row_text, ',' ORDER BY row_text)) AS fingerprint
+    FROM (
+        SELECT concat_ws('|', q.game_id, q.year, q.field, q.team, q.opponent, q.gs, q.game_date, q.w) AS row_text
+        FROM ({modeling_query(league)}) q
+    ) modeling_rows
+    """
+    with engine.connect() as connection:
+        n, fingerprint = connection.execute(sqlalchemy.text(query)).one()
+    key = source_key(fingerprint, MODEL_FORMULA, options) if n else None
+    logging.info(f"Preflight: {n} modeling rows, source key {key[:12] if key else None}")
+    return n, key
+
+
+def fetch_data(engine, league, since=None):
+    """
+    Fetch the modeling rows for a league (see leagues.py for the settings).
+
+    w is recomputed from game_date/year with the league's weighting kernel
+    (weights.py); 'season' reproduces the SQL column, 'season_squared' the
+    weight lmer.R fits with. since (a date) keeps only the games dated after
+    it, e.g. the results online.py has not applied yet.
+    """
+    after = f"AND r.game_date > '{since}'" if since is not None else ""
+    query = modeling_query(league) + f"""
+    {after}
     ORDER BY r.game_id -- Optional: Ensure consistent order if needed downstream
     """
     logging.info("Fetching data from database...")
-    sg = pd.read_sql_query(query, engine)
+    # Server-side cursor, streamed straight into integer-coded categoricals
+    sg = stream_frame(engine, query, categorical=FACTOR_COLUMNS + (['competition'] if league.get('competition') else []),
+                      dtypes=COLUMN_DTYPES)
     logging.info(f"Fetched data shape: {sg.shape}")
-    if sg.empty:
-        logging.warning("Query returned no data. Exiting.")
-        # Use SystemExit for clearer exit reason than quit()
-        raise SystemExit("No data fetched from database.")
+    if not sg.empty:
+        sg['w'] = compute_weights(sg, league)
+        logging.info(f"Weights ({league.get('weighting') or 'season'}): min {sg['w'].min():.4g}, "
+                     f"max {sg['w'].max():.4g}, effective games {sg['w'].sum():.1f} of {len(sg)} rows")
+    return sg
+
 
-    # --- Data Preprocessing ---
+def preprocess(sg):
+    """
+    Categorical factors, finite checks and positive-weight filtering.
+
+    fetch_data() already delivers the factor columns as categoricals
+    (team/opponent/game_id with integer-code levels after recode()), so
+    this only validates; the frame is modified in place and copied only if
+    rows have to be dropped. The pymer4 engine gets string levels from
+    string_levels().
+    """
     logging.info("Preprocessing data...")
-    g = sg.copy() # Work on a copy
-
-    # --- Convert ID columns to strings BEFORE category conversion ---
-    # This avoids the rpy2 warning about converting numeric categories
-    id_cols = ['game_id', 'team', 'opponent']
-    for col in id_cols:
-        if col in g.columns:
-            if not pd.api.types.is_string_dtype(g[col]) and not pd.api.types.is_object_dtype(g[col]):
-                 logging.info(f"Converting column '{col}' to string type before category conversion for R compatibility.")
-                 g[col] = g[col].astype(str)
-
-    # --- Convert relevant columns to categorical type (like R factors) ---
-    factor_cols = ['field', 'team', 'opponent', 'game_id']
-    for col in factor_cols:
-        if col in g.columns:
-            g[col] = g[col].astype('category')
-            logging.info(f"Converted column '{col}' to category.")
-        else:
-             logging.warning(f"Factor column '{col}' not found in fetched data.")
+    g = sg
+
+    # --- Factor columns as categoricals (like R factors) ---
+    for col in FACTOR_COLUMNS:
+        if col not in g.columns:
+            logging.warning(f"Factor column '{col}' not found in fetched data.")
+        elif not isinstance(g[col].dtype, pd.CategoricalDtype):
+            logging.info(f"Converting column '{col}' to category.")
+            g[col] = g[col].astype(str).astype('category')
 
     # --- Ensure numeric types for target and weights ---
-    g['gs'] = pd.to_numeric(g['gs'])
-    g['w'] = pd.to_numeric(g['w'])
+    for col in ['gs', 'w']:
+        if not pd.api.types.is_numeric_dtype(g[col]):
+            g[col] = pd.to_numeric(g[col])
 
     # --- Check for non-finite values in critical columns ---
-    if not np.isfinite(g[['gs', 'w']].values).all():
+    if not (np.isfinite(g['gs'].to_numpy(np.float64)).all() and np.isfinite(g['w'].to_numpy(np.float64)).all()):
         logging.error("Non-finite values (NaN or +/- Infinity) found in 'gs' or 'w' columns. Cannot proceed.")
         # This is usually a fatal data quality issue for modeling
         raise ValueError("Non-finite values detected in 'gs' or 'w'. Check source data.")
@@ -157,52 +267,78 @@ try:
 
     # --- Filter out rows with non-positive weights ---
     # lme4 weights typically must be positive
-    initial_rows = len(g)
-    g_filtered = g[g['w'] > 0].copy()
-    rows_filtered = initial_rows - len(g_filtered)
+    positive = (g['w'] > 0).to_numpy()
+    rows_filtered = int(len(g) - positive.sum())
     if rows_filtered > 0:
+        g_filtered = g[positive].copy()
+        for col in FACTOR_COLUMNS:
+            if col in g_filtered.columns:
+                g_filtered[col] = g_filtered[col].cat.remove_unused_categories()
         logging.warning(f"Removed {rows_filtered} rows with non-positive weights ('w' column <= 0).")
+    else:
+        g_filtered = g
     if g_filtered.empty:
         logging.error("No data remaining after filtering for positive weights. Cannot fit model.")
         raise ValueError("No data with positive weights.")
     logging.info(f"Using {len(g_filtered)} rows for model fitting after weight filtering.")
+    return g_filtered
+
+
+def string_levels(g_filtered):
+    """
+    Shallow copy of g_filtered whose categorical columns have string levels.
+
+    rpy2 warns about (and pymer4 may mishandle) categoricals with numeric
+    levels, such as the integer codes of team/opponent/game_id, so the
+    pymer4 engine gets them as strings. Only the categories are converted;
+    the per-row codes are shared with g_filtered.
+    """
+    g = g_filtered.copy(deep=False)
+    for col in g.columns:
+        if isinstance(g[col].dtype, pd.CategoricalDtype) and not pd.api.types.is_string_dtype(g[col].cat.categories):
+            g[col] = g[col].cat.rename_categories(g[col].cat.categories.astype(str))
+    return g
+
 
-    # --- Ensure factor_name_map is defined before this section ---
-    # (It was defined just before the results extraction in the previous version)
-    factor_name_map = {
-        'game_id': 'game_id',   # Keep game_id as is
-        'opponent': 'defense',  # Map opponent to defense
-        'team': 'offense',   # Map team to offense
-        'field': 'field'      # Add mapping for field to itself
-        # Add mappings for any other parameters if necessary
-    }
-    logging.info(f"Using factor name map for parameter levels: {factor_name_map}")
+def write_parameter_levels(engine, schema, g_filtered, table='_parameter_levels', parameter_types=PARAMETER_TYPES,
+                           codebook=None):
+    """
+    Write the factor levels used in the fit to <schema>.<table> (default _parameter_levels).
 
+    With a codebook the coded columns' categories are their integer codes:
+    they go to the 'code' column and the names to 'level'.
+    """
+    logging.info(f"Using factor name map for parameter levels: {FACTOR_NAME_MAP}")
 
     # --- Prepare and Write Parameter Levels ---
     logging.info("Extracting parameter levels...")
     param_levels_list = []
     # Define which internal columns map to fixed/random conceptually for type assignment
-    parameter_type_map = {'field': 'fixed', 'team': 'random', 'opponent': 'random', 'game_id': 'random'}
+    parameter_type_map = parameter_types
 
     # Iterate through the internal column names and their types
     for internal_col_name, param_type in parameter_type_map.items():
         # Check if the column exists in the data used for modeling (g_filtered)
-        if internal_col_name in g_filtered.columns and pd.api.types.is_categorical_dtype(g_filtered[internal_col_name]):
+        if internal_col_name in g_filtered.columns and isinstance(g_filtered[internal_col_name].dtype, pd.CategoricalDtype):
             # Get the unique levels (categories) from the filtered data
             levels = g_filtered[internal_col_name].cat.categories.tolist()
             if levels: # Proceed only if there are levels
                 # --- Apply mapping to get the desired parameter name for the output table ---
-                output_parameter_name = factor_name_map.get(internal_col_name, internal_col_name) # Default to internal name if not in map
+                output_parameter_name = FACTOR_NAME_MAP.get(internal_col_name, internal_col_name) # Default to internal name if not in map
                 if output_parameter_name != internal_col_name:
                     logging.info(f"Mapping internal column '{internal_col_name}' to parameter '{output_parameter_name}' for levels table.")
                 # --- End mapping ---
 
                 # Create DataFrame for this parameter's levels
+                codes = pd.array([pd.NA] * len(levels), dtype='Int64')
+                if codebook is not None and pd.api.types.is_integer_dtype(g_filtered[internal_col_name].cat.categories):
+                    codes = pd.array(levels, dtype='Int64')
+                    levels = codebook.level_names(internal_col_name, levels)
                 df_levels = pd.DataFrame({
                     'parameter': output_parameter_name, # Use the mapped name here
                     'type': param_type,                 # Use the type defined in parameter_type_map
-                    'level': levels                     # List of unique levels for this parameter
+                    'level': levels,                    # List of unique levels for this parameter
+                    'code': codes,                      # Integer code (coded columns only)
                 })
                 param_levels_list.append(df_levels)
             else:
@@ -214,20 +350,17 @@ try:
 
     if param_levels_list:
         parameter_levels = pd.concat(param_levels_list, ignore_index=True)
+        if codebook is None:
+            parameter_levels = parameter_levels.drop(columns='code')
         # Optional: Sort for consistent output order, matching desired example
         parameter_levels.sort_values(by=['parameter', 'level'], inplace=True)
         logging.info(f"Parameter levels DataFrame shape: {parameter_levels.shape}")
         logging.info("Parameter levels head:\n" + parameter_levels.head().to_string()) # Log head
 
         try:
-            logging.info(f"Writing parameter levels to database table {DB_SCHEMA}._parameter_levels...")
-            parameter_levels.to_sql(
-                name='_parameter_levels',
-                con=engine,
-                schema=DB_SCHEMA,
-                if_exists='replace', # Overwrite table if it exists
-                index=False          # Do not write pandas index
-            )
+            logging.info(f"Writing parameter levels to database table {schema}.{table}...")
+            # COPY into a staging table and swap it in (replaces the table, no VACUUM needed)
+            copy_replace(engine, parameter_levels, schema, table)
             logging.info("Successfully wrote parameter levels.")
         except Exception as e:
             logging.error(f"Failed to write parameter levels: {e}")
@@ -236,28 +369,73 @@ try:
     else:
         logging.warning("No categorical parameter levels found to write.")
 
-    # --- Define and Fit Model using Pymer4 ---
-    # ... (The rest of the script, including model fitting and results extraction, follows) ...
 
-    # --- Define and Fit Model using Pymer4 ---
-    logging.info("Defining and fitting the GLMM using Pymer4...")
+def fit_model(g_filtered, engine_name, engine, league, cold_start=False, game_effect='random'):
+    """Fit the GLMM; returns (model, cold_evals) where cold_evals is None for pymer4."""
+    schema = league['schema']
+    formula, family = GAME_EFFECTS[game_effect]
+    if game_effect != 'random' and engine_name != "native":
+        raise ValueError(f"Game effect mode '{game_effect}' needs the native engine.")
 
-    # Formula using R-style syntax with DataFrame column names
-    model_formula = "gs ~ field + (1|team) + (1|opponent) + (1|game_id)"
-    logging.info(f"Model formula: {model_formula}")
+    # --- Define and Fit Model using Pymer4 (or the native sparse fitter) ---
+    logging.info(f"Defining and fitting the GLMM using engine '{engine_name}'...")
+    logging.info(f"Model formula: {formula} (family {family})")
 
-    # Initialize the Lmer model
+    # Initialize the Lmer model (SparseGlmer exposes the same coefs/ranef attributes)
     # Using g_filtered which has positive weights and correct dtypes
-    model = Lmer(model_formula, data=g_filtered, family='poisson')
+    if engine_name == "native":
+        from glmm import SparseGlmer, start_from_factors
+        reference = {'field': league['field_reference']} if league['field_reference'] else None
+        model = SparseGlmer(formula, data=g_filtered, family=family, reference=reference)
+    else:
+        Lmer = import_pymer4()
+        model = Lmer(MODEL_FORMULA, data=string_levels(g_filtered), family='poisson')
+
+    # --- Warm Start from the Previous Fit (native engine) ---
+    # sos.sh no longer drops _basic_factors before the fit, so the last stored
+    # estimates (including the 'structural' sd rows) seed this one.
+    start = None
+    previous_cold_evals = None
+    if engine_name == "native" and not cold_start:
+        try:
+            previous = pd.read_sql_query(f"SELECT * FROM {schema}._basic_factors", engine)
+            start = start_from_factors(previous, {'offense': 'team', 'defense': 'opponent'})
+            cold_rows = previous[(previous['factor'] == 'optimizer') & (previous['level'] == 'cold_evaluations')]
+            if not cold_rows.empty:
+                previous_cold_evals = int(cold_rows['estimate'].iloc[0])
+            logging.info(f"Warm start from {schema}._basic_factors: {len(start['beta'])} fixed, "
+                         f"{sum(len(v) for v in start['ranef'].values())} random levels, "
+                         f"variance components {start['theta']}")
+        except Exception as e:
+            logging.info(f"No previous fit available for a warm start ({e.__class__.__name__}); fitting from scratch.")
+            start = None
 
     # Fit the model
     logging.info("Starting model fit (this may take time)...")
     # Pass weights column name; verbose=True shows R output
-    model.fit(weights='w', verbose=True, summarize=False) # summarize=False recommended by pymer4 docs
+    cold_evals = None
+    if engine_name == "native":
+        model.fit(weights='w', verbose=True, summarize=False, start=start)
+        if model.warm_started:
+            if previous_cold_evals:
+                saved = 100.0 * (1.0 - model.n_evals / previous_cold_evals)
+                logging.info(f"Warm-started fit used {model.n_evals} deviance evaluations vs {previous_cold_evals} for the last cold fit ({saved:.0f}% saved).")
+            else:
+                logging.info(f"Warm-started fit used {model.n_evals} deviance evaluations (no cold-fit count stored to compare).")
+            cold_evals = previous_cold_evals
+        else:
+            logging.info(f"Cold fit used {model.n_evals} deviance evaluations.")
+            cold_evals = model.n_evals
+    else:
+        model.fit(weights='w', verbose=True, summarize=False) # summarize=False recommended by pymer4 docs
     logging.info("Model fitting complete.")
+    return model, cold_evals
+
 
+def log_summary(model):
+    """Log the model summary, falling back to raw attributes."""
     # --- Log Model Summary ---
-    logging.info("--- Model Fit Summary (from Pymer4) ---")
+    logging.info("--- Model Fit Summary ---")
     try:
         # model.summary() usually provides the formatted summary
         summary_output = model.summary()
@@ -286,155 +464,377 @@ try:
     logging.info("--- End Model Fit Summary ---")
 
 
+def extract_results(model, cold_evals=None, codebook=None):
+    """
+    Fixed effects, random effects and variance components as a _basic_factors frame.
+
+    Each block is taken as whole arrays and concatenated once into a
+    column-oriented frame; the factor column is built from integer codes and
+    renamed through FACTOR_NAME_MAP as a categorical, so the cost does not
+    grow with per-level Python work (game_id has one level per game).
+
+    With a codebook the random-effect levels are integer codes: they are
+    written to a 'code' column and 'level' gets the names.
+    """
     # --- Extract and Format Results ---
     logging.info("Extracting model results (Fixed and Random Effects)...")
-    results_list = []
-    # Define the random factor names IN THE ORDER THEY APPEAR IN THE FORMULA
+    # Define the random factor names IN THE ORDER THEY APPEAR IN model.ranef
     # These are the names based on the DataFrame columns / pymer4 formula
-    ranef_factors_internal = ['game_id', 'opponent', 'team']
-    # Define mapping from internal names to desired output names for the factor column
-    factor_name_map = {
-        'game_id': 'game_id',   # game_id maps to itself
-        'opponent': 'defense',  # Map 'opponent' factor to 'defense'
-        'team': 'offense'   # Map 'team' factor to 'offense'
-    }
+    # (the native engine reports its own order in model.ranef_names)
+    ranef_factors_internal = list(getattr(model, 'ranef_names', ['game_id', 'opponent', 'team']))
+    # Mapping from internal names to desired output names for the factor column
+    factor_name_map = FACTOR_NAME_MAP
     logging.info(f"Using factor name map for random effects: {factor_name_map}")
 
+    # Column blocks: factor name (internal), type, level, estimate
+    factor_names, factor_blocks, type_blocks, level_blocks, estimate_blocks = [], [], [], [], []
+    code_blocks = []
+
+    def add_block(names, param_type, levels, estimates, codes=None):
+        # names is one internal factor name per row (array) or a single name for the block
+        names = np.broadcast_to(np.asarray(names, dtype=object), (len(levels),))
+        for name in pd.unique(names):
+            if name not in factor_names:
+                factor_names.append(name)
+        factor_blocks.append(names)
+        type_blocks.append(np.full(len(levels), param_type, dtype=object))
+        level_blocks.append(np.asarray(levels, dtype=object))
+        estimate_blocks.append(np.asarray(estimates, dtype=np.float64))
+        code_blocks.append(np.full(len(levels), np.nan) if codes is None else np.asarray(codes, dtype=np.float64))
+
     # --- Fixed Effects ---
-    # Try using model.coefs, which should hold the fixed effects summary table
-    if hasattr(model, 'coefs') and model.coefs is not None:
-        coefs_data = model.coefs
-        logging.info(f"Attempting to process model.coefs. Type: {type(coefs_data)}")
-        if isinstance(coefs_data, pd.DataFrame):
-            logging.info("model.coefs is a DataFrame. Extracting estimates.")
-            for level, row in coefs_data.iterrows():
-                # Use .get() for safer access, default to NaN if 'Estimate' missing
-                estimate = row.get('Estimate', float('nan'))
-                if pd.isna(estimate):
-                    logging.warning(f"Could not find 'Estimate' column in coefs DataFrame row for level '{level}'.")
-
-                # Set 'factor' column equal to 'level' column for fixed effects per user request
-                factor = level
-
-                results_list.append({
-                    'factor': factor,  # Use the level name directly
-                    'type': 'fixed',
-                    'level': level,    # Original level name from index
-                    'estimate': estimate
-                })
-            logging.info(f"Extracted {len(coefs_data)} fixed effect(s) from model.coefs.")
-        else:
-            logging.warning(f"model.coefs was not a DataFrame (Actual Type: {type(coefs_data)}). Cannot extract fixed effects reliably this way.")
-            logging.warning(f"Contents of model.coefs: {str(coefs_data)}")
+    # model.coefs holds the fixed effects summary table; factor equals level for fixed effects
+    coefs_data = getattr(model, 'coefs', None)
+    if isinstance(coefs_data, pd.DataFrame) and 'Estimate' in coefs_data.columns:
+        fixed_levels = coefs_data.index.astype(str).to_numpy(dtype=object)
+        add_block(fixed_levels, 'fixed', fixed_levels, coefs_data['Estimate'].to_numpy(dtype=np.float64))
+        logging.info(f"Extracted {len(coefs_data)} fixed effect(s) from model.coefs.")
     else:
-        logging.warning("Could not find fixed effects attribute 'coefs' on the model object. Unable to extract fixed effects.")
+        logging.warning(f"model.coefs is missing or not a DataFrame with an 'Estimate' column (Actual Type: {type(coefs_data)}). Unable to extract fixed effects.")
         # Log the problematic fixef attribute again if it exists, for reference
-        if hasattr(model, 'fixef') and model.fixef is not None:
-             logging.warning(f"model.fixef (which was problematic) Type: {type(model.fixef)}. Contents: {str(model.fixef)}")
-
+        if getattr(model, 'fixef', None) is not None:
+             logging.warning(f"model.fixef Type: {type(model.fixef)}. Contents: {str(model.fixef)}")
 
     # --- Random Effects ---
-    # Process model.ranef expecting a LIST of DataFrames [game_id_df, opponent_df, team_df]
-    if hasattr(model, 'ranef') and model.ranef is not None:
-        ranef_data = model.ranef
-        logging.info(f"Attempting to process model.ranef. Type: {type(ranef_data)}")
-
-        if isinstance(ranef_data, list):
-            # Check if list length matches the number of random factors expected
-            if len(ranef_data) == len(ranef_factors_internal):
-                logging.info(f"model.ranef is a list with expected length {len(ranef_factors_internal)}. Processing elements.")
-                num_ranef_extracted = 0
-                # Iterate through the list and the *internal* factor names
-                for i, internal_factor_name in enumerate(ranef_factors_internal):
-                    df = ranef_data[i]
-                    logging.info(f"Processing ranef element {i} for internal factor '{internal_factor_name}'. Type: {type(df)}")
-                    # Check if the element is a DataFrame and has the intercept column
-                    if isinstance(df, pd.DataFrame) and '(Intercept)' in df.columns:
-                        param_type = 'random'
-                        # Apply the mapping to get the desired output factor name
-                        output_factor_name = factor_name_map.get(internal_factor_name, internal_factor_name) # Use internal name if no map found
-                        if output_factor_name != internal_factor_name:
-                             logging.info(f"Mapped internal factor '{internal_factor_name}' to output factor '{output_factor_name}'.")
-
-                        # Iterate through the levels (index) and estimates in this DataFrame
-                        for level, row in df.iterrows():
-                            # Use .get() for safety, default to NaN
-                            estimate = row.get('(Intercept)', float('nan'))
-                            if pd.isna(estimate):
-                                logging.warning(f"Could not find '(Intercept)' value in ranef DataFrame for factor '{internal_factor_name}', level '{level}'.")
-
-                            results_list.append({
-                                'factor': output_factor_name, # Use the mapped name for the output table
-                                'type': param_type,
-                                'level': level, # This is the specific level (e.g., game ID, team name)
-                                'estimate': estimate
-                            })
-                            num_ranef_extracted += 1
-                        logging.info(f"Extracted {len(df)} levels for random effect corresponding to '{internal_factor_name}'.")
-                    else:
-                        # Log if an element in the list is not the expected DataFrame structure
-                        logging.warning(f"Element {i} in model.ranef list (expected for factor '{internal_factor_name}') is not a DataFrame with '(Intercept)' column.")
-                        logging.warning(f"Contents of element {i}: {str(df)}")
-                logging.info(f"Finished processing ranef list. Total random effect levels extracted: {num_ranef_extracted}")
+    # model.ranef is a LIST of DataFrames with an '(Intercept)' column, one per grouping factor
+    ranef_data = getattr(model, 'ranef', None)
+    if isinstance(ranef_data, list) and len(ranef_data) == len(ranef_factors_internal):
+        num_ranef_extracted = 0
+        for internal_factor_name, df in zip(ranef_factors_internal, ranef_data):
+            if isinstance(df, pd.DataFrame) and '(Intercept)' in df.columns:
+                estimates = df['(Intercept)'].to_numpy(dtype=np.float64)
+                if codebook is not None:
+                    # Levels are codes (R hands them back as strings)
+                    codes = pd.to_numeric(np.asarray(df.index)).astype(np.int64)
+                    add_block(internal_factor_name, 'random', codebook.level_names(internal_factor_name, codes), estimates, codes)
+                else:
+                    add_block(internal_factor_name, 'random', df.index.astype(str), estimates)
+                num_ranef_extracted += len(df)
+                logging.info(f"Extracted {len(df)} levels for random effect corresponding to '{internal_factor_name}'.")
             else:
-                # Log if the list length is wrong
-                logging.warning(f"model.ranef is a list, but its length ({len(ranef_data)}) does not match the expected number of random factors ({len(ranef_factors_internal)}). Cannot reliably process.")
-                logging.warning(f"Contents of model.ranef list: {str(ranef_data)}")
-        else:
-            # Log if model.ranef is not a list (and also not a dict, handled previously)
-            logging.warning(f"Unexpected type for model.ranef: {type(ranef_data)}. Cannot extract random effects.")
-            logging.warning(f"Contents of model.ranef: {str(ranef_data)}")
+                # Log if an element in the list is not the expected DataFrame structure
+                logging.warning(f"model.ranef element for factor '{internal_factor_name}' is not a DataFrame with '(Intercept)' column: {str(df)}")
+        logging.info(f"Finished processing ranef list. Total random effect levels extracted: {num_ranef_extracted}")
+    elif isinstance(ranef_data, list):
+        logging.warning(f"model.ranef is a list, but its length ({len(ranef_data)}) does not match the expected number of random factors ({len(ranef_factors_internal)}). Cannot reliably process.")
     else:
-         # Log if the .ranef attribute doesn't even exist
-         logging.warning("Could not find random effects attribute ('ranef') on the model object.")
-
+        logging.warning(f"Unexpected or missing model.ranef (Type: {type(ranef_data)}). Cannot extract random effects.")
+
+    # --- Variance Components ---
+    # Stored as 'structural' rows (like pz/alpha in zinb.R) so the next run can warm start;
+    # normalize_factors.sql only joins 'fixed' and 'random' rows.
+    ranef_var = getattr(model, 'ranef_var', None)
+    if isinstance(ranef_var, pd.DataFrame) and 'Std' in ranef_var.columns:
+        std = ranef_var['Std'][ranef_var.index.isin(ranef_factors_internal)]
+        add_block(std.index.to_numpy(dtype=object), 'structural', np.full(len(std), 'sd', dtype=object), std.to_numpy(dtype=np.float64))
+    # Family parameters (alpha, pz) as the structural rows of zinb.R
+    extra = getattr(model, 'extra', None) or {}
+    for name, value in extra.items():
+        add_block(name, 'structural', [name], [float(value)])
+    if cold_evals:
+        add_block('optimizer', 'structural', ['cold_evaluations'], [float(cold_evals)])
+    # Date of the latest game in the fit (days since 1970-01-01), so online.py
+    # knows which results the factors already hold whatever the game effect
+    data = getattr(model, 'data', None)
+    if isinstance(data, pd.DataFrame) and 'game_date' in data.columns:
+        w = getattr(model, 'w', None)
+        if w is None or len(w) != len(data):
+            w = data['w'].to_numpy(np.float64) if 'w' in data.columns else np.ones(len(data))
+        dates = data['game_date'].to_numpy('datetime64[D]')[np.asarray(w) > 0]
+        if len(dates):
+            add_block('data', 'structural', ['fitted_through'], [float(dates.max().astype(np.int64))])
 
     # --- Check if any results were successfully extracted ---
-    if not results_list:
+    if not estimate_blocks:
          # Make error more specific based on potential failure points logged above
          logging.error("Failed to extract valid fixed effects (from model.coefs) or random effects (from model.ranef list). Check logs for details on object structures.")
          raise ValueError("Result extraction failed due to unexpected model object attribute structure.")
-    else:
-         logging.info(f"Successfully extracted {len(results_list)} total factor level estimates into results_list.")
-
 
-    # --- Write Combined Results to Database ---
     logging.info("Preparing combined DataFrame for database export...")
-    combined = pd.DataFrame(results_list)
-    # Optional: Reorder columns to exactly match desired output if needed
-    combined = combined[['factor', 'type', 'level', 'estimate']]
+    # Factor names become codes once, then the output names are a categorical remap
+    factor = pd.Categorical(np.concatenate(factor_blocks), categories=factor_names)
+    factor = factor.rename_categories([factor_name_map.get(name, name) for name in factor_names])
+    combined = pd.DataFrame({
+        'factor': factor,
+        'type': pd.Categorical(np.concatenate(type_blocks), categories=['fixed', 'random', 'structural']),
+        'level': np.concatenate(level_blocks),
+        'estimate': np.concatenate(estimate_blocks),
+    })
+    if codebook is not None:
+        combined.insert(3, 'code', pd.array(np.concatenate(code_blocks), dtype='Int64'))
+    missing = int(combined['estimate'].isna().sum())
+    if missing:
+        logging.warning(f"{missing} extracted estimate(s) are missing (NaN).")
+    logging.info(f"Successfully extracted {len(combined)} total factor level estimates.")
     logging.info(f"Combined results DataFrame shape: {combined.shape}")
     # Log head and tail to verify structure before writing
     logging.info("Combined results head:\n" + combined.head().to_string())
     logging.info("Combined results tail:\n" + combined.tail().to_string())
+    return combined
 
-    logging.info(f"Writing combined results to database table {DB_SCHEMA}._basic_factors...")
-    combined.to_sql(
-        name='_basic_factors',
-        con=engine,
-        schema=DB_SCHEMA,
-        if_exists='replace', # Overwrite table if it exists
-        index=False          # Do not write pandas index as a column
-    )
+
+def write_results(engine, schema, combined, table='_basic_factors'):
+    """Write the combined estimates to <schema>.<table> (default _basic_factors)."""
+    # --- Write Combined Results to Database ---
+    logging.info(f"Writing combined results to database table {schema}.{table}...")
+    # COPY into a staging table and swap it in (replaces the table, no VACUUM needed)
+    copy_replace(engine, combined, schema, table)
     logging.info("Successfully wrote combined results.")
     logging.info("Results extraction and writing complete.")
 
-# --- Global Error Handling & Cleanup ---
-except Exception as e:
-    # Catch any exceptions not handled within the main block
-    logging.error(f"An unexpected error occurred: {e}")
-    import traceback
-    logging.error(traceback.format_exc()) # Log the full traceback
-
-finally:
-    # --- Clean Up ---
-    logging.info("Closing database connection if open.")
-    if engine: # Check if engine was successfully created
-        engine.dispose()
-        logging.info("Database connection closed.")
-    else:
-        logging.info("Database engine was not created.")
-    logging.info(f"--- Python Script Finished ({datetime.now()}) ---")
 
-# --- End of script ---
+def compare_game_effects(g_filtered, league):
+    """
+    Fit the random and collapsed game-effect modes cold (native engine) and
+    report them side by side: fit time, size, likelihood and how closely the
+    team estimates agree. Returns (summary, teams) DataFrames.
+    """
+    from glmm import SparseGlmer
+    reference = {'field': league['field_reference']} if league['field_reference'] else None
+    models, rows = {}, []
+    for mode, (formula, family) in GAME_EFFECTS.items():
+        model = SparseGlmer(formula, data=g_filtered, family=family, reference=reference)
+        started = time.perf_counter()
+        model.fit(weights='w')
+        models[mode] = model
+        sd = dict(zip(model.ranef_names, model.theta))
+        rows.append({
+            'mode': mode,
+            'family': family,
+            'random_effects': int(model.block_sizes.sum()),
+            'parameters': len(model.beta) + len(model.theta) + len(model.extra),
+            'evaluations': model.n_evals,
+            'seconds': time.perf_counter() - started,
+            'logLik': model.logLike,
+            'AIC': model.AIC,
+            'intercept': model.beta[0],
+            # Gamma frailty of size alpha ~ log-normal game effect of variance log(1 + 1/alpha)
+            'sd_game': sd['game_id'] if 'game_id' in sd else np.sqrt(np.log1p(1.0 / model.extra['alpha'])),
+        })
+    summary = pd.DataFrame(rows).set_index('mode')
+    summary['speedup'] = summary.loc['random', 'seconds'] / summary['seconds']
+
+    teams = []
+    for group in ['team', 'opponent']:
+        effects = [models[mode].ranef[models[mode].ranef_names.index(group)]['(Intercept)'].rename(mode)
+                   for mode in GAME_EFFECTS]
+        frame = pd.concat(effects, axis=1)
+        frame.insert(0, 'factor', FACTOR_NAME_MAP[group])
+        teams.append(frame)
+    teams = pd.concat(teams).rename_axis('level').reset_index()
+    teams['difference'] = teams['collapsed'] - teams['random']
+    for factor, pairs in teams.groupby('factor'):
+        summary[f"{factor}_corr"] = pairs['random'].corr(pairs['collapsed'])
+        summary[f"{factor}_max_diff"] = pairs['difference'].abs().max()
+    logging.info("Game effect modes side by side:\n" + summary.T.to_string())
+    return summary.reset_index(), teams
+
+
+def run(league_name=DB_SCHEMA, engine_name="pymer4", cold_start=False, use_cache=True,
+        weighting=None, min_year=None, game_effect='random', compare=False):
+    """
+    Fetch, fit and write one league. Returns a dict with the status, row
+    count and per-stage wall times (seconds) for batch reporting; the full
+    per-stage records go to the league's diagnostics/profile.jsonl.
+
+    weighting and min_year override the league's settings (e.g. a longer
+    history with 'exponential:365'). game_effect='collapsed' fits the model
+    without (1|game_id) (see COLLAPSED_FORMULA); compare also fits both modes
+    cold and writes them side by side to diagnostics/game_effects.csv.
+    """
+    league = dict(LEAGUES[league_name])
+    if weighting:
+        league['weighting'] = weighting
+    if min_year:
+        league['min_year'] = min_year
+    schema = league['schema']
+    report = {'league': league_name, 'schema': schema, 'status': 'failed', 'rows': 0}
+    profiler = StageProfiler(os.path.join(REPO_ROOT, league['directory'], DIAGNOSTICS_DIR, PROFILE_FILE),
+                             league=league_name, schema=schema, engine=engine_name)
+    started = time.perf_counter()
+    logging.info(f"--- Starting Python Script using {'Pymer4' if engine_name == 'pymer4' else 'native sparse GLMM'} for '{league_name}' ({datetime.now()}) ---")
+
+    # --- Database Connection ---
+    engine = None # Initialize engine to None for finally block
+    try:
+        with profiler.stage('connect'):
+            engine = connect()
+    except Exception as e:
+        logging.error(f"Database connection failed: {e}")
+        # No point continuing if DB connection fails
+        report['error'] = f"Database connection failed - {e}"
+        report['total'] = time.perf_counter() - started
+        profiler.close()
+        return report
+
+    # --- Main Processing Block ---
+    try:
+        options = {'engine': engine_name, 'league': league}
+        if game_effect != 'random':
+            options['game_effect'] = game_effect
+        formula = GAME_EFFECTS[game_effect][0]
+
+        # --- Preflight: row count and fingerprint without fetching ---
+        with profiler.stage('preflight'):
+            n_rows, key = preflight(engine, league, options)
+            entry = None
+            if use_cache:
+                try:
+                    entry = cached_entry(engine, schema)
+                except Exception as e:
+                    logging.warning(f"Could not read {schema}._fit_cache: {e}")
+        if n_rows == 0:
+            logging.warning("Query returned no data. Exiting.")
+            report['status'] = 'no data'
+            return report
+        if entry and entry.get('source_key') == key:
+            logging.info(f"Identical fit already stored in {schema}._basic_factors (preflight); skipping fetch, fit and write.")
+            report['rows'] = n_rows
+            report['status'] = 'cached'
+            return report
+
+        # --- Fetch Data ---
+        with profiler.stage('fetch'):
+            sg = fetch_data(engine, league)
+        if sg.empty:
+            logging.warning("Query returned no data. Exiting.")
+            report['status'] = 'no data'
+            return report
+
+        # --- Fit Cache ---
+        with profiler.stage('hash'):
+            data_hash = frame_hash(sg, formula, options)
+            logging.info(f"Modeling data hash: {data_hash}")
+        if entry and entry.get('data_hash') == data_hash:
+            # Same rows, but the stored entry predates the source key: record it
+            logging.info(f"Identical fit already stored in {schema}._basic_factors; skipping fit and write.")
+            store_hash(engine, schema, data_hash, engine_name, formula, len(sg), key)
+            report['rows'] = len(sg)
+            report['status'] = 'cached'
+            return report
+        # The factor tables are about to change; drop the stale hash first
+        clear_hash(engine, schema)
+
+        # --- Integer Codes for team/opponent/game_id ---
+        with profiler.stage('encode'):
+            codebook = CodeBook.load(engine, schema)
+            recode(sg, codebook)
+            codebook.save(engine, schema)
+
+        # --- Data Preprocessing ---
+        with profiler.stage('preprocess'):
+            g_filtered = preprocess(sg)
+        report['rows'] = len(g_filtered)
+
+        with profiler.stage('levels'):
+            # The collapsed model has no game_id levels
+            parameter_types = PARAMETER_TYPES if game_effect == 'random' else \
+                {name: kind for name, kind in PARAMETER_TYPES.items() if name != 'game_id'}
+            write_parameter_levels(engine, schema, g_filtered, parameter_types=parameter_types, codebook=codebook)
+
+        # --- Fit ---
+        with profiler.stage('fit'):
+            model, cold_evals = fit_model(g_filtered, engine_name, engine, league, cold_start, game_effect)
+            log_summary(model)
+
+        # --- Extract and Write ---
+        with profiler.stage('extract'):
+            combined = extract_results(model, cold_evals, codebook)
+
+        with profiler.stage('write'):
+            write_results(engine, schema, combined)
+            store_hash(engine, schema, data_hash, engine_name, formula, len(sg), key)
+            # The same estimates as .npy files for DB-free prediction (artifact.py)
+            save_artifact(artifact_path(REPO_ROOT, league, league_name),
+                          build_artifact(combined, league_name, league, GAME_EFFECTS[game_effect][1], formula,
+                                         g_filtered['field'].cat.categories, data_hash))
+
+        if compare:
+            with profiler.stage('compare'):
+                summary, teams = compare_game_effects(g_filtered, league)
+                diagnostics = os.path.join(REPO_ROOT, league['directory'], DIAGNOSTICS_DIR)
+                summary.to_csv(os.path.join(diagnostics, "game_effects.csv"), index=False)
+                teams.assign(level=codebook.level_names('team', teams['level'])).to_csv(
+                    os.path.join(diagnostics, "game_effects_teams.csv"), index=False)
+        report['status'] = 'ok'
+
+    # --- Global Error Handling & Cleanup ---
+    except Exception as e:
+        # Catch any exceptions not handled within the main block
+        logging.error(f"An unexpected error occurred: {e}")
+        import traceback
+        logging.error(traceback.format_exc()) # Log the full traceback
+        report['error'] = str(e)
+
+    finally:
+        # --- Clean Up ---
+        logging.info("Closing database connection if open.")
+        if engine: # Check if engine was successfully created
+            engine.dispose()
+            logging.info("Database connection closed.")
+        else:
+            logging.info("Database engine was not created.")
+        report.update(profiler.timings)
+        profiler.close()
+        report['total'] = time.perf_counter() - started
+        logging.info(f"--- Python Script Finished ({datetime.now()}) ---")
+    return report
+
+
+def main(argv=None):
+    # --- Command Line Options ---
+    parser = argparse.ArgumentParser(description="Fit the ratings GLMM and write _basic_factors/_parameter_levels.")
+    parser.add_argument("--engine", choices=["pymer4", "native"], default="pymer4",
+                        help="pymer4 (R lme4 via rpy2) or native (sparse NumPy/SciPy Laplace fitter)")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="native engine: ignore the stored _basic_factors and fit from scratch")
+    parser.add_argument("--league", default=DB_SCHEMA, choices=sorted(LEAGUES),
+                        help="league settings from leagues.py (default: nrl)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="refit even if the data hash matches the stored fit")
+    parser.add_argument("--weighting", default=None,
+                        help="recency weights: season, exponential:<half-life days> or module.function[:params] "
+                             "(default: the league's setting)")
+    parser.add_argument("--min-year", type=int, default=None,
+                        help="first season to include (default: the league's setting)")
+    parser.add_argument("--game-effect", choices=sorted(GAME_EFFECTS), default="random",
+                        help="random: (1|game_id); collapsed: game effect integrated out (native engine)")
+    parser.add_argument("--compare-game-effects", action="store_true",
+                        help="also fit both game-effect modes cold and report them side by side")
+    args = parser.parse_args(argv)
+
+    # --- Setup Logging ---
+    setup_logging(LOG_FILES[args.engine])
+    report = run(args.league, args.engine, args.cold_start, not args.no_cache, args.weighting, args.min_year,
+                 args.game_effect, args.compare_game_effects)
+    if report['status'] == 'failed' and 'Database connection failed' in report.get('error', ''):
+        raise SystemExit(f"FATAL: {report['error']}")
+    if report['status'] == 'no data':
+        # Use SystemExit for clearer exit reason than quit()
+        raise SystemExit("No data fetched from database.")
+
 
+if __name__ == "__main__":
+    main()
+
+# --- End of script ---
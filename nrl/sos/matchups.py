@@ -0,0 +1,207 @@
+# -----------------------------------------------------------------------------
+# Pairwise Matchup Matrices
+# -----------------------------------------------------------------------------
+# Replaces world_rugby/extensions/matchups.sql, which self-joins a schema's
+# schedule factors into a temp table of team pairs and fills intercept,
+# offense/defense and mu with one UPDATE each. Here every pair is one
+# outer sum of the team effects:
+#
+#   log mu_team[i, j]     = intercept + field_team + offense[i] + defense[j]
+#   log mu_opponent[i, j] = intercept + field_opp  + offense[j] + defense[i]
+#
+# for three variants of where row team i plays:
+#
+#   home      field offense_home for i, defense_home for j
+#   away      the transpose of home
+#   neutral   the 'neutral' level where the league has one (world_rugby),
+#             else the mean of the two home-field effects for both sides
+#
+# with win/lose/draw of row team i from the score distributions of the fit
+# (outcome_grid.exact_pairs; Poisson or ZINB with the model's alpha and
+# pz, mu being the count mean, expected scores (1 - pz) mu as
+# zinb_predict.sql). The diagonal is NaN.
+#
+# From outcome_grid.GRID_MIN_PAIRS team pairs on, the probabilities are
+# interpolated in the artifact's precomputed grid (<artifact>_grid.npy,
+# written by `outcome_grid.py --artifact`) when it exists and has the
+# model's alpha and pz; its max_error is logged. --grid names another grid,
+# --exact skips it.
+#
+# The ratings come from a model artifact (artifact.py) or, with --from-db,
+# from <schema>._basic_factors and the field levels of _parameter_levels as
+# written by lmer.R or lmer.py. The result is a raw .npy of shape
+# (3 variants, n, n, 5) that np.load(mmap_mode='r') maps directly, with the
+# team names, variants and columns in a .json:
+#
+#   columns   e_team, e_opponent, win, lose, draw
+#
+# --csv also writes the long table of matchups.sql (team_name, e_goals,
+# opponent_name, e_goals, win, lose, tie) and --parquet a long Parquet file
+# (needs pyarrow).
+#
+#   python ../nrl/sos/matchups.py --league men --from-db
+#   python ../nrl/sos/outcome_grid.py --artifact ../world_rugby/models/men_zinb
+#   python ../nrl/sos/matchups.py --league men --zinb
+#   python sos/matchups.py --league nrl --csv
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from artifact import ARTIFACT_DIR, ModelArtifact, artifact_path, build_artifact, load_artifact
+from leagues import LEAGUES, REPO_ROOT
+from outcome_grid import GRID_MIN_PAIRS, exact_pairs, grid_path, load_grid
+
+VARIANTS = ['home', 'away', 'neutral']
+COLUMNS = ['e_team', 'e_opponent', 'win', 'lose', 'draw']
+
+
+def field_effects(model, variant):
+    """(team side, opponent side) log field effects of a variant."""
+    field = dict(zip(model.field_levels, model.field))
+    home = (field.get('offense_home', 0.0), field.get('defense_home', 0.0))
+    if variant == 'home':
+        return home
+    if variant == 'away':
+        return home[::-1]
+    if 'neutral' in field:
+        return field['neutral'], field['neutral']
+    middle = 0.5 * (home[0] + home[1])
+    return middle, middle
+
+
+def matchup_matrices(model, teams=None, variants=VARIANTS, grid=None):
+    """
+    ((len(variants), n, n, 5) array, team names) for the teams (all by
+    default); the probabilities from grid (an OutcomeGrid) when given.
+    """
+    rows = np.arange(len(model.team_name)) if teams is None else model.index(teams)
+    offense, defense = model.offense[rows], model.defense[rows]
+    n = len(rows)
+    # offense[i] + defense[j] and its transpose
+    attack = offense[:, None] + defense[None, :]
+    result = np.empty((len(variants), n, n, len(COLUMNS)))
+    for v, variant in enumerate(variants):
+        team_field, opponent_field = field_effects(model, variant)
+        mu_team = np.exp(model.intercept + team_field + attack)
+        mu_opponent = np.exp(model.intercept + opponent_field + attack.T)
+        result[v, :, :, 0] = (1.0 - model.pz) * mu_team
+        result[v, :, :, 1] = (1.0 - model.pz) * mu_opponent
+        if grid is None:
+            probabilities = exact_pairs(mu_team, mu_opponent, model.alpha, model.pz)
+        else:
+            probabilities = grid.lookup(mu_team.ravel(), mu_opponent.ravel())
+        result[v, :, :, 2:] = probabilities.reshape(n, n, 3)
+        result[v, np.arange(n), np.arange(n), :] = np.nan
+    return result, model.team_name[rows]
+
+
+def long_frame(matrices, names, variant, variants=VARIANTS):
+    """One variant as the rows of matchups.sql, ordered by team and opponent."""
+    values = matrices[variants.index(variant)]
+    n = len(names)
+    i, j = np.nonzero(~np.eye(n, dtype=bool))
+    frame = pd.DataFrame({
+        'team_name': names[i],
+        'team_e': values[i, j, 0],
+        'opponent_name': names[j],
+        'opponent_e': values[i, j, 1],
+        'win': values[i, j, 2],
+        'lose': values[i, j, 3],
+        'tie': values[i, j, 4],
+    })
+    return frame.sort_values(['team_name', 'opponent_name']).reset_index(drop=True)
+
+
+def matching_grid(path, model):
+    """The OutcomeGrid at path if it exists and has the model's alpha and pz, else None."""
+    if not os.path.exists(path):
+        logging.info(f"No outcome grid at {path}; exact probabilities.")
+        return None
+    grid = load_grid(path)
+    if not (np.isclose(grid.alpha, model.alpha) and np.isclose(grid.pz, model.pz)):
+        logging.warning(f"{path} is for alpha {grid.alpha:g}, pz {grid.pz:g}, not the model's "
+                        f"{model.alpha:g}, {model.pz:g}; exact probabilities.")
+        return None
+    logging.info(f"Outcome grid {path}: step {grid.step:g}, max error {grid.max_error:.2e}.")
+    return grid
+
+
+def save_matrices(path, matrices, names, model, variants=VARIANTS):
+    """Write <path> (.npy) and its .json (teams, variants, columns, model)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.save(path, matrices)
+    meta = {
+        'league': str(model.league),
+        'family': str(model.family),
+        'teams': names.tolist(),
+        'variants': list(variants),
+        'columns': COLUMNS,
+    }
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump(meta, f, indent=2)
+    logging.info(f"Saved {len(variants)} x {len(names)} x {len(names)} matchups to {path}.")
+
+
+def model_from_db(league_name, zinb=False):
+    """A ModelArtifact built from <schema>._basic_factors and _parameter_levels (or the _zinb tables)."""
+    import lmer
+    league = LEAGUES[league_name]
+    prefix = '_zinb' if zinb else ''
+    engine = lmer.connect()
+    try:
+        factors = pd.read_sql_query(f"SELECT * FROM {league['schema']}.{prefix}_basic_factors", engine)
+        # The reference level (neutral for world_rugby) has no fixed-effect row
+        field_levels = pd.read_sql_query(
+            f"SELECT level FROM {league['schema']}.{prefix}_parameter_levels WHERE parameter = 'field'", engine)['level']
+    finally:
+        engine.dispose()
+    return ModelArtifact(build_artifact(factors, league_name, league, 'zinb' if zinb else 'poisson', "",
+                                        field_levels.astype(str)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Expected scores and win/lose/draw for every pair of teams.")
+    parser.add_argument("--league", required=True, choices=sorted(LEAGUES))
+    parser.add_argument("--zinb", action="store_true", help="use the ZINB fit (<league>_zinb artifact / _zinb_basic_factors)")
+    parser.add_argument("--from-db", action="store_true", help="read <schema>._basic_factors instead of the artifact")
+    parser.add_argument("--artifact", default=None, help="artifact path (default: <league>/models/<league>)")
+    parser.add_argument("--teams", nargs="+", default=None, help="restrict to these teams (default: all)")
+    parser.add_argument("--out", default=None, help="output .npy (default: <league>/models/<league>_matchups.npy)")
+    parser.add_argument("--grid", default=None, help="outcome grid .npy (default: <artifact>_grid.npy)")
+    parser.add_argument("--exact", action="store_true", help="exact probabilities even for many teams")
+    parser.add_argument("--csv", action="store_true", help="also write the long table (home variant) as CSV")
+    parser.add_argument("--parquet", action="store_true", help="also write every variant long as Parquet")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    league = LEAGUES[args.league]
+    suffix = "_zinb" if args.zinb else ""
+    path = args.artifact or artifact_path(REPO_ROOT, league, args.league, suffix)
+    if args.from_db:
+        model = model_from_db(args.league, args.zinb)
+    else:
+        model = load_artifact(path)
+    n = len(model.team_name) if args.teams is None else len(args.teams)
+    grid = None
+    if not args.exact and (args.grid or n * (n - 1) >= GRID_MIN_PAIRS):
+        grid = matching_grid(args.grid or grid_path(path), model)
+    matrices, names = matchup_matrices(model, args.teams, grid=grid)
+
+    out = args.out or os.path.join(REPO_ROOT, league['directory'], ARTIFACT_DIR, f"{args.league}{suffix}_matchups.npy")
+    save_matrices(out, matrices, names, model)
+    stem = os.path.splitext(out)[0]
+    if args.csv:
+        long_frame(matrices, names, 'home').round(3).to_csv(stem + ".csv", index=False)
+    if args.parquet:
+        frames = [long_frame(matrices, names, variant).assign(variant=variant) for variant in VARIANTS]
+        pd.concat(frames, ignore_index=True).to_parquet(stem + ".parquet", index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ drop table if exists nrl._factors;
 create table nrl._factors (
        parameter		text,
        level			text,
+       code			integer,
        type			text,
        method			text,
        raw_factor		float,
@@ -19,14 +20,18 @@ create table nrl._factors (
 
 -- Random factors
 
+-- random levels are keyed on their integer code (see sos/codes.py);
+-- level carries the team name / game id for display
+
 -- defense,offense
 
 insert into nrl._factors
-(parameter,level,type,method,raw_factor,exp_factor)
+(parameter,level,code,type,method,raw_factor,exp_factor)
 (
 select
 npl.parameter as parameter,
 npl.level as level,
+npl.code as code,
 npl.type as type,
 'ln_regression' as method,
 estimate as raw_factor,
@@ -34,7 +39,7 @@ null as exp_factor
 --exp(estimate) as exp_factor
 from nrl._parameter_levels npl
 left outer join nrl._basic_factors nbf
-  on (nbf.factor,nbf.level,nbf.type)=(npl.parameter,npl.level,npl.type)
+  on (nbf.factor,nbf.code,nbf.type)=(npl.parameter,npl.code,npl.type)
 where
     npl.type='random'
 and npl.parameter in ('defense','offense')
@@ -43,11 +48,12 @@ and npl.parameter in ('defense','offense')
 -- other random
 
 insert into nrl._factors
-(parameter,level,type,method,raw_factor,exp_factor)
+(parameter,level,code,type,method,raw_factor,exp_factor)
 (
 select
 npl.parameter as parameter,
 npl.level as level,
+npl.code as code,
 npl.type as type,
 'ln_regression' as method,
 estimate as raw_factor,
@@ -55,7 +61,7 @@ null as exp_factor
 --exp(estimate) as exp_factor
 from nrl._parameter_levels npl
 left outer join nrl._basic_factors nbf
-  on (nbf.factor,nbf.level,nbf.type)=(npl.parameter,npl.level,npl.type)
+  on (nbf.factor,nbf.code,nbf.type)=(npl.parameter,npl.code,npl.type)
 where
     npl.type='random'
 and npl.parameter not in ('defense','offense')
@@ -0,0 +1,347 @@
+# -----------------------------------------------------------------------------
+# Online Rating Updates Between Full Refits
+# -----------------------------------------------------------------------------
+# Applies results that arrived after the last GLMM fit to the team
+# offense/defense factors one game at a time, so predictions.sql can be
+# rerun minutes after full time without a refit.
+#
+# Each team's offense and defense effect is a Gaussian state (mean, var),
+# seeded from the fit: the means are the _basic_factors estimates, the
+# variances the inverse of the diagonal of the Laplace Hessian,
+#
+#   var = 1 / (1 / sd^2 + sum over the team's fitted rows of w * mu)
+#
+# A game is applied as a whole. Its score rows are Poisson observations of
+# s_k = offense[team_k] + defense[opponent_k] + g at the offsets intercept +
+# field_k, and the two rows share the game effect g ~ N(0, sd_game^2), so the
+# prior of (s_home, s_away) has covariance sd_game^2 between them (a high
+# scoring game is partly the game, not only the teams). The posterior of s
+# is found by a 2-D Laplace (Newton) step and spread back onto the four
+# team effects with the Kalman gains; g itself is integrated out and not
+# kept. The state holds only each effect's variance (the correlations the
+# update induces are dropped). Between games the variances grow by
+# DRIFT_PER_YEAR * sd^2 per year (a random walk), so later results count
+# for more. Every game touches two rows of state, i.e. the work per game is
+# O(1).
+#
+# The results already in the fit are the modeling games dated up to the
+# fit's 'fitted_through' row of _basic_factors (lmer.extract_results), or
+# for fits without one (lmer.R) the games with a game_id effect. Once the
+# state is seeded, a run fetches only the games dated after fitted_through;
+# the whole window is fetched again only to reseed after a refit.
+#
+# The state lives in <schema>._rating_state, the applied results (with the
+# pre-game expectation) in <schema>._rating_updates. When _basic_factors
+# changes (a refit) both are reseeded from it. The two teams of every applied
+# game get new offensive/defensive/strength values in _schedule_factors; the
+# schedule_* columns keep their values from the last schedule_factors.sql.
+#
+# Only ONLINE_LEAGUES (nrl) qualify: the fit must come from lmer.py, whose
+# _basic_factors has the integer 'code' column and the 'sd' rows the
+# variances need, and _schedule_factors must be keyed on team_code as nrl's
+# schedule_factors.sql creates it (the other leagues key it on team_id).
+# A fit without them (lmer.R) is refused rather than updated.
+#
+#   python sos/online.py --league nrl
+# -----------------------------------------------------------------------------
+
+import argparse
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import sqlalchemy
+
+import lmer
+from codes import CodeBook, recode
+from leagues import LEAGUES, REPO_ROOT
+from profiling import PROFILE_FILE, StageProfiler
+
+OUTPUT_LOG_FILE = os.path.join(lmer.DIAGNOSTICS_DIR, "online.log")
+STATE_TABLE = '_rating_state'
+UPDATES_TABLE = '_rating_updates'
+# Random-walk variance added per 365 days, as a fraction of the fitted sd^2
+DRIFT_PER_YEAR = 0.25
+SIDES = {'offense': 'team', 'defense': 'opponent'}
+# Leagues fitted by lmer.py whose _schedule_factors is keyed on team_code
+ONLINE_LEAGUES = ['nrl']
+
+
+def factors_key(factors):
+    """Digest identifying the fit behind a _basic_factors frame."""
+    data = factors.sort_values(['factor', 'level']).reset_index(drop=True)
+    return hashlib.sha256(pd.util.hash_pandas_object(data.astype(str), index=False).to_numpy().tobytes()).hexdigest()
+
+
+class RatingModel:
+    """Fixed part and variance components of a stored fit."""
+
+    def __init__(self, factors):
+        fixed = factors[factors['type'] == 'fixed'].set_index('factor')['estimate']
+        self.intercept = float(fixed.get('(Intercept)', 0.0))
+        self.field = {name[len('field'):]: float(value) for name, value in fixed.items() if name.startswith('field')}
+        structural = factors[factors['type'] == 'structural']
+        sd = structural[structural['level'] == 'sd'].set_index('factor')['estimate'].astype(float).to_dict()
+        alpha = structural.loc[structural['level'] == 'alpha', 'estimate']
+        if 'game_id' not in sd and len(alpha):
+            # Collapsed fit: gamma game effect of size alpha ~ log-normal of variance log(1 + 1/alpha)
+            sd['game_id'] = float(np.sqrt(np.log1p(1.0 / alpha.iloc[0])))
+        # Without the sds the prior variances would be 0 and no update would move a rating
+        missing = [name for name in ['offense', 'defense', 'game_id'] if name not in sd]
+        if missing:
+            raise ValueError(f"The stored fit has no 'sd' rows for {missing}; refit with lmer.py first.")
+        self.sd = {name: sd[name] for name in ['offense', 'defense', 'game_id']}
+
+    def offset(self, field):
+        return self.intercept + self.field.get(field, 0.0)
+
+
+def fitted_through(factors):
+    """Date of the last game in the stored fit (its fitted_through row), or None."""
+    through = factors.loc[(factors['type'] == 'structural') & (factors['level'] == 'fitted_through'), 'estimate']
+    return np.datetime64(int(through.iloc[0]), 'D') if len(through) else None
+
+
+def fitted_games(factors, sg):
+    """(game ids already in the stored fit, the date it runs through)."""
+    dates = sg['game_date'].to_numpy('datetime64[D]')
+    as_of = fitted_through(factors)
+    if as_of is not None:
+        return set(sg.loc[dates <= as_of, 'game_id'].astype(np.int64)), as_of
+    games = set(factors.loc[factors['factor'] == 'game_id', 'code'].dropna().astype(np.int64))
+    fitted = sg['game_id'].astype(np.int64).isin(games).to_numpy()
+    if not fitted.any():
+        raise ValueError("The stored fit has neither a fitted_through row nor game_id effects of the modeling "
+                         "games; refit with lmer.py first.")
+    return games, dates[fitted].max()
+
+
+def seed_state(factors, model, sg, fitted_games, codebook, as_of):
+    """Per-team state from the stored fit; variances from the fitted rows' information."""
+    random = factors[(factors['type'] == 'random') & factors['factor'].isin(list(SIDES))]
+    teams = np.union1d(random['code'].dropna().astype(np.int64), sg['team'].cat.categories.to_numpy(np.int64))
+    state = pd.DataFrame({'team_code': teams}).set_index('team_code')
+    state['team_id'] = codebook.names('team', teams)
+
+    rows = sg[sg['game_id'].isin(fitted_games) & (sg['w'] > 0)]
+    team = rows['team'].to_numpy(np.int64)
+    opponent = rows['opponent'].to_numpy(np.int64)
+    for side in SIDES:
+        estimates = random[random['factor'] == side].set_index('code')['estimate']
+        state[side] = estimates.reindex(teams).fillna(0.0).to_numpy()
+    offset = np.array([model.offset(f) for f in rows['field'].astype(str)])
+    mu = np.exp(offset + state['offense'].reindex(team).to_numpy() + state['defense'].reindex(opponent).to_numpy())
+    information = rows['w'].to_numpy(np.float64) * mu
+    for side, column in SIDES.items():
+        codes = team if column == 'team' else opponent
+        info = pd.Series(information).groupby(codes).sum().reindex(teams).fillna(0.0).to_numpy()
+        prior = 1.0 / model.sd[side] ** 2 if model.sd[side] > 0 else np.inf
+        state[f"{side}_var"] = 1.0 / (prior + info)
+    state['games'] = 0
+    state['updated_through'] = as_of
+    return state
+
+
+def poisson_update(y, weight, offset, mean, var, game_var):
+    """
+    Joint Laplace update of one game's effects by its score rows.
+
+    y, weight, offset have one entry per row k; mean, var are (rows, 2)
+    arrays of the row's offense and defense effect. Row k is a Poisson count
+    at log mean offset[k] + mean[k].sum() + g, with the game effect g of
+    variance game_var shared by all rows. Returns the posterior (mean, var).
+    """
+    ms = mean.sum(axis=1)
+    # Prior covariance of the row sums: own effects on the diagonal, g everywhere
+    vs = np.diag(var.sum(axis=1)) + game_var
+    precision = np.linalg.inv(vs)
+    s = ms.copy()
+    for _ in range(50):
+        rate = weight * np.exp(offset + s)
+        step = np.linalg.solve(np.diag(rate) + precision, weight * y - rate - precision @ (s - ms))
+        s += step
+        if np.abs(step).max() < 1e-10:
+            break
+    vs_post = np.linalg.inv(np.diag(weight * np.exp(offset + s)) + precision)
+    # Kalman gains: effect j of row k only enters s_k, with covariance var[k, j]
+    gain = var[:, :, None] * precision[:, None, :]
+    shift = np.einsum('kjl,l->kj', gain, s - ms)
+    shrink = np.einsum('kjl,lm,kjm->kj', gain, vs - vs_post, gain)
+    return mean + shift, var - shrink
+
+
+def apply_results(state, model, rows, drift=DRIFT_PER_YEAR):
+    """Apply the result rows (two per game, in date order) to state in place, a game at a time; returns the update log."""
+    log = []
+    game_var = model.sd['game_id'] ** 2
+    growth = {side: drift * model.sd[side] ** 2 / 365.0 for side in SIDES}
+    for game_id, game in rows.groupby('game_id', sort=False, observed=True):
+        team = game['team'].to_numpy(np.int64)
+        opponent = game['opponent'].to_numpy(np.int64)
+        day = game['game_date'].iloc[0]
+        for code in np.union1d(team, opponent):
+            if code not in state.index:
+                # A team the fit has not seen starts at the population mean
+                state.loc[code] = {'team_id': None, 'offense': 0.0, 'defense': 0.0,
+                                   'offense_var': model.sd['offense'] ** 2, 'defense_var': model.sd['defense'] ** 2,
+                                   'games': 0, 'updated_through': day}
+            elapsed = max((pd.Timestamp(day) - pd.Timestamp(state.at[code, 'updated_through'])).days, 0)
+            if elapsed:
+                for side in SIDES:
+                    state.at[code, f"{side}_var"] += growth[side] * elapsed
+                state.at[code, 'updated_through'] = day
+        fields = game['field'].astype(str).to_numpy()
+        offset = np.array([model.offset(field) for field in fields])
+        mean = np.column_stack([state.loc[team, 'offense'].to_numpy(np.float64),
+                                state.loc[opponent, 'defense'].to_numpy(np.float64)])
+        var = np.column_stack([state.loc[team, 'offense_var'].to_numpy(np.float64),
+                               state.loc[opponent, 'defense_var'].to_numpy(np.float64)])
+        expected = np.exp(offset + mean.sum(axis=1))
+        scores = game['gs'].to_numpy(np.float64)
+        mean, var = poisson_update(scores, game['w'].to_numpy(np.float64), offset, mean, var, game_var)
+        for k in range(len(game)):
+            state.at[team[k], 'offense'], state.at[opponent[k], 'defense'] = mean[k]
+            state.at[team[k], 'offense_var'], state.at[opponent[k], 'defense_var'] = var[k]
+            state.at[team[k], 'games'] += 1
+            log.append({'game_id': int(game_id), 'game_date': day, 'team_code': int(team[k]),
+                        'opponent_code': int(opponent[k]), 'field': fields[k], 'score': scores[k],
+                        'expected': float(expected[k]), 'offense': float(mean[k, 0]), 'defense': float(mean[k, 1])})
+    return pd.DataFrame(log)
+
+
+def load_state(engine, schema, key):
+    """(state, applied game ids) stored for the fit with this key, or (None, empty) if none."""
+    with engine.connect() as connection:
+        exists = connection.execute(sqlalchemy.text(
+            "SELECT to_regclass(:s) IS NOT NULL AND to_regclass(:u) IS NOT NULL"),
+            {'s': f"{schema}.{STATE_TABLE}", 'u': f"{schema}.{UPDATES_TABLE}"}).scalar()
+    if not exists:
+        return None, set()
+    state = pd.read_sql_query(f"SELECT * FROM {schema}.{STATE_TABLE}", engine)
+    if state.empty or (state['seed_key'] != key).any():
+        logging.info(f"{schema}.{STATE_TABLE} belongs to an earlier fit; reseeding.")
+        return None, set()
+    applied = pd.read_sql_query(f"SELECT DISTINCT game_id FROM {schema}.{UPDATES_TABLE}", engine)
+    state['updated_through'] = pd.to_datetime(state['updated_through']).to_numpy('datetime64[D]')
+    return state.drop(columns='seed_key').set_index('team_code'), set(applied['game_id'].astype(np.int64))
+
+
+def write_state(engine, schema, state, log, key, reseeded):
+    """Store the state and update log and refresh _schedule_factors for the teams just updated, in one transaction."""
+    frame = state.reset_index()
+    frame['updated_through'] = pd.to_datetime(frame['updated_through']).dt.date
+    frame['seed_key'] = key
+    with engine.begin() as connection:
+        if reseeded:
+            connection.execute(sqlalchemy.text(f"DROP TABLE IF EXISTS {schema}.{STATE_TABLE}"))
+            connection.execute(sqlalchemy.text(f"DROP TABLE IF EXISTS {schema}.{UPDATES_TABLE}"))
+        connection.execute(sqlalchemy.text(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.{STATE_TABLE} (
+                team_code integer PRIMARY KEY, team_id text,
+                offense float, offense_var float, defense float, defense_var float,
+                games integer, updated_through date, seed_key text)"""))
+        connection.execute(sqlalchemy.text(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.{UPDATES_TABLE} (
+                game_id integer, game_date date, team_code integer, opponent_code integer, field text,
+                score float, expected float, offense float, defense float, applied_at timestamp)"""))
+        connection.execute(sqlalchemy.text(f"DELETE FROM {schema}.{STATE_TABLE}"))
+        connection.execute(sqlalchemy.text(f"""
+            INSERT INTO {schema}.{STATE_TABLE}
+            VALUES (:team_code, :team_id, :offense, :offense_var, :defense, :defense_var, :games, :updated_through, :seed_key)"""),
+            frame.to_dict('records'))
+        if log.empty:
+            return
+        records = log.assign(game_date=pd.to_datetime(log['game_date']).dt.date, applied_at=datetime.now())
+        connection.execute(sqlalchemy.text(f"""
+            INSERT INTO {schema}.{UPDATES_TABLE}
+            VALUES (:game_id, :game_date, :team_code, :opponent_code, :field, :score, :expected, :offense, :defense, :applied_at)"""),
+            records.to_dict('records'))
+
+        touched = frame[frame['team_code'].isin(np.union1d(log['team_code'], log['opponent_code']))]
+        if connection.execute(sqlalchemy.text("SELECT to_regclass(:t) IS NULL"),
+                              {'t': f"{schema}._schedule_factors"}).scalar():
+            logging.warning(f"{schema}._schedule_factors does not exist; run schedule_factors.sql after the next fit.")
+            return
+        # As schedule_factors.sql: offensive/defensive are exp(effect), strength their ratio
+        connection.execute(sqlalchemy.text(f"""
+            INSERT INTO {schema}._schedule_factors (team_code, team_id, offensive, defensive, strength)
+            VALUES (:team_code, :team_id, exp(:offense), exp(:defense), exp(:offense - :defense))
+            ON CONFLICT (team_code) DO UPDATE
+            SET offensive = excluded.offensive, defensive = excluded.defensive, strength = excluded.strength"""),
+            touched[['team_code', 'team_id', 'offense', 'defense']].to_dict('records'))
+        logging.info(f"Updated {len(touched)} team(s) in {schema}._schedule_factors.")
+
+
+def run(league_name, drift=DRIFT_PER_YEAR):
+    """Apply the results not yet in the fit or the state; returns the update log."""
+    if league_name not in ONLINE_LEAGUES:
+        raise ValueError(f"Online updates support {ONLINE_LEAGUES} only (got '{league_name}').")
+    league = dict(LEAGUES[league_name])
+    schema = league['schema']
+    profiler = StageProfiler(os.path.join(REPO_ROOT, league['directory'], lmer.DIAGNOSTICS_DIR, PROFILE_FILE),
+                             league=league_name, schema=schema, engine="online")
+    started = time.perf_counter()
+    logging.info(f"--- Starting online rating update for '{league_name}' ({datetime.now()}) ---")
+    engine = lmer.connect()
+    try:
+        with profiler.stage('fetch'):
+            factors = pd.read_sql_query(f"SELECT * FROM {schema}._basic_factors", engine)
+            if 'code' not in factors.columns:
+                raise ValueError(f"{schema}._basic_factors has no 'code' column (an lmer.R fit); refit with lmer.py first.")
+            factors = factors[['factor', 'type', 'level', 'code', 'estimate']]
+            key = factors_key(factors)
+            model = RatingModel(factors)
+            state, applied = load_state(engine, schema, key)
+            reseeded = state is None
+            # The whole window only to seed the variances; otherwise the games after the fit
+            since = None if reseeded else fitted_through(factors)
+            sg = lmer.fetch_data(engine, league, since=since)
+            codebook = CodeBook.load(engine, schema)
+            recode(sg, codebook)
+            codebook.save(engine, schema)
+
+        with profiler.stage('seed'):
+            if since is None:
+                fitted, as_of = fitted_games(factors, sg)
+            else:
+                fitted = set()
+            if reseeded:
+                state = seed_state(factors, model, sg, fitted, codebook, as_of)
+                logging.info(f"Seeded {len(state)} team states from {schema}._basic_factors (fit through {as_of}).")
+
+        with profiler.stage('update'):
+            pending = sg[~sg['game_id'].isin(fitted | applied) & (sg['w'] > 0)]
+            pending = pending.sort_values(['game_date', 'game_id', 'field'], kind='stable')
+            log = apply_results(state, model, pending, drift)
+            state['team_id'] = state['team_id'].fillna(pd.Series(codebook.names('team', state.index), index=state.index))
+            logging.info(f"Applied {len(log)} result row(s) from {pending['game_id'].nunique()} new game(s).")
+            if not log.empty:
+                residual = log['score'] - log['expected']
+                logging.info(f"Pre-update residuals: mean {residual.mean():.3f}, mean absolute {residual.abs().mean():.3f}")
+
+        with profiler.stage('write'):
+            write_state(engine, schema, state, log, key, reseeded)
+    finally:
+        engine.dispose()
+        profiler.close()
+        logging.info(f"--- Online update finished in {time.perf_counter() - started:.1f}s ({datetime.now()}) ---")
+    return log
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply new results to the ratings between full refits.")
+    parser.add_argument("--league", default=lmer.DB_SCHEMA, choices=ONLINE_LEAGUES)
+    parser.add_argument("--drift", type=float, default=DRIFT_PER_YEAR,
+                        help="random-walk variance per year as a fraction of the fitted sd^2")
+    args = parser.parse_args(argv)
+
+    lmer.setup_logging(OUTPUT_LOG_FILE)
+    run(args.league, args.drift)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# -----------------------------------------------------------------------------
+# Precomputed Outcome-Probability Grid
+# -----------------------------------------------------------------------------
+# P(win), P(lose), P(draw) of the home side over a regular grid of
+# (mu_home, mu_away), for code that needs outcome probabilities for many
+# more fixtures than an exact pass is worth: matchups.py looks its team
+# pairs up in the grid saved next to the model artifact when there are at
+# least GRID_MIN_PAIRS of them. Lookups interpolate bilinearly; points
+# outside the grid fall back to the exact computation.
+#
+#   poisson   independent Poisson scores (the Skellam margin of skellam.py)
+#   zinb      zero-inflated NB2 scores with size alpha and zero inflation
+#             pz, as zinb.py fits them; mu is the NB mean exp(eta), so the
+#             expected score is (1 - pz) mu. alpha = inf, pz = 0 is Poisson
+#             and pz = 0 alone is nbinom.
+#
+# The exact probabilities come from the score distributions on 0..SCORE_MAX
+# as matrix products (win = P_home F_away', with F the P(score < k) rows),
+# one row per grid point, so a whole grid is three BLAS calls. Paired
+# Poisson lookups (exact_pairs) use skellam.py's cdf instead.
+#
+# Error: build_grid() halves the step until the interpolation error is
+# within `tolerance` or the step would drop below MIN_STEP; a grid that
+# stops at MIN_STEP above the tolerance is kept with a warning. The error
+# is the larger of
+#
+#   measured   the exact error at every cell centre and edge midpoint
+#   curvature  h^2/8 (|f_xx| + |f_yy|), the error bound of bilinear
+#              interpolation, with the second differences of the grid in
+#              place of the second derivatives
+#
+# Neither is a guaranteed bound: the midpoints are samples, and a second
+# difference can understate |f''| between grid points. max_error is this
+# estimate, not a bound.
+#
+# A grid is a raw .npy of shape (n, n, 3) (so load_grid() memory-maps it)
+# plus a .json with its axis, family parameters and max_error:
+#
+#   python sos/outcome_grid.py --out models/outcome_poisson.npy
+#   python sos/outcome_grid.py --artifact ../club/models/club_zinb
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+from scipy.stats import nbinom, poisson
+
+import skellam
+
+GRID_VERSION = 1
+OUTCOMES = ['win', 'lose', 'draw']
+SCORE_MAX = 250
+MU_MIN = 0.5
+MU_MAX = 80.0
+STEP = 0.5
+TOLERANCE = 5e-4
+MIN_STEP = 0.01
+# matchups.py uses a grid from this many team pairs on
+GRID_MIN_PAIRS = 10_000
+
+
+def score_pmf(mu, alpha=np.inf, pz=0.0, score_max=SCORE_MAX):
+    """(len(mu), score_max + 1) probabilities of the scores 0..score_max."""
+    mu = np.asarray(mu, dtype=np.float64)[:, None]
+    scores = np.arange(score_max + 1)[None, :]
+    if np.isinf(alpha):
+        pmf = poisson.pmf(scores, mu)
+    else:
+        pmf = nbinom.pmf(scores, alpha, alpha / (alpha + mu))
+    pmf = (1.0 - pz) * pmf
+    pmf[:, 0] += pz
+    return pmf
+
+
+def exact_probabilities(mu_home, mu_away, alpha=np.inf, pz=0.0):
+    """(3, len(mu_home), len(mu_away)) win/lose/draw of the home side for every pair."""
+    home, away = score_pmf(mu_home, alpha, pz), score_pmf(mu_away, alpha, pz)
+    home_below = np.cumsum(home, axis=1) - home
+    away_below = np.cumsum(away, axis=1) - away
+    win = home @ away_below.T
+    lose = home_below @ away.T
+    draw = home @ away.T
+    return np.stack([win, lose, draw])
+
+
+def exact_pairs(mu_home, mu_away, alpha=np.inf, pz=0.0):
+    """(n, 3) win/lose/draw for paired arrays mu_home[i], mu_away[i]."""
+    if np.isinf(alpha) and pz == 0:
+        return skellam.outcome_probabilities(np.ravel(mu_home), np.ravel(mu_away))
+    home, away = score_pmf(np.ravel(mu_home), alpha, pz), score_pmf(np.ravel(mu_away), alpha, pz)
+    away_below = np.cumsum(away, axis=1) - away
+    home_below = np.cumsum(home, axis=1) - home
+    return np.column_stack([(home * away_below).sum(axis=1), (home_below * away).sum(axis=1),
+                            (home * away).sum(axis=1)])
+
+
+def interpolation_error(grid, axis, alpha, pz):
+    """Estimate of the largest bilinear interpolation error of grid (see the header)."""
+    step = axis[1] - axis[0]
+    mid = axis[:-1] + 0.5 * step
+    # Cell centres: the mean of the four corners
+    centres = 0.25 * (grid[:, :-1, :-1] + grid[:, 1:, :-1] + grid[:, :-1, 1:] + grid[:, 1:, 1:])
+    measured = np.abs(exact_probabilities(mid, mid, alpha, pz) - centres).max()
+    # Edge midpoints: linear along one axis
+    rows = np.abs(exact_probabilities(mid, axis, alpha, pz) - 0.5 * (grid[:, :-1, :] + grid[:, 1:, :])).max()
+    cols = np.abs(exact_probabilities(axis, mid, alpha, pz) - 0.5 * (grid[:, :, :-1] + grid[:, :, 1:])).max()
+    curvature = (np.abs(np.diff(grid, 2, axis=1)).max() + np.abs(np.diff(grid, 2, axis=2)).max()) / 8.0
+    return float(max(measured, rows, cols, curvature))
+
+
+def build_grid(alpha=np.inf, pz=0.0, mu_min=MU_MIN, mu_max=MU_MAX, step=STEP, tolerance=TOLERANCE):
+    """(grid, meta): the coarsest grid (halving step) with max_error <= tolerance, else the one at MIN_STEP."""
+    while True:
+        axis = np.arange(mu_min, mu_max + 0.5 * step, step)
+        grid = exact_probabilities(axis, axis, alpha, pz)
+        error = interpolation_error(grid, axis, alpha, pz)
+        logging.info(f"Grid step {step:g} ({len(axis)}^2 points): max interpolation error {error:.2e}")
+        if error <= tolerance:
+            break
+        if step / 2 < MIN_STEP:
+            logging.warning(f"Tolerance {tolerance:.2e} not met: max interpolation error {error:.2e} at the "
+                            f"smallest step {step:g} (MIN_STEP {MIN_STEP:g}); keeping this grid.")
+            break
+        step /= 2
+    # (mu_home, mu_away, outcome): a lookup's corners are contiguous triples
+    grid = np.ascontiguousarray(np.moveaxis(grid, 0, -1))
+    meta = {
+        'version': GRID_VERSION,
+        'family': 'poisson' if np.isinf(alpha) and pz == 0 else 'zinb',
+        'alpha': None if np.isinf(alpha) else float(alpha),
+        'pz': float(pz),
+        'mu_min': float(axis[0]),
+        'step': float(step),
+        'n': len(axis),
+        'max_error': error,
+        'tolerance': float(tolerance),
+        'outcomes': OUTCOMES,
+    }
+    return grid, meta
+
+
+def save_grid(path, grid, meta):
+    """Write <path> (.npy) and its .json metadata."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.save(path, np.ascontiguousarray(grid, dtype=np.float64))
+    with open(os.path.splitext(path)[0] + ".json", "w") as f:
+        json.dump(meta, f, indent=2)
+    logging.info(f"Saved outcome grid {path} ({meta['n']}^2, step {meta['step']:g}, max error {meta['max_error']:.2e}).")
+
+
+class OutcomeGrid:
+    """A loaded grid: lookup(mu_home, mu_away) -> (n, 3) win/lose/draw."""
+
+    def __init__(self, grid, meta):
+        self.grid = grid
+        self.meta = meta
+        self.mu_min, self.step, self.n = meta['mu_min'], meta['step'], meta['n']
+        self.mu_max = self.mu_min + (self.n - 1) * self.step
+        self.alpha = np.inf if meta['alpha'] is None else meta['alpha']
+        self.pz = meta['pz']
+        self.max_error = meta['max_error']
+        # (n*n, 3) view for one gather per corner
+        self._flat = grid.reshape(-1, 3)
+
+    def lookup(self, mu_home, mu_away):
+        """Bilinear win/lose/draw of paired expected scores; exact outside the grid."""
+        mu_home = np.atleast_1d(np.asarray(mu_home, dtype=np.float64))
+        mu_away = np.atleast_1d(np.asarray(mu_away, dtype=np.float64))
+        x = (mu_home - self.mu_min) / self.step
+        y = (mu_away - self.mu_min) / self.step
+        i = np.clip(x.astype(np.int64), 0, self.n - 2)
+        j = np.clip(y.astype(np.int64), 0, self.n - 2)
+        fx, fy = (x - i)[:, None], (y - j)[:, None]
+        k = i * self.n + j
+        p = ((1 - fx) * ((1 - fy) * self._flat[k] + fy * self._flat[k + 1])
+             + fx * ((1 - fy) * self._flat[k + self.n] + fy * self._flat[k + self.n + 1]))
+        outside = (x < 0) | (y < 0) | (x > self.n - 1) | (y > self.n - 1)
+        if outside.any():
+            p[outside] = exact_pairs(mu_home[outside], mu_away[outside], self.alpha, self.pz)
+        return p
+
+
+def grid_path(artifact):
+    """<artifact>_grid.npy, where main() saves a model's grid."""
+    return artifact.rstrip(os.sep) + "_grid.npy"
+
+
+def load_grid(path, mmap=True):
+    """Load a grid saved by save_grid() (memory-mapped unless mmap=False)."""
+    with open(os.path.splitext(path)[0] + ".json") as f:
+        meta = json.load(f)
+    if meta.get('version') != GRID_VERSION:
+        raise ValueError(f"{path}: grid version {meta.get('version')}, expected {GRID_VERSION}.")
+    return OutcomeGrid(np.load(path, mmap_mode='r' if mmap else None), meta)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute a win/lose/draw grid over (mu_home, mu_away).")
+    parser.add_argument("--artifact", default=None,
+                        help="model artifact (artifact.py) supplying alpha and pz; the grid is saved next to it")
+    parser.add_argument("--alpha", type=float, default=np.inf, help="NB size (default: inf, Poisson)")
+    parser.add_argument("--pz", type=float, default=0.0, help="zero-inflation probability")
+    parser.add_argument("--out", default=None, help="output .npy (default: <artifact>_grid.npy)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    alpha, pz, out = args.alpha, args.pz, args.out
+    if args.artifact:
+        from artifact import load_artifact
+        model = load_artifact(args.artifact)
+        alpha, pz = float(model.alpha), float(model.pz)
+        out = out or grid_path(args.artifact)
+    if not out:
+        parser.error("--out is required without --artifact")
+    grid, meta = build_grid(alpha, pz, tolerance=args.tolerance)
+    save_grid(out, grid, meta)
+
+
+if __name__ == "__main__":
+    main()
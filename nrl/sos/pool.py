@@ -0,0 +1,48 @@
+# -----------------------------------------------------------------------------
+# Process Pool for the Parallel Fits and Simulations
+# -----------------------------------------------------------------------------
+# bootstrap.py, backtest.py, select_family.py and season.py all farm
+# independent tasks out to worker processes that share one large read-only
+# object (a fitted model, the modeling frame, a season). make_pool() starts
+# such a pool:
+#
+#   * 'spawn' workers, which keep R/rpy2 and BLAS state out of forked
+#     children
+#   * one BLAS thread per worker (OMP/OpenBLAS/MKL), since the pool provides
+#     the parallelism; a value already set in the environment is kept
+#   * the shared objects are sent once per worker, not once per task, and
+#     read in the task functions through worker_state()
+#
+#   with make_pool(workers, model=model, frame=frame) as pool:
+#       results = list(pool.map(task, items))
+#
+#   def task(item):
+#       model = worker_state()['model']
+# -----------------------------------------------------------------------------
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+BLAS_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+# Worker state, set once per process by _init_worker
+_STATE = {}
+
+
+def _init_worker(state):
+    _STATE.clear()
+    _STATE.update(state)
+
+
+def worker_state():
+    """The objects passed to make_pool(), inside a worker."""
+    return _STATE
+
+
+def make_pool(workers, **state):
+    """A spawn ProcessPoolExecutor of `workers` processes whose worker_state() is `state`."""
+    for var in BLAS_THREAD_VARS:
+        os.environ.setdefault(var, "1")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                               initializer=_init_worker, initargs=(state,))
@@ -11,10 +11,14 @@ sf2.team_id as away,
 (exp(i.estimate)*sf2.offensive*d.exp_factor*sf1.defensive))::numeric(6,3) as e_d
 
 from nrl.games g
+join nrl._codes hc
+  on (hc.domain,hc.name)=('team',g.home_team)
+join nrl._codes ac
+  on (ac.domain,ac.name)=('team',g.away_team)
 join nrl._schedule_factors sf1
-  on (sf1.team_id)=(g.home_team)
+  on (sf1.team_code)=(hc.code)
 join nrl._schedule_factors sf2
-  on (sf2.team_id)=(g.away_team)
+  on (sf2.team_code)=(ac.code)
 
 join nrl._factors o
   on (o.parameter,o.level)=('field','offense_home')
@@ -41,10 +45,14 @@ sf2.team_id as away,
 (exp(i.estimate)*sf2.offensive*d.exp_factor*sf1.defensive))::numeric(6,3) as e_d
 
 from nrl.games g
+join nrl._codes hc
+  on (hc.domain,hc.name)=('team',g.home_team)
+join nrl._codes ac
+  on (ac.domain,ac.name)=('team',g.away_team)
 join nrl._schedule_factors sf1
-  on (sf1.team_id)=(g.home_team)
+  on (sf1.team_code)=(hc.code)
 join nrl._schedule_factors sf2
-  on (sf2.team_id)=(g.away_team)
+  on (sf2.team_code)=(ac.code)
 
 join nrl._factors o
   on (o.parameter,o.level)=('field','offense_home')
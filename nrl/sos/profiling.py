@@ -0,0 +1,163 @@
+# -----------------------------------------------------------------------------
+# Per-Stage Timing and Memory Instrumentation
+# -----------------------------------------------------------------------------
+# StageProfiler wraps each named step of a run (fetch, preprocess, fit, ...)
+# and appends one JSON line per stage to <league>/diagnostics/profile.jsonl:
+#
+#   {"run": "...", "league": "nrl", "stage": "fit", "status": "ok",
+#    "wall_s": 3.1, "cpu_s": 3.0, "max_rss_mb": 310.5, ...}
+#
+#   wall_s          elapsed time
+#   cpu_s           process CPU time (user + system) spent in the stage
+#   max_rss_mb      process resident-set high-water mark at the end of the stage
+#   peak_traced_mb  peak Python/NumPy allocations above the stage's starting
+#                   level (tracemalloc); only with RUGBY_TRACEMALLOC=1
+#
+# tracemalloc hooks every allocation and slows allocation-heavy stages
+# (fetch, encode, extract) noticeably, so it is off by default and the
+# timings of a traced run are not comparable with untraced ones.
+#
+# Setting RUGBY_CPROFILE to a comma-separated list of stages (e.g.
+# RUGBY_CPROFILE=fit) also dumps a cProfile of those stages next to the JSON
+# file, for `python -m pstats` or snakeviz.
+#
+# The SQL steps of sos.sh are recorded in the same file by running them
+# through this module:
+#
+#   python sos/profiling.py normalize_factors -- psql rugby -f sos/normalize_factors.sql
+# -----------------------------------------------------------------------------
+
+import argparse
+import cProfile
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILE_FILE = "profile.jsonl"
+CPROFILE_ENV = "RUGBY_CPROFILE"
+TRACEMALLOC_ENV = "RUGBY_TRACEMALLOC"
+
+
+def _max_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss * scale / 2 ** 20
+
+
+def _append(path, record):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+class StageProfiler:
+    """Records wall/CPU time and memory for named stages as JSON lines."""
+
+    def __init__(self, path, trace_memory=None, **context):
+        self.path = path
+        if trace_memory is None:
+            trace_memory = os.environ.get(TRACEMALLOC_ENV, "") not in ("", "0")
+        self.trace_memory = trace_memory
+        self.context = context
+        self.run_id = datetime.now().strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}"
+        self.timings = {}
+        self.cprofile_stages = {s.strip() for s in os.environ.get(CPROFILE_ENV, "").split(",") if s.strip()}
+        self._owns_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        """Context manager timing one stage; the record is written even if it raises."""
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracing = True
+            tracemalloc.reset_peak()
+            traced_start = tracemalloc.get_traced_memory()[0]
+        profiler = cProfile.Profile() if name in self.cprofile_stages else None
+        status = "ok"
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            if profiler:
+                profiler.disable()
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self.timings[name] = wall
+            record = {
+                "run": self.run_id,
+                **self.context,
+                "stage": name,
+                "status": status,
+                "wall_s": round(wall, 4),
+                "cpu_s": round(cpu, 4),
+                "max_rss_mb": round(_max_rss_mb(), 1),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                record["peak_traced_mb"] = round(max(peak - traced_start, 0) / 2 ** 20, 2)
+            if profiler:
+                dump = os.path.join(os.path.dirname(self.path) or ".", f"{name}_{self.run_id}.prof")
+                profiler.dump_stats(dump)
+                record["cprofile"] = dump
+            _append(self.path, record)
+
+    def close(self):
+        """Stop tracemalloc if this profiler started it."""
+        if self._owns_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._owns_tracing = False
+
+
+def run_command(stage, command, path, **context):
+    """Run a shell step (e.g. psql) as a stage; returns its exit code."""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall = time.perf_counter()
+    code = subprocess.call(command)
+    wall = time.perf_counter() - wall
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    _append(path, {
+        "run": datetime.now().strftime("%Y%m%dT%H%M%S") + f"-{os.getpid()}",
+        **context,
+        "stage": stage,
+        "status": "ok" if code == 0 else f"exit {code}",
+        "wall_s": round(wall, 4),
+        # client-side CPU only; server work shows up in wall_s
+        "cpu_s": round((after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime), 4),
+        "max_rss_mb": round(_max_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    return code
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a pipeline step and append its timing to the profile file.",
+                                     usage="%(prog)s stage [--league LEAGUE] [--file FILE] -- command ...")
+    parser.add_argument("stage", help="stage name recorded in the JSON line")
+    parser.add_argument("--file", default=os.path.join("diagnostics", PROFILE_FILE))
+    parser.add_argument("--league", default=None)
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if "--" not in argv:
+        parser.error("no command given (expected: stage [options] -- command ...)")
+    split = argv.index("--")
+    args = parser.parse_args(argv[:split])
+    command = argv[split + 1:]
+    if not command:
+        parser.error("no command given")
+    context = {"league": args.league} if args.league else {}
+    raise SystemExit(run_command(args.stage, command, args.file, **context))
+
+
+if __name__ == "__main__":
+    main()
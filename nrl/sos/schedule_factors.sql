@@ -2,7 +2,10 @@ begin;
 
 drop table if exists nrl._schedule_factors;
 
+-- keyed on the team code (nrl._codes); team_id is the team name
+
 create table nrl._schedule_factors (
+	team_code		integer,
 	team_id			text,
         offensive               float,
         defensive		float,
@@ -12,7 +15,7 @@ create table nrl._schedule_factors (
         schedule_strength       float,
         schedule_offensive_all	float,
         schedule_defensive_all	float,
-        primary key (team_id)
+        primary key (team_code)
 );
 
 -- defensive
@@ -23,12 +26,12 @@ create table nrl._schedule_factors (
 -- schedule_strength 
 
 insert into nrl._schedule_factors
-(team_id,offensive,defensive)
+(team_code,team_id,offensive,defensive)
 (
-select o.level,o.exp_factor,d.exp_factor
+select o.code,o.level,o.exp_factor,d.exp_factor
 from nrl._factors o
 left outer join nrl._factors d
-  on (d.level,d.parameter)=(o.level,'defense')
+  on (d.code,d.parameter)=(o.code,'defense')
 where o.parameter='offense'
 );
 
@@ -38,8 +41,8 @@ set strength=offensive/defensive;
 ----
 
 create temporary table r (
-         team_id		text,
-         opponent_id		text,
+         team_id		integer,
+         opponent_id		integer,
 	 field_id		text,
          offensive              float,
          defensive		float,
@@ -51,10 +54,14 @@ insert into r
 (team_id,opponent_id,field_id)
 (
 select
-r.team_name,
-r.opponent_name,
+t.code,
+o.code,
 r.field
 from nrl.results r
+join nrl._codes t
+  on (t.domain,t.name)=('team',r.team_name)
+join nrl._codes o
+  on (o.domain,o.name)=('team',r.opponent_name)
 where r.year between 2012 and 2026
 );
 
@@ -64,7 +71,7 @@ offensive=o.offensive,
 defensive=o.defensive,
 strength=o.strength
 from nrl._schedule_factors o
-where (r.opponent_id)=(o.team_id);
+where (r.opponent_id)=(o.team_code);
 
 -- field
 
@@ -74,7 +81,7 @@ from nrl._factors f
 where (f.parameter,f.level)=('field',r.field_id);
 
 create temporary table rs (
-         team_id		text,
+         team_id		integer,
          offensive              float,
          defensive              float,
          strength               float,
@@ -106,6 +113,6 @@ set
   schedule_defensive_all=rs.defensive_all
 from rs
 where
-  (_schedule_factors.team_id)=(rs.team_id);
+  (_schedule_factors.team_code)=(rs.team_id);
 
 commit;
@@ -0,0 +1,388 @@
+# -----------------------------------------------------------------------------
+# Monte Carlo Season Simulator (League and Union Ladders)
+# -----------------------------------------------------------------------------
+# Plays the rest of the season many times from the fitted model and reports
+# each team's ladder chances. The fixtures are the season's numbered rounds
+# of <schema>.games (finals excluded; nrl, super_rugby, premiership, pro14)
+# or, where the games carry no rounds, all of the season's games of
+# club.games (club, one --competition at a time, and currie_cup, whose
+# loader tags its games 'currie'); played games count as they stand. Each remaining game's scores are drawn as the
+# model would generate them:
+#
+#   poisson       Poisson(mu e^g), g ~ N(0, sd_game^2) shared by both sides
+#   nbinom/zinb   the same with a Gamma(alpha) rate per score (and a zero
+#                 with probability pz)
+#   negmultinom   Poisson(mu f), f ~ Gamma(alpha, alpha) shared by both sides
+#
+# with mu from the league's model artifact (artifact.py; a team the model
+# has not seen is rated average, and a joint fit adds the competition's
+# effect) or, with --from-db, from <schema>._basic_factors. A fit without
+# an sd row for game_id (lmer.R writes none) is simulated with sd_game = 0
+# and a warning: without the shared game effect the margins are too
+# narrow, so prefer the artifact of an lmer.py fit. The ladder follows the
+# league's LADDER_RULES:
+#
+#   nrl           2 points a win, 1 a draw, 2 a bye (a numbered round
+#                 without a game for the team)
+#   union         4 a win, 2 a draw; a losing bonus point within 7 and a
+#                 try bonus point for 4 or more tries (premiership, urc,
+#                 super_rugby, currie_cup); top14 and prod2 give the losing
+#                 bonus within 5 and the try bonus to a winner with 3 more
+#                 tries than the loser
+#
+# ranked on points and then points differential, remaining ties at random.
+# The games have no try counts, so tries are approximated from the score:
+# Binomial(score // TRY_POINTS, TRY_SHARE), about one try per 7.5 points as
+# in the Premiership and URC. The games tables hold no tries or bonus
+# points either, so under try-bonus rules
+#
+#   points_excl_try_bonus   the current points without any try bonus
+#   approx_try_bonus        the try bonuses of the played games from tries
+#                           drawn once per run from their scores (seed
+#                           PLAYED_TRIES_SEED), the same in every simulated
+#                           season and included in e_points
+#
+# label the approximation in the table, CSV and log; the remaining games'
+# tries are drawn with their simulated scores.
+#
+# Seasons are simulated in chunks of CHUNK_SEASONS in a process pool, each
+# chunk with its own RNG stream spawned from --seed (so the result does not
+# depend on the worker count), and vectorized within a chunk: a (seasons,
+# games) array of scores becomes ladder points with two matrix products.
+# Per team the output has the current ladder and
+#
+#   e_points, e_position, p_top<finals>, p_top<top>, p_<first>
+#
+# (p_top8, p_top4 and p_minor_premiership for the NRL) in
+# <schema>._ladder_probabilities[_<competition>] and
+# <league>/sos/ladder_probabilities[_<competition>].csv.
+#
+#   python sos/season.py --league nrl --seasons 100000
+#   python ../nrl/sos/season.py --league club --competition top14
+#   python ../nrl/sos/season.py --league super_rugby --from-db
+# -----------------------------------------------------------------------------
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import lmer
+from artifact import artifact_path, load_artifact
+from leagues import LEAGUES, REPO_ROOT
+from matchups import model_from_db
+from pool import make_pool, worker_state
+from writer import copy_replace
+
+OUTPUT_LOG_FILE = os.path.join(lmer.DIAGNOSTICS_DIR, "season.log")
+NRL_RULES = {'win': 2, 'draw': 1, 'loss': 0, 'bye': 2, 'finals': 8, 'top': 4, 'first': 'minor_premiership'}
+_UNION = {'win': 4, 'draw': 2, 'loss': 0, 'bye': 0, 'losing_bonus': 7, 'try_bonus': 4, 'first': 'first'}
+_FRENCH = dict(_UNION, losing_bonus=5, try_bonus=None, try_margin=3)
+LADDER_RULES = {
+    'nrl': NRL_RULES,
+    'premiership': dict(_UNION, finals=4, top=2),
+    'urc': dict(_UNION, finals=8, top=4),
+    'super_rugby': dict(_UNION, finals=6, top=2),
+    'currie_cup': dict(_UNION, finals=4, top=2),
+    'top14': dict(_FRENCH, finals=6, top=2),
+    'prod2': dict(_FRENCH, finals=6, top=2),
+}
+# Rules by league, then by club.games competition; other leagues play NRL_RULES
+LEAGUE_RULES = {'super_rugby': 'super_rugby', 'premiership': 'premiership', 'pro14': 'urc', 'currie_cup': 'currie_cup'}
+COMPETITION_RULES = {'premiership': 'premiership', 'urc': 'urc', 'pro14': 'urc', 'rainbow': 'urc', 'top14': 'top14',
+                     'prod2': 'prod2'}
+# Leagues whose games have a season column but no rounds, with the
+# competition tag their loader gives them in the shared club.games (club:
+# --competition)
+SEASON_TABLES = {'club': None, 'currie_cup': 'currie'}
+TRY_POINTS = 5
+TRY_SHARE = 0.65
+# Fixed, so the approximate try bonuses of the played games are the same on every run
+PLAYED_TRIES_SEED = 0
+CHUNK_SEASONS = 10_000
+
+
+def fetch_fixtures(engine, league_name, season=None, competition=None):
+    """The season's games (default: the latest season), scores NaN when unplayed; round NaN without rounds."""
+    league = LEAGUES[league_name]
+    schema = league['schema']
+    if league_name in SEASON_TABLES:
+        rounds, year, where = "NULL::integer", "season", "true"
+        competition = competition or SEASON_TABLES[league_name]
+    else:
+        rounds, year, where = "round_number::integer", "extract(year from date)", "round_number ~ '^[0-9]+$'"
+    if competition:
+        where += f" AND competition = '{competition}'"
+    season_filter = f"= {int(season)}" if season else f"= (SELECT max({year}) FROM {schema}.games WHERE {where})"
+    query = f"""
+    SELECT {rounds} AS round, date::date AS game_date, home_team AS home, away_team AS away,
+           home_score, away_score
+    FROM {schema}.games
+    WHERE {year} {season_filter}
+      AND {where}
+    ORDER BY date, game_id
+    """
+    fixtures = pd.read_sql_query(query, engine)
+    logging.info(f"Fetched {len(fixtures)} fixtures, {int(fixtures['home_score'].notna().sum())} played.")
+    return fixtures
+
+
+def team_ratings(model, teams):
+    """(offense, defense) arrays for teams; teams the model lacks get 0 (average)."""
+    offense, defense = np.zeros(len(teams)), np.zeros(len(teams))
+    missing = []
+    for k, team in enumerate(teams):
+        try:
+            i = model.index([team])[0]
+        except KeyError:
+            missing.append(team)
+            continue
+        offense[k], defense[k] = model.offense[i], model.defense[i]
+    if missing:
+        logging.warning(f"No rating for {missing}; simulated as average teams.")
+    return offense, defense
+
+
+def ladder_rules(league_name, competition=None):
+    """The LADDER_RULES of a league (club: of the competition)."""
+    if competition:
+        if competition not in COMPETITION_RULES:
+            raise ValueError(f"No ladder rules for competition '{competition}' (see COMPETITION_RULES).")
+        return LADDER_RULES[COMPETITION_RULES[competition]]
+    return LADDER_RULES[LEAGUE_RULES.get(league_name, 'nrl')]
+
+
+def match_points(home, away, rules, home_tries=None, away_tries=None):
+    """(home, away) ladder points of results, with the bonus points of rules (try bonuses given tries)."""
+    home_points = np.select([home > away, home == away], [rules['win'], rules['draw']], rules['loss'])
+    away_points = np.select([away > home, home == away], [rules['win'], rules['draw']], rules['loss'])
+    if rules.get('losing_bonus'):
+        close = np.abs(home - away) <= rules['losing_bonus']
+        home_points = home_points + ((home < away) & close)
+        away_points = away_points + ((away < home) & close)
+    if home_tries is not None and rules.get('try_bonus'):
+        home_points = home_points + (home_tries >= rules['try_bonus'])
+        away_points = away_points + (away_tries >= rules['try_bonus'])
+    if home_tries is not None and rules.get('try_margin'):
+        home_points = home_points + ((home > away) & (home_tries - away_tries >= rules['try_margin']))
+        away_points = away_points + ((away > home) & (away_tries - home_tries >= rules['try_margin']))
+    return home_points, away_points
+
+
+def draw_tries(rng, scores):
+    """Approximate try counts of scores: Binomial(score // TRY_POINTS, TRY_SHARE)."""
+    return rng.binomial(scores // TRY_POINTS, TRY_SHARE)
+
+
+def prepare_season(model, fixtures, rules=NRL_RULES, competition=None):
+    """Everything a worker needs: teams, current ladder, the played games' points and the remaining games' log means."""
+    teams = np.unique(np.concatenate([fixtures['home'].to_numpy(str), fixtures['away'].to_numpy(str)]))
+    home = np.searchsorted(teams, fixtures['home'].to_numpy(str))
+    away = np.searchsorted(teams, fixtures['away'].to_numpy(str))
+    played = fixtures['home_score'].notna().to_numpy() & fixtures['away_score'].notna().to_numpy()
+    n = len(teams)
+
+    # Played games
+    hs = fixtures['home_score'].to_numpy(np.float64)[played].astype(np.int64)
+    aw = fixtures['away_score'].to_numpy(np.float64)[played].astype(np.int64)
+    h, a = home[played], away[played]
+    home_points, away_points = match_points(hs, aw, rules)
+    points = np.bincount(h, weights=home_points, minlength=n) + np.bincount(a, weights=away_points, minlength=n)
+    diff = np.bincount(h, weights=hs - aw, minlength=n) - np.bincount(a, weights=hs - aw, minlength=n)
+    # The sources have no try counts: approximate the played games' try bonuses once
+    tries = bool(rules.get('try_bonus') or rules.get('try_margin'))
+    try_bonus = np.zeros(n)
+    if tries:
+        rng = np.random.default_rng(PLAYED_TRIES_SEED)
+        home_tries, away_tries = draw_tries(rng, hs), draw_tries(rng, aw)
+        with_home, with_away = match_points(hs, aw, rules, home_tries, away_tries)
+        try_bonus = (np.bincount(h, weights=with_home - home_points, minlength=n)
+                     + np.bincount(a, weights=with_away - away_points, minlength=n))
+
+    # The byes of every round (known in advance); none without rounds
+    byes = byes_so_far = np.zeros(n, dtype=np.int64)
+    rounds = fixtures['round'].to_numpy(np.float64)
+    if rules['bye'] and not np.isnan(rounds).all():
+        rounds = rounds.astype(np.int64)
+        appears = np.zeros((n, rounds.max() + 1), dtype=bool)
+        appears[home, rounds] = appears[away, rounds] = True
+        in_season = np.isin(np.arange(rounds.max() + 1), rounds)
+        byes = (~appears[:, in_season]).sum(axis=1)
+        # Byes of the rounds already completed count towards the current ladder
+        complete = np.isin(np.arange(rounds.max() + 1), rounds[played]) & \
+            ~np.isin(np.arange(rounds.max() + 1), rounds[~played])
+        byes_so_far = (~appears[:, complete]).sum(axis=1)
+
+    offense, defense = team_ratings(model, teams)
+    sd_game = float(model.sd_game)
+    if np.isnan(sd_game) and str(model.family) != 'negmultinom':
+        logging.warning("The model has no game_id sd (an lmer.R fit?); simulating without the shared game "
+                        "effect, which understates the spread of the margins. Refit with lmer.py or use its artifact.")
+    field = dict(zip(model.field_levels, model.field))
+    level = model.intercept + model.competition_effect(competition)
+    remaining_home, remaining_away = home[~played], away[~played]
+    log_mu_home = level + field.get('offense_home', 0.0) + offense[remaining_home] + defense[remaining_away]
+    log_mu_away = level + field.get('defense_home', 0.0) + offense[remaining_away] + defense[remaining_home]
+
+    current = pd.DataFrame({
+        'team': teams,
+        'played': np.bincount(h, minlength=n) + np.bincount(a, minlength=n),
+        # Without try counts the current points lack the try bonuses
+        'points_excl_try_bonus' if tries else 'points': points + rules['bye'] * byes_so_far,
+        'differential': diff,
+    })
+    if tries:
+        current['approx_try_bonus'] = try_bonus
+        logging.info(f"Try bonuses of the {len(hs)} played games approximated from their scores "
+                     f"(seed {PLAYED_TRIES_SEED}): {int(try_bonus.sum())} in all (approx_try_bonus).")
+    one_hot = np.eye(n)
+    return {
+        'teams': teams,
+        'rules': rules,
+        'current': current,
+        'base_points': rules['bye'] * byes + points + try_bonus,
+        'base_diff': diff,
+        'tries': tries,
+        'home_teams': one_hot[remaining_home],
+        'away_teams': one_hot[remaining_away],
+        'log_mu_home': log_mu_home,
+        'log_mu_away': log_mu_away,
+        'family': str(model.family),
+        'alpha': float(model.alpha),
+        'pz': float(model.pz),
+        'sd_game': float(np.nan_to_num(sd_game)),
+    }
+
+
+def draw_scores(rng, season, n):
+    """(n, games) home and away scores of the remaining games."""
+    shape = (n, len(season['log_mu_home']))
+    mu_home = np.broadcast_to(np.exp(season['log_mu_home']), shape)
+    mu_away = np.broadcast_to(np.exp(season['log_mu_away']), shape)
+    alpha = season['alpha']
+    if season['family'] == 'negmultinom':
+        frailty = rng.gamma(alpha, 1.0 / alpha, shape)
+        return rng.poisson(mu_home * frailty), rng.poisson(mu_away * frailty)
+    if season['sd_game'] > 0:
+        game = np.exp(rng.normal(0.0, season['sd_game'], shape))
+        mu_home, mu_away = mu_home * game, mu_away * game
+    if np.isfinite(alpha):
+        mu_home = rng.gamma(alpha, mu_home / alpha)
+        mu_away = rng.gamma(alpha, mu_away / alpha)
+    home, away = rng.poisson(mu_home), rng.poisson(mu_away)
+    if season['pz'] > 0:
+        home[rng.random(shape) < season['pz']] = 0
+        away[rng.random(shape) < season['pz']] = 0
+    return home, away
+
+
+def ladder_positions(rng, points, diff):
+    """(n, teams) 0-based ladder positions: points, then differential, then at random."""
+    key = points * 1e6 + diff + rng.random(points.shape)
+    order = np.argsort(-key, axis=1)
+    positions = np.empty_like(order)
+    np.put_along_axis(positions, order, np.arange(points.shape[1])[None, :], axis=1)
+    return positions
+
+
+def simulate_chunk(season, n, seed):
+    """(position counts (teams, teams), summed points) of n simulated seasons."""
+    rng = np.random.default_rng(seed)
+    rules = season['rules']
+    home, away = draw_scores(rng, season, n)
+    if season['tries']:
+        home_points, away_points = match_points(home, away, rules, draw_tries(rng, home), draw_tries(rng, away))
+    else:
+        home_points, away_points = match_points(home, away, rules)
+    points = season['base_points'] + home_points @ season['home_teams'] + away_points @ season['away_teams']
+    diff = season['base_diff'] + (home - away) @ (season['home_teams'] - season['away_teams'])
+    positions = ladder_positions(rng, points, diff)
+    n_teams = points.shape[1]
+    counts = np.bincount((np.arange(n_teams)[None, :] * n_teams + positions).ravel(), minlength=n_teams * n_teams)
+    return counts.reshape(n_teams, n_teams), points.sum(axis=0)
+
+
+def _simulate(task):
+    n, seed = task
+    return simulate_chunk(worker_state()['season'], n, seed)
+
+
+def simulate_season(season, seasons=100_000, workers=None, seed=None):
+    """Ladder probabilities per team from `seasons` simulated seasons."""
+    if seasons < 1:
+        raise ValueError(f"Need at least one season to simulate (got {seasons}).")
+    sizes = [CHUNK_SEASONS] * (seasons // CHUNK_SEASONS) + ([seasons % CHUNK_SEASONS] if seasons % CHUNK_SEASONS else [])
+    tasks = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    logging.info(f"Simulating {seasons} seasons ({len(season['log_mu_home'])} games left) in {len(tasks)} chunk(s) "
+                 f"on {workers} worker(s)...")
+    with make_pool(workers, season=season) as pool:
+        parts = list(pool.map(_simulate, tasks))
+
+    counts = sum(part[0] for part in parts) / seasons
+    rules = season['rules']
+    result = season['current'].copy()
+    result['e_points'] = sum(part[1] for part in parts) / seasons
+    result['e_position'] = counts @ np.arange(1, len(result) + 1)
+    result[f"p_top{rules['finals']}"] = counts[:, :rules['finals']].sum(axis=1)
+    result[f"p_top{rules['top']}"] = counts[:, :rules['top']].sum(axis=1)
+    result[f"p_{rules['first']}"] = counts[:, 0]
+    result['seasons'] = seasons
+    return result.sort_values('e_position').reset_index(drop=True)
+
+
+def run(league_name, seasons=100_000, workers=None, seed=None, season=None, competition=None, zinb=False,
+        from_db=False):
+    """Fetch the fixtures, simulate and write the ladder probabilities; returns the result frame."""
+    league = LEAGUES[league_name]
+    rules = ladder_rules(league_name, competition)
+    started = time.perf_counter()
+    logging.info(f"--- Starting season simulation for '{league_name}'"
+                 f"{f' ({competition})' if competition else ''} ({datetime.now()}) ---")
+    if from_db:
+        model = model_from_db(league_name, zinb)
+    else:
+        model = load_artifact(artifact_path(REPO_ROOT, league, league_name, "_zinb" if zinb else ""))
+    name = f"ladder_probabilities_{competition}" if competition else "ladder_probabilities"
+    engine = lmer.connect()
+    try:
+        fixtures = fetch_fixtures(engine, league_name, season, competition)
+        if fixtures.empty:
+            raise SystemExit("No fixtures found.")
+        result = simulate_season(prepare_season(model, fixtures, rules, competition), seasons, workers, seed)
+        copy_replace(engine, result, league['schema'], f"_{name}")
+    finally:
+        engine.dispose()
+    result.round(4).to_csv(os.path.join(REPO_ROOT, league['directory'], "sos", f"{name}.csv"), index=False)
+    logging.info("Ladder probabilities:\n" + result.round(3).to_string(index=False))
+    logging.info(f"--- Season simulation finished in {time.perf_counter() - started:.1f}s ({datetime.now()}) ---")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo ladder and finals probabilities for the rest of the season.")
+    parser.add_argument("--league", default=lmer.DB_SCHEMA, choices=sorted(LEAGUES))
+    parser.add_argument("--seasons", type=int, default=100_000)
+    parser.add_argument("--season", type=int, default=None, help="season to simulate (default: the latest)")
+    parser.add_argument("--competition", default=None, choices=sorted(COMPETITION_RULES),
+                        help="club.games competition to simulate (required for club)")
+    parser.add_argument("--zinb", action="store_true", help="use the ZINB fit (<league>_zinb artifact / _zinb_basic_factors)")
+    parser.add_argument("--from-db", action="store_true", help="read <schema>._basic_factors instead of the artifact")
+    parser.add_argument("--workers", type=int, default=None, help="pool size (default: #cores)")
+    parser.add_argument("--seed", type=int, default=None, help="RNG seed (default: fresh entropy)")
+    args = parser.parse_args(argv)
+
+    if args.seasons < 1:
+        parser.error("--seasons must be at least 1")
+    if bool(args.competition) != bool(LEAGUES[args.league].get('competition')):
+        parser.error("--competition is required for (and only for) leagues with competitions (club)")
+    lmer.setup_logging(OUTPUT_LOG_FILE)
+    run(args.league, args.seasons, args.workers, args.seed, args.season, args.competition, args.zinb, args.from_db)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# -----------------------------------------------------------------------------
+# Model Family Selection (Poisson, NB, ZINB)
+# -----------------------------------------------------------------------------
+# Fits the candidate families of glmm.py on one fetch of a league's data
+# (the lmer.py window and weights) in a process pool, two fits each:
+#
+#   full      all rows; gives the AIC (on the weighted Laplace deviance)
+#   holdout   the last HOLDOUT_FRACTION of the rounds (backtest.py's
+#             rounds) at weight 0; gives the held-out log loss
+#
+# The held-out log loss is -log p(home score, away score) per game, with
+# the game effect integrated out by Gauss-Hermite quadrature (the two
+# scores share it) and the team effects at their estimates. The family
+# with the lowest --criterion wins (near-ties go to the first family
+# listed, so put the simplest first). The choice is only recorded:
+# lmer.py's Poisson fit stays in _parameter_levels/_basic_factors, which
+# predictions.sql, skellam.py and online.py read as Poisson. Every
+# candidate's scores go to <schema>._model_family:
+#
+#   family, formula, aic, log_lik, log_loss, holdout_games, evaluations,
+#   criterion, selected, selected_at, data_hash
+#
+# data_hash is fitcache.frame_hash of the modeling rows with the families
+# and criterion; a run whose hash matches the stored one ends before the
+# fits (--no-cache compares again).
+#
+#   python sos/select_family.py --league nrl
+#   python sos/select_family.py --league club --families poisson zinb --criterion aic
+# -----------------------------------------------------------------------------
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.special import logsumexp
+
+import lmer
+from backtest import assign_rounds, predict_rows
+from codes import CodeBook, recode
+from fitcache import frame_hash
+from glmm import FAMILIES, SparseGlmer
+from leagues import LEAGUES, REPO_ROOT
+from pool import make_pool, worker_state
+from profiling import PROFILE_FILE, StageProfiler
+from writer import copy_replace
+
+OUTPUT_LOG_FILE = os.path.join(lmer.DIAGNOSTICS_DIR, "select_family.log")
+CANDIDATES = ['poisson', 'nbinom', 'zinb']
+CRITERIA = ['log_loss', 'aic']
+# Share of the rounds (at the end of the window) held out for the log loss
+HOLDOUT_FRACTION = 0.2
+QUADRATURE_NODES = 20
+# Scores within this of the best count as a tie, won by the earliest family listed
+TOLERANCE = {'log_loss': 1e-3, 'aic': 0.0}
+# negmultinom integrates the game effect itself
+FORMULAS = {'negmultinom': lmer.COLLAPSED_FORMULA}
+SCORE_COLUMNS = ['family', 'formula', 'aic', 'log_lik', 'log_loss', 'holdout_games', 'evaluations']
+
+
+def family_formula(family):
+    return FORMULAS.get(family, lmer.MODEL_FORMULA)
+
+
+def holdout_rows(frame, fraction=HOLDOUT_FRACTION):
+    """Boolean mask of the rows in the last `fraction` of the rounds (at least one round)."""
+    rounds = assign_rounds(frame['game_date'])
+    n_rounds = rounds.max() + 1
+    if n_rounds < 2:
+        raise ValueError("Need at least two rounds to hold one out.")
+    return rounds >= n_rounds - max(1, int(round(fraction * n_rounds)))
+
+
+def holdout_log_loss(model, rows):
+    """(mean -log p(game scores), games) over the games of rows, game effect integrated out."""
+    names = list(model.ranef_names)
+    sd = float(model.theta[names.index('game_id')]) if 'game_id' in names else 0.0
+    if sd > 0:
+        nodes, weights = np.polynomial.hermite_e.hermegauss(QUADRATURE_NODES)
+        log_weights = np.log(weights / np.sqrt(2.0 * np.pi))
+    else:
+        nodes, log_weights = np.zeros(1), np.zeros(1)
+
+    eta = predict_rows(model, np.arange(len(model.y)))
+    games = np.unique(model.data['game_id'].cat.codes.to_numpy()[rows], return_inverse=True)[1]
+    # Log-likelihood of each game's scores at each node; loglik over all rows (negmultinom groups them)
+    ll = np.array([np.bincount(games, weights=model._family.loglik(model.y, eta + sd * z, model._extra_working)[rows])
+                   for z in nodes])
+    return -logsumexp(ll + log_weights[:, None], axis=0).mean(), int(games.max() + 1)
+
+
+def _fit(task):
+    """Fit one (family, kind) task; returns its scores (full: AIC and logLik; holdout: log loss)."""
+    family, kind = task
+    state = worker_state()
+    frame, league, holdout = state['frame'], state['league'], state['holdout']
+    reference = {'field': league['field_reference']} if league['field_reference'] else None
+    model = SparseGlmer(family_formula(family), data=frame, family=family, reference=reference)
+    started = time.perf_counter()
+    if kind == 'full':
+        model.fit(weights='w')
+        logging.info(f"{family}: full fit in {time.perf_counter() - started:.1f}s, AIC {model.AIC:.2f}")
+        # Scores only: a fitted model (frame, Z, factor) is too large to send back
+        return {'aic': model.AIC, 'log_lik': model.logLike, 'evaluations': model.n_evals}
+    w = np.where(holdout, 0.0, frame['w'].to_numpy(np.float64))
+    # Every fixed-effect column needs training rows (e.g. neutral games only at the end)
+    if not np.all((model.X[w > 0] != 0).any(axis=0)):
+        logging.warning(f"{family}: a fixed effect has no rows before the holdout; no log loss.")
+        return {'log_loss': np.nan, 'holdout_games': 0}
+    model.fit(weights=w)
+    log_loss, games = holdout_log_loss(model, holdout.nonzero()[0])
+    logging.info(f"{family}: holdout fit in {time.perf_counter() - started:.1f}s, log loss {log_loss:.4f} ({games} games)")
+    return {'log_loss': log_loss, 'holdout_games': games}
+
+
+def compare_families(frame, league, families=CANDIDATES, criterion='log_loss', workers=None):
+    """Fit every family concurrently; returns the scores frame."""
+    frame = frame.reset_index(drop=True)
+    holdout = holdout_rows(frame)
+    tasks = [(family, kind) for family in families for kind in ('full', 'holdout')]
+    workers = max(1, min(workers or os.cpu_count() or 1, len(tasks)))
+    logging.info(f"Fitting {', '.join(families)} on {len(frame)} rows ({holdout.sum()} held out) "
+                 f"on {workers} worker(s)...")
+    with make_pool(workers, frame=frame, league=league, holdout=holdout) as pool:
+        results = dict(zip(tasks, pool.map(_fit, tasks)))
+
+    scores = pd.DataFrame([{
+        'family': family,
+        'formula': family_formula(family),
+        **results[(family, 'full')],
+        **results[(family, 'holdout')],
+    } for family in families]).reindex(columns=SCORE_COLUMNS)
+    # Without a held-out score the comparison falls back to the AIC
+    if criterion == 'log_loss' and scores['log_loss'].isna().any():
+        logging.warning("Held-out log loss unavailable; selecting by AIC.")
+        criterion = 'aic'
+    scores['criterion'] = criterion
+    best = scores[criterion].min()
+    scores['selected'] = scores.index == (scores[criterion] <= best + TOLERANCE[criterion]).idxmax()
+    scores['selected_at'] = datetime.now().isoformat(timespec='seconds')
+    return scores
+
+
+def stored_hash(engine, schema):
+    """data_hash of the stored _model_family comparison, or None."""
+    try:
+        stored = pd.read_sql_query(f"SELECT data_hash FROM {schema}._model_family LIMIT 1", engine)
+    except Exception as e:
+        logging.info(f"No stored comparison ({e.__class__.__name__}).")
+        return None
+    return stored['data_hash'].iloc[0] if len(stored) else None
+
+
+def run(league_name, families=CANDIDATES, criterion='log_loss', workers=None, use_cache=True):
+    """Fetch, compare and record the best family for one league; returns a report dict."""
+    league = dict(LEAGUES[league_name])
+    schema = league['schema']
+    report = {'league': league_name, 'schema': schema, 'status': 'failed', 'rows': 0}
+    profiler = StageProfiler(os.path.join(REPO_ROOT, league['directory'], lmer.DIAGNOSTICS_DIR, PROFILE_FILE),
+                             league=league_name, schema=schema, engine='select_family')
+    started = time.perf_counter()
+    logging.info(f"--- Starting family selection for '{league_name}' ({datetime.now()}) ---")
+    engine = lmer.connect()
+    try:
+        with profiler.stage('fetch'):
+            sg = lmer.fetch_data(engine, league)
+        if sg.empty:
+            report['status'] = 'no data'
+            return report
+        with profiler.stage('encode'):
+            codebook = CodeBook.load(engine, schema)
+            recode(sg, codebook)
+            codebook.save(engine, schema)
+        with profiler.stage('preprocess'):
+            g_filtered = lmer.preprocess(sg)
+        report['rows'] = len(g_filtered)
+        data_hash = frame_hash(g_filtered, ' '.join(families), {'criterion': criterion})
+        if use_cache and stored_hash(engine, schema) == data_hash:
+            logging.info(f"Comparison for this data already in {schema}._model_family; skipping the fits.")
+            report['status'] = 'ok'
+            return report
+
+        with profiler.stage('fit'):
+            scores = compare_families(g_filtered, league, families, criterion, workers)
+        winner = scores.loc[scores['selected'], 'family'].iloc[0]
+        logging.info("Family comparison:\n" + scores.drop(columns='selected_at').round(4).to_string(index=False))
+        logging.info(f"Selected family: {winner} (by {scores['criterion'].iloc[0]})")
+
+        with profiler.stage('write'):
+            copy_replace(engine, scores.assign(data_hash=data_hash), schema, '_model_family')
+        report.update(status='ok', family=winner)
+    except Exception as e:
+        logging.error(f"Family selection failed: {e}")
+        import traceback
+        logging.error(traceback.format_exc())
+        report['error'] = str(e)
+    finally:
+        engine.dispose()
+        report.update(profiler.timings)
+        profiler.close()
+        report['total'] = time.perf_counter() - started
+        logging.info(f"--- Family selection finished in {report['total']:.1f}s ({datetime.now()}) ---")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit Poisson/NB/ZINB in parallel and record the best one.")
+    parser.add_argument("--league", default=lmer.DB_SCHEMA, choices=sorted(LEAGUES))
+    parser.add_argument("--families", nargs="+", choices=sorted(FAMILIES), default=CANDIDATES)
+    parser.add_argument("--criterion", choices=CRITERIA, default="log_loss",
+                        help="held-out log loss per game or AIC (default: log_loss)")
+    parser.add_argument("--workers", type=int, default=None, help="pool size (default: #cores)")
+    parser.add_argument("--no-cache", action="store_true", help="compare even if the data hash is unchanged")
+    args = parser.parse_args(argv)
+
+    lmer.setup_logging(OUTPUT_LOG_FILE)
+    report = run(args.league, args.families, args.criterion, args.workers, not args.no_cache)
+    if report['status'] != 'ok':
+        raise SystemExit(f"Family selection {report['status']}: {report.get('error', '')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# -----------------------------------------------------------------------------
+# Skellam Win/Draw/Loss Probabilities for the Prediction Files
+# -----------------------------------------------------------------------------
+# Replaces the plpython2u skellam(mu1, mu2, outcome) function of
+# world_rugby/extensions/skellam.sql, whose calls in the predict*.sql files
+# are commented out: instead of one interpreter call per fixture and
+# outcome, every fixture of a prediction CSV is done in one SciPy call.
+#
+# With independent Poisson scores of means mu1 (team/home) and mu2
+# (opponent/away), the margin is Skellam(mu1, mu2) and
+#
+#   win  = P(margin >= 1),  lose = P(margin <= -1),  draw = P(margin = 0)
+#
+# The expected scores are read from the CSV as written by the SQL:
+#
+#   predict*.csv            e_team, e_opponent       (world_rugby and the
+#                           zinb_predict*.csv of the zinb.sh scripts)
+#   predictions.csv         e_home, e_away           (the league sos/ dirs)
+#   older predict*.csv      the two e_p columns
+#
+# e_team/e_opponent are the unrounded means. The e_p columns are rounded
+# for display (numeric(4,1), in some files 5,2), and 0.05 on a mean of a
+# few points moves a probability by up to 0.016; they are only used when a
+# CSV has no unrounded columns. e_home/e_away are numeric(5,2) (error
+# below 2e-3).
+# win, lose and draw are appended (3 decimals, as the commented
+# numeric(4,3) columns); the other columns are written back unchanged.
+#
+# The zinb_predict*.csv means are ZINB expected scores (1 - pz) mu. With
+# the fit's alpha and pz (--artifact <league>_zinb, or --alpha/--pz) they
+# are turned back into mu and the outcomes come from the ZINB score
+# distributions (outcome_grid.exact_pairs), not from a Skellam.
+#
+#   python ../nrl/sos/skellam.py sos/predictions.csv
+#   python ../nrl/sos/skellam.py men/predict.csv men/predict_monthly.csv
+#   python ../nrl/sos/skellam.py --artifact models/club_zinb sos/zinb_predict.csv
+# -----------------------------------------------------------------------------
+
+import argparse
+import csv
+import logging
+import os
+
+import numpy as np
+from scipy.stats import skellam
+
+OUTCOMES = ['win', 'lose', 'draw']
+# (team, opponent) expected-score column pairs, by header name, in order of preference
+EXPECTED_COLUMNS = [('e_team', 'e_opponent'), ('e_home', 'e_away'), ('e_p', 'e_p')]
+
+
+def outcome_probabilities(mu1, mu2):
+    """(n, 3) P(win), P(lose), P(draw) of the mu1 side; one cdf call for all fixtures."""
+    mu1 = np.asarray(mu1, dtype=np.float64)
+    mu2 = np.asarray(mu2, dtype=np.float64)
+    # P(margin <= -1) and P(margin <= 0) together
+    cdf = skellam.cdf(np.array([[-1.0], [0.0]]), mu1[None, :], mu2[None, :])
+    return np.column_stack([1.0 - cdf[1], cdf[0], cdf[1] - cdf[0]])
+
+
+def expected_columns(header):
+    """Indices of the (team, opponent) expected-score columns in a CSV header."""
+    for first, second in EXPECTED_COLUMNS:
+        if first == second:
+            positions = [i for i, name in enumerate(header) if name == first]
+            if len(positions) == 2:
+                return positions[0], positions[1]
+        elif first in header and second in header:
+            return header.index(first), header.index(second)
+    raise ValueError(f"No expected-score columns {EXPECTED_COLUMNS} in header {header}.")
+
+
+def add_probabilities(path, alpha=np.inf, pz=0.0):
+    """
+    Append (or refresh) the win/lose/draw columns of a prediction CSV in
+    place; returns the row count. alpha and pz (ZINB) mean the expected
+    scores are (1 - pz) mu of ZINB scores; the default is Poisson.
+    """
+    with open(path, newline='') as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        raise ValueError(f"{path} is empty (no header).")
+    header, body = rows[0], rows[1:]
+    # A rerun replaces the previous probabilities
+    keep = [i for i, name in enumerate(header) if name not in OUTCOMES]
+    header, body = [header[i] for i in keep], [[row[i] for i in keep] for row in body]
+    team, opponent = expected_columns(header)
+
+    if body:
+        values = np.array([[row[team], row[opponent]] for row in body])
+        values = np.where(values == '', 'nan', values).astype(np.float64)
+        if np.isinf(alpha) and pz == 0:
+            p = outcome_probabilities(values[:, 0], values[:, 1])
+        else:
+            import outcome_grid
+            mu = values / (1.0 - pz)
+            p = outcome_grid.exact_pairs(mu[:, 0], mu[:, 1], alpha, pz)
+            # score_pmf has no nan guard; keep the Poisson path's blanks
+            p[~np.isfinite(mu).all(axis=1)] = np.nan
+        formatted = np.where(np.isfinite(p), np.char.mod('%.3f', p), '')
+        body = [row + list(probabilities) for row, probabilities in zip(body, formatted)]
+
+    staging = path + ".tmp"
+    with open(staging, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(header + OUTCOMES)
+        writer.writerows(body)
+    os.replace(staging, path)
+    return len(body)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append Skellam win/lose/draw probabilities to prediction CSVs.")
+    parser.add_argument("files", nargs="+", help="prediction CSVs (predictions.csv, predict*.csv)")
+    parser.add_argument("--artifact", default=None,
+                        help="ZINB model artifact (artifact.py, e.g. models/club_zinb) supplying alpha and pz")
+    parser.add_argument("--alpha", type=float, default=np.inf, help="NB size (default: inf, Poisson)")
+    parser.add_argument("--pz", type=float, default=0.0, help="zero-inflation probability")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    alpha, pz = args.alpha, args.pz
+    if args.artifact:
+        from artifact import load_artifact
+        model = load_artifact(args.artifact)
+        alpha, pz = float(model.alpha), float(model.pz)
+    family = 'Skellam' if np.isinf(alpha) and pz == 0 else f"ZINB (alpha {alpha:.4g}, pz {pz:.4g})"
+    for path in args.files:
+        n = add_probabilities(path, alpha, pz)
+        logging.info(f"{path}: {family} win/lose/draw for {n} fixture(s).")
+
+
+if __name__ == "__main__":
+    main()
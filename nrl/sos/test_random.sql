@@ -1,6 +1,6 @@
-select npl.parameter,npl.type,npl.level,nbf.estimate
+select npl.parameter,npl.type,npl.level,npl.code,nbf.estimate
 from nrl._parameter_levels npl
 left outer join nrl._basic_factors nbf
-  on (nbf.factor,nbf.level,nbf.type)=(npl.parameter,npl.level,npl.type)
+  on (nbf.factor,nbf.code,nbf.type)=(npl.parameter,npl.code,npl.type)
 where npl.type='random'
 order by parameter,level;
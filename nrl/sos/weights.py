@@ -0,0 +1,75 @@
+# -----------------------------------------------------------------------------
+# Recency Weights from game_date
+# -----------------------------------------------------------------------------
+# The fitters take per-row weights that act like frequency weights (a row
+# of weight 2 counts as two games), so recency is expressed as a weight per
+# game computed at fetch time instead of a `(year - 2024) AS w` column in
+# each league's SQL. A league's kernel is its 'weighting' spec in
+# leagues.py, overridable with lmer.py --weighting:
+#
+#   season                w = year - reference_year (the old SQL column);
+#                         lmer.py's nrl weighting and the zinb.R one (rows
+#                         replicated w times)
+#   season_squared        w = (year - reference_year)^2, as every lmer.R
+#                         passes it (its rows used to be replicated w times
+#                         and also weighted by w); the default for the
+#                         lmer.R leagues in leagues.py
+#   exponential:<days>    w = 0.5 ** (age / days); a game played on the as-of
+#                         date has weight 1, one half-life earlier 0.5
+#   <module>.<function>[:<params>]
+#                         custom kernel, called as f(frame, league, as_of, *params)
+#
+# Ages are measured from the latest game_date in the data (not today), so
+# the weights, and the fit cache key, only change when the data does.
+# -----------------------------------------------------------------------------
+
+import importlib
+
+import numpy as np
+
+
+def season(frame, league, as_of):
+    """The step weights of the SQL: one step per season since reference_year."""
+    return (frame['year'].to_numpy(np.float64) - league['reference_year'])
+
+
+def season_squared(frame, league, as_of):
+    """The per-row weight of lmer.R: the season step squared."""
+    return season(frame, league, as_of) ** 2
+
+
+def exponential(frame, league, as_of, half_life_days=365.0):
+    """Exponential decay in days with the given half-life."""
+    age = (as_of - frame['game_date'].to_numpy('datetime64[D]')).astype(np.float64)
+    return np.power(0.5, np.maximum(age, 0.0) / float(half_life_days))
+
+
+KERNELS = {
+    'season': season,
+    'season_squared': season_squared,
+    'exponential': exponential,
+}
+
+
+def parse_spec(spec):
+    """'exponential:365' -> (kernel function, [365.0])."""
+    name, _, params = spec.partition(':')
+    if name in KERNELS:
+        kernel = KERNELS[name]
+    elif '.' in name:
+        module, _, function = name.rpartition('.')
+        kernel = getattr(importlib.import_module(module), function)
+    else:
+        raise ValueError(f"Unknown weighting '{name}'. Known: {sorted(KERNELS)} or <module>.<function>")
+    return kernel, [float(p) for p in params.split(',') if p]
+
+
+def compute_weights(frame, league, spec=None):
+    """Per-row weights for frame (needs year and game_date) under a weighting spec."""
+    spec = spec or league.get('weighting') or 'season'
+    kernel, params = parse_spec(spec)
+    as_of = frame['game_date'].to_numpy('datetime64[D]').max() if len(frame) else None
+    w = np.asarray(kernel(frame, league, as_of, *params), dtype=np.float64)
+    if w.shape != (len(frame),):
+        raise ValueError(f"Weighting '{spec}' returned shape {w.shape} for {len(frame)} rows.")
+    return w
@@ -0,0 +1,68 @@
+# -----------------------------------------------------------------------------
+# Bulk COPY Writer for Model Output Tables
+# -----------------------------------------------------------------------------
+# DataFrame.to_sql(if_exists='replace') issues row-wise INSERTs into a freshly
+# created table, which sos.sh then had to VACUUM FULL. copy_replace() instead
+# streams the frame through COPY FROM STDIN into a staging table, analyzes it
+# and swaps it in under the target name in one transaction, so readers see
+# either the old table or the complete new one and no VACUUM is needed.
+# The staging name is unique per call, so concurrent writers of the same
+# table do not drop each other's staging table.
+# -----------------------------------------------------------------------------
+
+import csv
+import io
+import logging
+import uuid
+
+import pandas as pd
+
+# Rows per COPY buffer; keeps memory flat for the game_id-sized tables
+CHUNK_ROWS = 100_000
+
+
+def _pg_type(dtype):
+    """PostgreSQL column type for a pandas dtype (same choices as to_sql)."""
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "bigint"
+    if pd.api.types.is_float_dtype(dtype):
+        return "double precision"
+    return "text"
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def copy_replace(engine, frame, schema, table):
+    """Atomically replace schema.table with the contents of frame via COPY."""
+    target = f"{_quote(schema)}.{_quote(table)}"
+    staging_name = f"{table}__staging_{uuid.uuid4().hex[:12]}"
+    staging = f"{_quote(schema)}.{_quote(staging_name)}"
+    columns = ", ".join(_quote(str(c)) for c in frame.columns)
+    ddl = ",\n".join(f"{_quote(str(c))} {_pg_type(frame[c].dtype)}" for c in frame.columns)
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute(f"DROP TABLE IF EXISTS {staging}")
+        cur.execute(f"CREATE TABLE {staging} (\n{ddl}\n)")
+        for start in range(0, len(frame), CHUNK_ROWS):
+            buffer = io.StringIO()
+            frame.iloc[start:start + CHUNK_ROWS].to_csv(
+                buffer, index=False, header=False, na_rep="", quoting=csv.QUOTE_MINIMAL)
+            buffer.seek(0)
+            cur.copy_expert(f"COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cur.execute(f"ANALYZE {staging}")
+        # Swap: both statements commit together
+        cur.execute(f"DROP TABLE IF EXISTS {target}")
+        cur.execute(f"ALTER TABLE {staging} RENAME TO {_quote(table)}")
+        raw.commit()
+        logging.info(f"Copied {len(frame)} rows into {schema}.{table} (staging swap).")
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
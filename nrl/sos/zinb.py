@@ -0,0 +1,147 @@
+# -----------------------------------------------------------------------------
+# Zero-Inflated Negative Binomial GLMM (Python Replacement for sos/zinb.R)
+# -----------------------------------------------------------------------------
+# Fits
+#
+#     gs ~ field + (1|team) + (1|opponent) + (1|game_id)
+#
+# with a NB2 response and a constant zero-inflation probability, the model
+# glmmADMB fits in each league's sos/zinb.R, using the sparse Laplace fitter
+# in glmm.py (family='zinb'). Writes the same tables:
+#
+#   <schema>._zinb_parameter_levels   field (fixed), offense/defense (random)
+#   <schema>._zinb_basic_factors      fixed and random estimates plus the
+#                                     'structural' pz and alpha rows read by
+#                                     zinb_predict.sql
+#
+# zinb.R replicated every row w times; here w is passed as a weight, which
+# gives the same likelihood without the copies. The previous fit in
+# _zinb_basic_factors warm-starts the next one (--cold-start to disable).
+# The fit is also saved as <league>/models/<league>_zinb/ (artifact.py).
+#
+#   python ../nrl/sos/zinb.py --league club
+# -----------------------------------------------------------------------------
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import lmer
+from artifact import artifact_path, build_artifact, save_artifact
+from glmm import SparseGlmer, start_from_factors
+from leagues import REPO_ROOT, ZINB_LEAGUES, zinb_league
+from profiling import PROFILE_FILE, StageProfiler
+
+OUTPUT_LOG_FILE = os.path.join(lmer.DIAGNOSTICS_DIR, "zinb_native.log")
+
+# zinb.R lists offense/defense levels only; game_id effects are still written
+ZINB_PARAMETER_TYPES = {'field': 'fixed', 'team': 'random', 'opponent': 'random'}
+
+
+def fit_zinb(g_filtered, engine, league, cold_start=False):
+    """Fit the ZINB GLMM, warm-started from <schema>._zinb_basic_factors when present."""
+    schema = league['schema']
+    reference = {'field': league['field_reference']} if league['field_reference'] else None
+    model = SparseGlmer(lmer.MODEL_FORMULA, data=g_filtered, family='zinb', reference=reference)
+
+    start = None
+    if not cold_start:
+        try:
+            previous = pd.read_sql_query(
+                f"SELECT factor, type, level, estimate FROM {schema}._zinb_basic_factors", engine)
+            start = start_from_factors(previous, {'offense': 'team', 'defense': 'opponent'})
+            logging.info(f"Warm start from {schema}._zinb_basic_factors: {start['extra']}")
+        except Exception as e:
+            logging.info(f"No previous ZINB fit available for a warm start ({e.__class__.__name__}); fitting from scratch.")
+
+    logging.info(f"Fitting ZINB GLMM: {lmer.MODEL_FORMULA}")
+    model.fit(weights='w', verbose=True, summarize=False, start=start)
+    logging.info(f"ZINB fit used {model.n_evals} deviance evaluations: "
+                 f"pz {model.pz:.5f}, alpha {model.alpha:.4f}")
+    return model
+
+
+def extract_zinb_results(model):
+    """_zinb_basic_factors frame: lmer.py's rows, which include the pz and alpha rows of zinb.R."""
+    return lmer.extract_results(model)
+
+
+def run(league_name, cold_start=False):
+    """Fetch, fit and write the ZINB model for one league; returns a report dict."""
+    league = zinb_league(league_name)
+    schema = league['schema']
+    report = {'league': league_name, 'schema': schema, 'status': 'failed', 'rows': 0}
+    profiler = StageProfiler(os.path.join(REPO_ROOT, league['directory'], lmer.DIAGNOSTICS_DIR, PROFILE_FILE),
+                             league=league_name, schema=schema, engine='zinb')
+    started = time.perf_counter()
+    logging.info(f"--- Starting ZINB fit for '{league_name}' ({datetime.now()}) ---")
+
+    try:
+        with profiler.stage('connect'):
+            engine = lmer.connect()
+    except Exception as e:
+        logging.error(f"Database connection failed: {e}")
+        report['error'] = f"Database connection failed - {e}"
+        report['total'] = time.perf_counter() - started
+        profiler.close()
+        return report
+
+    try:
+        with profiler.stage('fetch'):
+            sg = lmer.fetch_data(engine, league)
+        if sg.empty:
+            logging.warning("Query returned no data. Exiting.")
+            report['status'] = 'no data'
+            return report
+
+        with profiler.stage('preprocess'):
+            g_filtered = lmer.preprocess(sg)
+        report['rows'] = len(g_filtered)
+        with profiler.stage('levels'):
+            lmer.write_parameter_levels(engine, schema, g_filtered, '_zinb_parameter_levels', ZINB_PARAMETER_TYPES)
+
+        with profiler.stage('fit'):
+            model = fit_zinb(g_filtered, engine, league, cold_start)
+            lmer.log_summary(model)
+
+        with profiler.stage('write'):
+            combined = extract_zinb_results(model)
+            lmer.write_results(engine, schema, combined, '_zinb_basic_factors')
+            save_artifact(artifact_path(REPO_ROOT, league, league_name, "_zinb"),
+                          build_artifact(combined, league_name, league, 'zinb', lmer.MODEL_FORMULA,
+                                         g_filtered['field'].cat.categories))
+        report['status'] = 'ok'
+    except Exception as e:
+        logging.error(f"An unexpected error occurred: {e}")
+        import traceback
+        logging.error(traceback.format_exc())
+        report['error'] = str(e)
+    finally:
+        engine.dispose()
+        report.update(profiler.timings)
+        profiler.close()
+        report['total'] = time.perf_counter() - started
+        logging.info(f"--- ZINB fit finished in {report['total']:.1f}s ({datetime.now()}) ---")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit the ZINB GLMM and write _zinb_basic_factors/_zinb_parameter_levels.")
+    parser.add_argument("--league", required=True, choices=sorted(ZINB_LEAGUES),
+                        help="league settings from leagues.py")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="ignore the stored _zinb_basic_factors and fit from scratch")
+    args = parser.parse_args(argv)
+
+    lmer.setup_logging(OUTPUT_LOG_FILE)
+    report = run(args.league, args.cold_start)
+    if report['status'] != 'ok':
+        raise SystemExit(f"ZINB fit {report['status']}: {report.get('error', '')}")
+
+
+if __name__ == "__main__":
+    main()
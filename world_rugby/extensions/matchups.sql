@@ -1,3 +1,6 @@
+-- Superseded by nrl/sos/matchups.py, which builds every pair's expected scores
+-- and win/lose/draw (home, away and neutral) for any schema with NumPy
+
 begin;
 
 create temporary table m (
@@ -1,3 +1,6 @@
+-- Superseded by nrl/sos/skellam.py, which appends win/lose/draw to every
+-- league's prediction CSV in one vectorized pass (no plpython2u needed)
+
 
 create extension if not exists plpython2u;
 
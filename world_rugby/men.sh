@@ -25,6 +25,8 @@ cp /tmp/current_ranking.csv men/current_ranking.csv
 
 psql rugby -f men/predict_monthly.sql > men/predict_monthly.txt
 cp /tmp/predict_monthly.csv men/predict_monthly.csv
+python ../nrl/sos/skellam.py men/predict_monthly.csv
 
 psql rugby -f men/predict.sql > men/predict.txt
 cp /tmp/predict.csv men/predict.csv
+python ../nrl/sos/skellam.py men/predict.csv
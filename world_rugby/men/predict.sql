@@ -138,6 +138,30 @@ case when g.venue_country=t1.country_name then
 end
 )::numeric(5,2) as e_p,
 
+-- unrounded, for skellam.py
+(
+case when g.venue_country=t1.country_name then
+       exp(i.estimate)*sf1.offensive*o.exp_factor*sf2.defensive
+     when g.venue_country=t2.country_name then
+       exp(i.estimate)*sf1.offensive*d.exp_factor*sf2.defensive
+     when g.venue_country is null then
+       exp(i.estimate)*sf1.offensive*o.exp_factor*sf2.defensive
+     else
+       exp(i.estimate)*sf1.offensive*sf2.defensive
+end
+)::float as e_team,
+(
+case when g.venue_country=t1.country_name then
+       exp(i.estimate)*sf2.offensive*d.exp_factor*sf1.defensive
+     when g.venue_country=t2.country_name then
+       exp(i.estimate)*sf2.offensive*o.exp_factor*sf1.defensive
+     when g.venue_country is null then
+       exp(i.estimate)*sf2.offensive*d.exp_factor*sf1.defensive
+     else
+       exp(i.estimate)*sf2.offensive*sf1.defensive
+end
+)::float as e_opponent,
+
 (
 case when g.venue_country=t1.country_name then
        exp(i.estimate)*sf1.offensive*o.exp_factor*sf2.defensive
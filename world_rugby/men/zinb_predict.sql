@@ -139,7 +139,37 @@ case when g.venue_country=t1.country_name then
        exp(i.estimate)*sf2.offensive*sf1.defensive
 end
 )
-)::numeric(4,1) as e_p
+)::numeric(4,1) as e_p,
+
+-- unrounded, for skellam.py
+(
+(1-z.estimate)*
+(
+case when g.venue_country=t1.country_name then
+       exp(i.estimate)*sf1.offensive*o.exp_factor*sf2.defensive
+     when g.venue_country=t2.country_name then
+       exp(i.estimate)*sf1.offensive*d.exp_factor*sf2.defensive
+     when g.venue_country is null then
+       exp(i.estimate)*sf1.offensive*o.exp_factor*sf2.defensive
+     else
+       exp(i.estimate)*sf1.offensive*sf2.defensive
+end
+)
+)::float as e_team,
+(
+(1-z.estimate)*
+(
+case when g.venue_country=t1.country_name then
+       exp(i.estimate)*sf2.offensive*d.exp_factor*sf1.defensive
+     when g.venue_country=t2.country_name then
+       exp(i.estimate)*sf2.offensive*o.exp_factor*sf1.defensive
+     when g.venue_country is null then
+       exp(i.estimate)*sf2.offensive*d.exp_factor*sf1.defensive
+     else
+       exp(i.estimate)*sf2.offensive*sf1.defensive
+end
+)
+)::float as e_opponent
 
 --skellam(exp(i.estimate)*h.offensive*o.exp_factor*v.defensive,
 --        exp(i.estimate)*v.offensive*h.defensive*d.exp_factor,
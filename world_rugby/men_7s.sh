@@ -25,6 +25,8 @@ cp /tmp/current_ranking.csv men_7s/current_ranking.csv
 
 psql rugby -f men_7s/predict_monthly.sql > men_7s/predict_monthly.txt
 cp /tmp/predict_monthly.csv men_7s/predict_monthly.csv
+python ../nrl/sos/skellam.py men_7s/predict_monthly.csv
 
 psql rugby -f men_7s/predict.sql > men_7s/predict.txt
 cp /tmp/predict.csv men_7s/predict.csv
+python ../nrl/sos/skellam.py men_7s/predict.csv
@@ -6,13 +6,11 @@ psql rugby -f men/standardized_results.sql
 
 psql rugby -c "vacuum full verbose analyze men._results;"
 
-psql rugby -c "drop table if exists men._zinb_basic_factors;"
-psql rugby -c "drop table if exists men._zinb_parameter_levels;"
+# _zinb_basic_factors/_zinb_parameter_levels are kept: zinb.py warm-starts
+# from them and replaces them when it writes the new fit
 
-R -f men/zinb.R
-
-psql rugby -c "vacuum full verbose analyze men._zinb_parameter_levels;"
-psql rugby -c "vacuum full verbose analyze men._zinb_basic_factors;"
+#R -f men/zinb.R
+python ../nrl/sos/zinb.py --league men
 
 psql rugby -f men/zinb_normalize_factors.sql
 psql rugby -c "vacuum full verbose analyze men._zinb_factors;"
@@ -23,8 +21,11 @@ psql rugby -c "vacuum full verbose analyze men._zinb_schedule_factors;"
 psql rugby -f men/zinb_current_ranking.sql > men/zinb_current_ranking.txt
 cp /tmp/zinb_current_ranking.csv men/zinb_current_ranking.csv
 
+# ZINB outcome probabilities with the fit's alpha and pz (saved by zinb.py)
 psql rugby -f men/zinb_predict_monthly.sql > men/zinb_predict_monthly.txt
 cp /tmp/zinb_predict_monthly.csv men/zinb_predict_monthly.csv
+python ../nrl/sos/skellam.py --artifact models/men_zinb men/zinb_predict_monthly.csv
 
 psql rugby -f men/zinb_predict.sql > men/zinb_predict.txt
 cp /tmp/zinb_predict.csv men/zinb_predict.csv
+python ../nrl/sos/skellam.py --artifact models/men_zinb men/zinb_predict.csv
@@ -25,6 +25,8 @@ cp /tmp/current_ranking.csv rest/current_ranking.csv
 
 psql rugby -f rest/predict_monthly.sql > rest/predict_monthly.txt
 cp /tmp/predict_monthly.csv rest/predict_monthly.csv
+python ../nrl/sos/skellam.py rest/predict_monthly.csv
 
 psql rugby -f rest/predict.sql > rest/predict.txt
 cp /tmp/predict.csv rest/predict.csv
+python ../nrl/sos/skellam.py rest/predict.csv
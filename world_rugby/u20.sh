@@ -25,6 +25,8 @@ cp /tmp/current_ranking.csv u20/current_ranking.csv
 
 psql rugby -f u20/predict_monthly.sql > u20/predict_monthly.txt
 cp /tmp/predict_monthly.csv u20/predict_monthly.csv
+python ../nrl/sos/skellam.py u20/predict_monthly.csv
 
 psql rugby -f u20/predict.sql > u20/predict.txt
 cp /tmp/predict.csv u20/predict.csv
+python ../nrl/sos/skellam.py u20/predict.csv
@@ -25,6 +25,8 @@ cp /tmp/current_ranking.csv women/current_ranking.csv
 
 psql rugby -f women/predict_monthly.sql > women/predict_monthly.txt
 cp /tmp/predict_monthly.csv women/predict_monthly.csv
+python ../nrl/sos/skellam.py women/predict_monthly.csv
 
 psql rugby -f women/predict.sql > women/predict.txt
 cp /tmp/predict.csv women/predict.csv
+python ../nrl/sos/skellam.py women/predict.csv
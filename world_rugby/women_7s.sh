@@ -25,6 +25,8 @@ cp /tmp/current_ranking.csv women_7s/current_ranking.csv
 
 psql rugby -f women_7s/predict_monthly.sql > women_7s/predict_monthly.txt
 cp /tmp/predict_monthly.csv women_7s/predict_monthly.csv
+python ../nrl/sos/skellam.py women_7s/predict_monthly.csv
 
 psql rugby -f women_7s/predict.sql > women_7s/predict.txt
 cp /tmp/predict.csv women_7s/predict.csv
+python ../nrl/sos/skellam.py women_7s/predict.csv
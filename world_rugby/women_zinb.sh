@@ -6,13 +6,11 @@ psql rugby -f women/standardized_results.sql
 
 psql rugby -c "vacuum full verbose analyze wr.results;"
 
-psql rugby -c "drop table if exists wr._zinb_basic_factors;"
-psql rugby -c "drop table if exists wr._zinb_parameter_levels;"
+# _zinb_basic_factors/_zinb_parameter_levels are kept: zinb.py warm-starts
+# from them and replaces them when it writes the new fit
 
-R -f women/zinb.R
-
-psql rugby -c "vacuum full verbose analyze wr._zinb_parameter_levels;"
-psql rugby -c "vacuum full verbose analyze wr._zinb_basic_factors;"
+#R -f women/zinb.R
+python ../nrl/sos/zinb.py --league women
 
 psql rugby -f women/zinb_normalize_factors.sql
 psql rugby -c "vacuum full verbose analyze wr._zinb_factors;"
@@ -23,8 +21,11 @@ psql rugby -c "vacuum full verbose analyze wr._zinb_schedule_factors;"
 psql rugby -f women/zinb_current_ranking.sql > women/zinb_current_ranking.txt
 cp /tmp/zinb_current_ranking.csv women/zinb_current_ranking.csv
 
+# ZINB outcome probabilities with the fit's alpha and pz (saved by zinb.py)
 psql rugby -f women/zinb_predict_monthly.sql > women/zinb_predict_monthly.txt
 cp /tmp/zinb_predict_monthly.csv women/zinb_predict_monthly.csv
+python ../nrl/sos/skellam.py --artifact models/women_zinb women/zinb_predict_monthly.csv
 
 psql rugby -f women/zinb_predict.sql > women/zinb_predict.txt
 cp /tmp/zinb_predict.csv women/zinb_predict.csv
+python ../nrl/sos/skellam.py --artifact models/women_zinb women/zinb_predict.csv